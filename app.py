@@ -1,55 +1,216 @@
-from flask import Flask, jsonify, request, abort
-from datetime import datetime
+from flask import Flask, Response, g, jsonify, make_response, request, abort
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date, is_resource_modified
+from werkzeug.serving import WSGIRequestHandler, make_server
+from datetime import date, datetime, timezone
 from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from collections.abc import Hashable, ItemsView, Iterable, Iterator, KeysView, ValuesView
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+from itertools import chain, islice
+from operator import attrgetter, itemgetter
+from time import monotonic, perf_counter, sleep, time
+import base64
+import cProfile
+import csv
+import gc
+import gzip
+import heapq
+import io
+import json
+import os
+import pstats
+import random
+import signal
+import socket
+import sqlite3
+import threading
+import zlib
+import click
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+try:
+  import msgpack
+except ImportError:
+  msgpack = None
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
 
 
 """
 UTILS -> Some useful code
 """
+# created_at goes out already formatted, so the JSON provider never has to
+# convert a datetime row by row
+def serialize_student(student):
+    return {
+        "id": student.id,
+        "name": student.name,
+        "created_at": student.created_at_text
+    }
+
+# the ages of a whole roster from a single look at the clock
+def serialize_students_age(students):
+    students = list(students)
+    ages = clock.ages([student.birthdate_ordinal for student in students])
+
+    return [
+        {"id": student.id, "name": student.name, "age": age}
+        for student, age in zip(students, ages)
+    ]
+
 def serialize_teacher(teacher):
     return {
         "id": teacher.id,
         "name": teacher.name,
-        "created_at": teacher.created_at
+        "created_at": teacher.created_at_text
     }
 
 def serialize_course_class(course_class):
     return {
         "id": course_class.id,
         "teacher": serialize_teacher(course_class.teacher),
-        "created_at": course_class.created_at
+        "created_at": course_class.created_at_text
     }
 
+# Encodes with orjson when it's installed and falls back to the default
+# provider otherwise. The output is the same JSON either way: sorted keys and
+# dates in the HTTP date format
+class FastJSONProvider(DefaultJSONProvider):
+  OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson is not None else 0
+
+  def dumps(self, obj, **kwargs) -> str:
+    if orjson is None or kwargs:
+      return super().dumps(obj, **kwargs)
+
+    return orjson.dumps(obj, default=self.default, option=self.OPTIONS).decode()
+
+  def response(self, *args, **kwargs) -> Response:
+    if orjson is None:
+      return super().response(*args, **kwargs)
+
+    option = self.OPTIONS | orjson.OPT_APPEND_NEWLINE
+
+    if (self.compact is None and self._app.debug) or self.compact is False:
+      option |= orjson.OPT_INDENT_2
+
+    # the bytes go to the response as they are, without a round trip through str
+    data = orjson.dumps(self._prepare_response_obj(args, kwargs), default=self.default, option=option)
+
+    return self._app.response_class(data, mimetype=self.mimetype)
+
+  # compact bytes, to be spliced into a larger response
+  def encode(self, obj) -> bytes:
+    if orjson is None:
+      return super().dumps(obj, separators=(',', ':')).encode()
+
+    return orjson.dumps(obj, default=self.default, option=self.OPTIONS)
+
+# Bounded cache of the JSON fragments of entities, keyed by the id and the
+# version of the entity. A change bumps the version, so an outdated fragment
+# is never served again, it only waits to be evicted
+class FragmentCache:
+  def __init__(self, encode, max_size: int = 100_000):
+    self.__encode = encode
+    self.__max_size = max_size
+    self.__fragments: dict[tuple[int, int], bytes] = {}
+    self.__lock = threading.Lock()
+
+  @property
+  def size(self) -> int:
+    return len(self.__fragments)
+
+  def get(self, entity) -> bytes:
+    key = (entity.id, entity.version)
+    fragment = self.__fragments.get(key)
+
+    if fragment is not None:
+      return fragment
+
+    fragment = self.__encode(entity)
+
+    with self.__lock:
+      if len(self.__fragments) >= self.__max_size:
+        # dicts keep the insertion order, the first key is the oldest one
+        del self.__fragments[next(iter(self.__fragments))]
+
+      self.__fragments[key] = fragment
+
+    return fragment
+
 class HashMap[K, V]:
+  __slots__ = ('__elements',)
+
   def __init__(self):
-    self.__size = 0
     self.__elements: dict[K, V] = {}
 
   @property
   def size(self) -> int:
-    return self.__size
+    return len(self.__elements)
 
   def add(self, key: K, value: V) -> None:
     if key not in self.__elements:
       self.__elements[key] = value
 
-      self.__size += 1
-
   def remove(self, key: K) -> None:
-    if key in self.__elements:
-      self.__elements.pop(key)
-      self.__size -= 1
+    self.__elements.pop(key, None)
 
   def get(self, key: K) -> V:
-    return self.__elements[key] if key in self.__elements else None
-  
+    return self.__elements.get(key)
+
+  def get_many(self, keys: Iterable[K]) -> tuple[list[V], list[K]]:
+    found: list[V] = []
+    missing: list[K] = []
+
+    for key in keys:
+      value = self.__elements.get(key)
+
+      if value is None:
+        missing.append(key)
+      else:
+        found.append(value)
+
+    return found, missing
+
+  # views below are live and never copy, iteration follows insertion order
+  def keys(self) -> KeysView[K]:
+    return self.__elements.keys()
+
+  def values(self) -> ValuesView[V]:
+    return self.__elements.values()
+
+  def items(self) -> ItemsView[K, V]:
+    return self.__elements.items()
+
+  def slice(self, start: int, stop: int | None = None) -> Iterator[V]:
+    return islice(self.__elements.values(), start, stop)
+
   def to_list(self) -> list[V]:
-    arr: list[V] = []
+    return list(self.__elements.values())
 
-    for key in self.__elements:
-      arr.append(self.__elements[key])
+  def __len__(self) -> int:
+    return len(self.__elements)
 
-    return arr
+  def __iter__(self) -> Iterator[K]:
+    return iter(self.__elements)
+
+  def __contains__(self, key: K) -> bool:
+    return key in self.__elements
 
   def __repr__(self):
     return self.__elements.__str__()
@@ -58,466 +219,3750 @@ class HashMap[K, V]:
 class IdGenerator:
   def __init__(self):
     self.__next_id = 1
+    self.__limit = 0
+    self.__allocate = None
+    self.__block = 0
+    self.__lock = threading.Lock()
+    os.register_at_fork(after_in_child=self.__forget_block)
+
+  # ids are then taken in blocks from allocate(block), which returns the first
+  # id of a block no one else was given, e.g. from storage shared by processes
+  def use(self, allocate, block: int) -> None:
+    with self.__lock:
+      self.__allocate = allocate
+      self.__block = block
+      self.__next_id = self.__limit = 0
 
   def generate(self) -> int:
-    id = self.__next_id
+    with self.__lock:
+      if self.__allocate is not None and self.__next_id == self.__limit:
+        self.__next_id = self.__allocate(self.__block)
+        self.__limit = self.__next_id + self.__block
+
+      id = self.__next_id
 
-    self.__next_id += 1
+      self.__next_id += 1
 
     return id
 
+  # keeps ids restored from storage from being handed out again
+  def reserve(self, id: int) -> None:
+    if self.__allocate is not None:
+      return
 
-idGenerator = IdGenerator()
+    with self.__lock:
+      self.__next_id = max(self.__next_id, id + 1)
 
+  # a forked process would hand out the rest of the block of its parent
+  def __forget_block(self) -> None:
+    self.__lock = threading.Lock()
 
-"""
-MODELS -> Representation of the entities
-"""
+    if self.__allocate is not None:
+      self.__next_id = self.__limit = 0
 
 
-class Entity(ABC):
-  def __init__(self):
-    self._id = idGenerator.generate()
-    self._created_at = datetime.now()
+# The latest mutations, as write-ahead log records numbered from 1 on. At
+# least the last max_size are kept, a reader that fell further behind has
+# to start over from the listings
+class ChangeLog:
+  def __init__(self, max_size: int = 100_000):
+    self.__max_size = max_size
+    self.__records: list[list] = []
+    # sequence number of the first record kept
+    self.__first = 1
+    self.__condition = threading.Condition()
 
+  # of the latest record, 0 before the first one
   @property
-  def id(self) -> int:
-    return self._id
+  def sequence(self) -> int:
+    return self.__first + len(self.__records) - 1
 
-  @property
-  def created_at(self) -> datetime:
-    return self._created_at
+  def append(self, records: Iterable[list]) -> None:
+    with self.__condition:
+      self.__records.extend(records)
 
-class Person(ABC):
-  def __init__(self, name: str, birthdate: datetime):
-    self._name = name
-    self._birthdate = birthdate if isinstance(birthdate, datetime) else None
+      # trimmed once it doubles, appending stays O(1) amortized
+      if len(self.__records) > 2 * self.__max_size:
+        excess = len(self.__records) - self.__max_size
+        del self.__records[:excess]
+        self.__first += excess
 
-  @property
-  def name(self) -> str:
-    return self._name
+      self.__condition.notify_all()
 
-  @name.setter
-  def name(self, name: str) -> None:
-    self._name = name
-  
-  @property
-  def birthdate(self) -> datetime:
-    return self._birthdate
+  # up to limit (sequence, record) after sequence, None when some of them
+  # were already dropped
+  def since(self, sequence: int, limit: int) -> list[tuple[int, list]] | None:
+    with self.__condition:
+      start = sequence + 1 - self.__first
 
-  @birthdate.setter
-  def birthdate(self, birthdate: datetime) -> None:
-    self._birthdate = birthdate
+      if start < 0:
+        return None
 
-  @property
-  def age(self) -> int:
-    if self._birthdate is None: return
+      return [(self.__first + index, record) for index, record in enumerate(self.__records[start:start + limit], start)]
 
-    today = datetime.now()
-    return (today - self._birthdate).days // 365
+  # False when timeout seconds went by without a record after sequence
+  def wait(self, sequence: int, timeout: float) -> bool:
+    with self.__condition:
+      return self.__condition.wait_for(lambda: self.sequence > sequence, timeout)
 
-class Teacher(Entity, Person):
-  def __init__(self, name: str, birthdate: datetime):
-    Entity.__init__(self)
-    Person.__init__(self, name, birthdate)
-    self.__course_classes = HashMap[int, CourseClass]()
-  
-  @property
-  # TODO: type return
-  def course_classes(self):
-    return self.__course_classes
-  
-  @property
-  def course_classes_ammount(self) -> int:
-    return self.__course_classes.size
 
-  def add_course_class(self, course_class) -> None:
-    self.__course_classes.add(course_class.id, course_class)
+# Many readers or a single writer. Waiting writers block new readers, so a
+# steady stream of reads can't starve a write. Not reentrant
+class ReadWriteLock:
+  def __init__(self):
+    self.__condition = threading.Condition(threading.Lock())
+    self.__readers = 0
+    self.__writing = False
+    self.__waiting_writers = 0
 
-  def remove_course_class_by_id(self, course_class_id: int) -> None:
-    self.__course_classes.remove(course_class_id)
+  @contextmanager
+  def read(self):
+    with self.__condition:
+      while self.__writing or self.__waiting_writers:
+        self.__condition.wait()
 
+      self.__readers += 1
 
-class CourseClass(Entity):
-  def __init__(self, teacher: Teacher):
-    super().__init__()
-    self.__teacher = teacher
-    self.__students = HashMap[int, Student]()
+    try:
+      yield
+    finally:
+      with self.__condition:
+        self.__readers -= 1
 
-  @property
-  def teacher(self) -> Teacher:
-    return self.__teacher
+        if not self.__readers:
+          self.__condition.notify_all()
 
-  @teacher.setter
-  def teacher(self, new_teacher: Teacher) -> None:
-    self.__teacher = new_teacher
+  @contextmanager
+  def write(self):
+    with self.__condition:
+      self.__waiting_writers += 1
 
-  @property
-  def students(self) -> HashMap:
-    return self.__students
+      while self.__writing or self.__readers:
+        self.__condition.wait()
 
-  @property
-  def student_ammount(self) -> int:
-    return self.__students.size
+      self.__waiting_writers -= 1
+      self.__writing = True
 
-  # TODO: type parameter
-  def add_student(self, student) -> None:
-    self.__students.add(student.id, student)
+    try:
+      yield
+    finally:
+      with self.__condition:
+        self.__writing = False
+        self.__condition.notify_all()
 
-  # TODO: type parameter
-  def remove_student_by_id(self, student_id: int) -> None:
-    self.__students.remove(student_id)
 
+idGenerator = IdGenerator()
 
-class Student(Entity, Person):
-  def __init__(self, name: str, birthdate: datetime):
-    Entity.__init__(self)
-    Person.__init__(self, name, birthdate)
-    self.__course_classes = HashMap[int, CourseClass]()
 
-  @property
-  def course_classes(self) -> HashMap[int, CourseClass]:
-    return self.__course_classes
+# A date as the integer yyyymmdd. The difference of two keys over 10000 is
+# the calendar age between them: the years since the birthdate, one less
+# until the birthday comes. Who was born on February 29 turns a year older
+# on March 1 when the year isn't leap
+def date_key(day: date) -> int:
+  return day.year * 10000 + day.month * 100 + day.day
+
+def ordinal_key(ordinal: int) -> int:
+  return date_key(date.fromordinal(ordinal))
+
+# ordinal of the latest birthdate of someone at least age years old on today:
+# the same day age years before, February 28 when that February has no 29
+def latest_birthdate(today: date, age: int) -> int:
+  year = min(max(today.year - age, date.min.year), date.max.year)
+
+  try:
+    return today.replace(year=year).toordinal()
+  except ValueError:
+    return today.replace(year=year, day=28).toordinal()
+
+
+# The date ages are computed against, the same for the whole process. The
+# clock is read again only once the day is over, and until then the age of
+# each birthdate is kept: there are a few thousand distinct birthdates in a
+# roster at most, so an age is a lookup instead of a date computation
+class Clock:
+  def __init__(self):
+    self.__day = self.__refresh()
 
   @property
-  def course_classes_ammount(self) -> int:
-    return self.__course_classes.size
+  def today(self) -> date:
+    return self.__current()[0]
 
-  def add_course_class(self, course_class: CourseClass) -> None:
-    self.__course_classes.add(course_class.id, course_class)
+  def age(self, birthdate_ordinal: int) -> int:
+    _, today_key, _, ages = self.__current()
+    age = ages.get(birthdate_ordinal)
 
-  def remove_course_class_by_id(self, course_class_id: int) -> None:
-    self.__course_classes.remove(course_class_id)
+    if age is None:
+      age = ages[birthdate_ordinal] = (today_key - ordinal_key(birthdate_ordinal)) // 10000
 
+    return age
 
-"""
-REPOSITORIES -> Classes to interact with the Database
-"""
+  # ages of many birthdate ordinals at once, with a single look at the clock.
+  # None stays None, for people without a birthdate
+  def ages(self, birthdate_ordinals: Iterable[int | None]) -> list[int | None]:
+    _, today_key, _, ages = self.__current()
+    result = []
 
+    for ordinal in birthdate_ordinals:
+      age = ages.get(ordinal)
 
-class Repository:
+      if age is None and ordinal is not None:
+        age = ages[ordinal] = (today_key - ordinal_key(ordinal)) // 10000
+
+      result.append(age)
+
+    return result
+
+  def __current(self) -> tuple:
+    day = self.__day
+
+    if time() >= day[2]:
+      # threads racing here compute the same day, the last one to assign wins
+      day = self.__day = self.__refresh()
+
+    return day
+
+  def __refresh(self) -> tuple:
+    today = date.today()
+    midnight = datetime.combine(date.fromordinal(today.toordinal() + 1), datetime.min.time()).timestamp()
+
+    return today, date_key(today), midnight, {}
+
+
+clock = Clock()
+
+
+# Shared stand-in for relationship maps that were never allocated
+class EmptyHashMap(HashMap):
+  __slots__ = ()
+
+  def add(self, key, value) -> None:
+    raise TypeError('EmptyHashMap is read-only')
+
+
+EMPTY_HASH_MAP = EmptyHashMap()
+
+
+# Sorted ids of a collection, so a page can start right after any id with a
+# binary search instead of walking the whole collection
+class IdIndex:
   def __init__(self):
-    self.__students = HashMap[int, Student]()
-    self.__teachers = HashMap[int, Teacher]()
-    self.__course_classes = HashMap[int, CourseClass]()
-  
-  @property
-  def students(self) -> HashMap[int, Student]:
-    return self.__students
+    self.__ids = array('q')
 
   @property
-  def teachers(self) -> HashMap[int, Teacher]:
-    return self.__teachers
+  def size(self) -> int:
+    return len(self.__ids)
+
+  def add(self, id: int) -> None:
+    # ids are generated in increasing order, so this is almost always an append
+    if not self.__ids or id > self.__ids[-1]:
+      self.__ids.append(id)
+      return
+
+    position = bisect_left(self.__ids, id)
+
+    if position == len(self.__ids) or self.__ids[position] != id:
+      self.__ids.insert(position, id)
+
+  def remove(self, id: int) -> None:
+    position = bisect_left(self.__ids, id)
+
+    if position < len(self.__ids) and self.__ids[position] == id:
+      del self.__ids[position]
+
+  def page(self, after: int | None, limit: int) -> array:
+    start = 0 if after is None else bisect_right(self.__ids, after)
+
+    return self.__ids[start:start + limit]
+
+
+# Ids ordered by a key, for range lookups in O(log n + k). The keys and the
+# ids are kept in parallel arrays (a list for keys that aren't numbers), split
+# in chunks of up to 2 * CHUNK rows so an insert or a remove only shifts its
+# chunk, and a bulk load doesn't turn quadratic. Ids with the same key are in
+# no particular order
+class SortedIndex:
+  CHUNK = 512
+
+  def __init__(self, typecode: str | None = None):
+    self.__typecode = typecode
+    self.__keys: list = []
+    self.__ids: list[array] = []
+    # last key of each chunk, to find the chunk of a key by bisection
+    self.__maxes: list = []
+    self.__size = 0
 
   @property
-  def course_classes(self) -> HashMap[int, CourseClass]:
-    return self.__course_classes
+  def size(self) -> int:
+    return self.__size
 
-  def add_student(self, student: Student) -> None:
-    self.__students.add(student.id, student)
-  
-  def delete_student_by_id(self, student_id) -> None:
-    self.__students.remove(student_id)
+  def add(self, key, id: int) -> None:
+    self.__size += 1
 
-  def update_student_by_id(self, student_id: int, name: str, birthdate: datetime) -> None:
-    student = self.__students.get(student_id)
+    if not self.__maxes:
+      self.__keys.append(self.__new_keys([key]))
+      self.__ids.append(array('q', [id]))
+      self.__maxes.append(key)
+      return
 
-    student.name = name
-    student.birthdate = birthdate
-  
-  def add_teacher(self, teacher: Teacher) -> None:
-    self.__teachers.add(teacher.id, teacher)
+    chunk = min(bisect_right(self.__maxes, key), len(self.__maxes) - 1)
+    keys, ids = self.__keys[chunk], self.__ids[chunk]
+    position = bisect_right(keys, key)
 
-  def delete_teacher_by_id(self, teacher_id) -> None:
-    self.__teachers.remove(teacher_id)
+    keys.insert(position, key)
+    ids.insert(position, id)
+    self.__maxes[chunk] = keys[-1]
 
-  def update_teacher_by_id(self, teacher_id: int, name: str, birthdate: datetime) -> None:
-    teacher = self.__teachers.get(teacher_id)
+    if len(keys) > 2 * self.CHUNK:
+      self.__keys[chunk + 1:chunk + 1] = [keys[self.CHUNK:]]
+      self.__ids[chunk + 1:chunk + 1] = [ids[self.CHUNK:]]
+      self.__maxes.insert(chunk, keys[self.CHUNK - 1])
+      del keys[self.CHUNK:]
+      del ids[self.CHUNK:]
 
-    teacher.name = name
-    teacher.birthdate = birthdate
-  
-  def add_course_class(self, course_class: CourseClass) -> None:
-    self.__course_classes.add(course_class.id, course_class)
-  
-  def delete_course_class_by_id(self, course_class_id) -> None:
-    self.__course_classes.remove(course_class_id)
+  # a batch that is large next to the index is sorted in with the entries
+  # already there, in O((n + k) log(n + k)), instead of added one at a time
+  def extend(self, entries: list[tuple]) -> None:
+    if len(entries) * 8 < self.__size:
+      for key, id in entries:
+        self.add(key, id)
+
+      return
 
-  def update_course_class_by_id(self, course_class_id: int, teacher: Teacher) -> None:
-    course_class = self.__course_classes.get(course_class_id)
+    entries.extend(zip(chain.from_iterable(self.__keys), chain.from_iterable(self.__ids)))
+    entries.sort(key=itemgetter(0))
+    keys = [key for key, _ in entries]
+    ids = array('q', [id for _, id in entries])
 
-    course_class.teacher = teacher
-  
-  def add_student_to_course_class(self, student: Student, course_class: CourseClass) -> None:
-    course_class.add_student(student)
-    student.add_course_class(course_class)
+    self.__keys = [self.__new_keys(keys[start:start + self.CHUNK]) for start in range(0, len(keys), self.CHUNK)]
+    self.__ids = [ids[start:start + self.CHUNK] for start in range(0, len(ids), self.CHUNK)]
+    self.__maxes = [chunk[-1] for chunk in self.__keys]
+    self.__size = len(keys)
 
-  def remove_student_from_course_class(self, student: Student, course_class: CourseClass) -> None:
-    student.remove_course_class_by_id(course_class.id)
-    course_class.remove_student_by_id(student.id)
+  def remove(self, key, id: int) -> None:
+    chunk = bisect_left(self.__maxes, key)
 
+    # equal keys may spread over more than one chunk
+    while chunk < len(self.__maxes):
+      keys, ids = self.__keys[chunk], self.__ids[chunk]
+      position = bisect_left(keys, key)
 
-# make data be atomic
-# TODO: need to improve this later
-repository = Repository()
+      while position < len(keys) and keys[position] == key:
+        if ids[position] == id:
+          del keys[position]
+          del ids[position]
+          self.__size -= 1
 
+          if keys:
+            self.__maxes[chunk] = keys[-1]
+          else:
+            del self.__keys[chunk], self.__ids[chunk], self.__maxes[chunk]
 
-"""
-CONTROLLERS -> Classes that will deal with the HTTP request
-"""
+          return
 
+        position += 1
 
-class BaseController[Model](ABC):
-  def __init__(self):
-    self._repository = repository
+      if position < len(keys):
+        return
 
-  @abstractmethod
-  def get_all(self) -> list[Model]:
-    pass
+      chunk += 1
 
-  @abstractmethod
-  def get_by_id(self, id: int) -> Model:
-    pass
+  # both bounds are inclusive, None leaves that side open
+  def count(self, low=None, high=None) -> int:
+    return sum(stop - start for _, start, stop in self.__ranges(low, high))
 
-  @abstractmethod
-  def delete_by_id(self, id: int) -> None:
-    pass
+  def between(self, low=None, high=None) -> array:
+    result = array('q')
 
-  @abstractmethod
-  # TODO: find a way to type the data
-  def update_by_id(self, id: int, *data) -> None:
-    pass
+    for ids, start, stop in self.__ranges(low, high):
+      result.extend(ids[start:stop])
 
-  @abstractmethod
-  def create(self, data: Model) -> int:
-    pass
+    return result
 
+  # (ids, start, stop) of each chunk with keys between the bounds
+  def __ranges(self, low, high) -> Iterator[tuple[array, int, int]]:
+    chunk = 0 if low is None else bisect_left(self.__maxes, low)
 
-class StudentController(BaseController[Student]):
-  def __init__(self):
-    super().__init__()
-  
-  def get_all(self):
-    return self._repository.students.to_list()
+    while chunk < len(self.__maxes):
+      keys = self.__keys[chunk]
+      start = 0 if low is None else bisect_left(keys, low)
 
-  def get_by_id(self, id: int):
-    student = self.__validate_student_existence_and_return(id)
+      if high is None or self.__maxes[chunk] <= high:
+        stop = len(keys)
+      else:
+        stop = bisect_right(keys, high)
 
-    return student
-  
-  def delete_by_id(self, id: int):
-    self.__validate_student_existence_and_return(id)
+      if stop > start:
+        yield self.__ids[chunk], start, stop
 
-    self._repository.delete_student_by_id(id)
+      if stop < len(keys):
+        return
 
-  def update_by_id(self, id: int, name: str, birthdate: datetime):
-    self.__validate_student_existence_and_return(id)
+      low = None
+      chunk += 1
+
+  def __new_keys(self, keys: list):
+    return array(self.__typecode, keys) if self.__typecode is not None else keys
+
+
+# Filters of a search over students or teachers. Ages are turned into a
+# birthdate range, with the calendar age:
+#   age >= min_age <=> birthdate <= latest_birthdate(today, min_age)
+#   age <= max_age <=> birthdate > latest_birthdate(today, max_age + 1)
+class PersonQuery:
+  # sorts after every character, prefix + LAST_CHARACTER bounds the names with the prefix
+  LAST_CHARACTER = '\U0010ffff'
+
+  def __init__(
+    self,
+    name: str | None = None,
+    min_age: int | None = None,
+    max_age: int | None = None,
+    created_since: datetime | None = None,
+    today: date | None = None
+  ):
+    today = today or clock.today
+
+    self.name = name.casefold() if name else None
+    self.earliest_birthdate = latest_birthdate(today, max_age + 1) + 1 if max_age is not None else None
+    self.latest_birthdate = latest_birthdate(today, min_age) if min_age is not None else None
+    self.created_since = created_since.timestamp() if created_since is not None else None
+
+  @property
+  def filters_birthdate(self) -> bool:
+    return self.earliest_birthdate is not None or self.latest_birthdate is not None
+
+  @property
+  def name_range(self) -> tuple[str, str]:
+    return self.name, self.name + self.LAST_CHARACTER
+
+  def matches(self, person) -> bool:
+    if self.name is not None and not (person.name or '').casefold().startswith(self.name):
+      return False
+
+    if self.filters_birthdate:
+      birthdate = person.birthdate_ordinal
+
+      if birthdate is None:
+        return False
+      if self.earliest_birthdate is not None and birthdate < self.earliest_birthdate:
+        return False
+      if self.latest_birthdate is not None and birthdate > self.latest_birthdate:
+        return False
+
+    return self.created_since is None or person.created_at_timestamp >= self.created_since
+
+
+# LRU cache whose entries also expire after ttl seconds. Each entry is tagged
+# with what it was built from, invalidate(tags) drops the entries with any of
+# the tags
+class ResponseCache:
+  def __init__(self, max_size: int = 1024, ttl: float = 60):
+    self.__max_size = max_size
+    self.__ttl = ttl
+    self.__entries: OrderedDict[Hashable, tuple[float, object, tuple]] = OrderedDict()
+    self.__keys_by_tag: dict[Hashable, set] = {}
+    self.__generation = 0
+    self.__lock = threading.Lock()
+    self.__counters = dict.fromkeys(('hits', 'misses', 'evictions', 'expirations', 'invalidations'), 0)
+
+  # changes on every invalidation, see put
+  @property
+  def generation(self) -> int:
+    return self.__generation
+
+  @property
+  def stats(self) -> dict[str, int]:
+    with self.__lock:
+      return {"size": len(self.__entries), **self.__counters}
+
+  def get(self, key: Hashable):
+    with self.__lock:
+      entry = self.__entries.get(key)
+
+      if entry is not None and entry[0] <= monotonic():
+        self.__remove(key)
+        self.__counters['expirations'] += 1
+        entry = None
+
+      if entry is None:
+        self.__counters['misses'] += 1
+        return None
+
+      self.__entries.move_to_end(key)
+      self.__counters['hits'] += 1
+
+      return entry[1]
+
+  # generation is the one read before the value was built. If anything was
+  # invalidated since, the value may already be outdated and isn't stored
+  def put(self, key: Hashable, value, tags: Iterable[Hashable], generation: int) -> None:
+    if self.__max_size <= 0:
+      return
+
+    with self.__lock:
+      if generation != self.__generation:
+        return
+
+      if key in self.__entries:
+        self.__remove(key)
+
+      tags = tuple(tags)
+      self.__entries[key] = (monotonic() + self.__ttl, value, tags)
+
+      for tag in tags:
+        self.__keys_by_tag.setdefault(tag, set()).add(key)
+
+      while len(self.__entries) > self.__max_size:
+        self.__remove(next(iter(self.__entries)))
+        self.__counters['evictions'] += 1
+
+  def invalidate(self, tags: Iterable[Hashable]) -> None:
+    with self.__lock:
+      self.__generation += 1
+
+      for tag in tags:
+        for key in self.__keys_by_tag.pop(tag, ()):
+          if key in self.__entries:
+            self.__remove(key)
+            self.__counters['invalidations'] += 1
+
+  def __remove(self, key: Hashable) -> None:
+    _, _, tags = self.__entries.pop(key)
+
+    for tag in tags:
+      keys = self.__keys_by_tag.get(tag)
+
+      if keys is not None:
+        keys.discard(key)
+
+        if not keys:
+          del self.__keys_by_tag[tag]
+
+
+# Request counts and latency histograms, by route, and timing spans of the
+# calls made to handle them, rendered in the Prometheus text format. Each
+# observation takes the lock once and bumps a few counters
+class Metrics:
+  BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+  def __init__(self):
+    self.__lock = threading.Lock()
+    self.__requests: dict[tuple[str, str, int], int] = {}
+    # labels -> the count of each bucket, of the values above them and their sum
+    self.__request_durations: dict[tuple[str, str], list] = {}
+    self.__span_durations: dict[tuple[str, str], list] = {}
+
+  def observe_request(self, method: str, route: str, status: int, seconds: float) -> None:
+    with self.__lock:
+      key = (method, route, status)
+      self.__requests[key] = self.__requests.get(key, 0) + 1
+      self.__observe(self.__request_durations, (method, route), seconds)
+
+  def observe_span(self, kind: str, name: str, seconds: float) -> None:
+    with self.__lock:
+      self.__observe(self.__span_durations, (kind, name), seconds)
+
+  # generators are timed until they are returned, not while they are consumed
+  def timed(self, kind: str, name: str):
+    def decorator(function):
+      @wraps(function)
+      def wrapper(*args, **kwargs):
+        start = perf_counter()
+
+        try:
+          return function(*args, **kwargs)
+        finally:
+          self.observe_span(kind, name, perf_counter() - start)
+
+      return wrapper
+
+    return decorator
+
+  # replaces methods of obj with timed ones, all the public ones if no names are given
+  def instrument(self, obj, kind: str, names: Iterable[str] | None = None, exclude: Iterable[str] = ()) -> None:
+    cls = type(obj)
+
+    if names is None:
+      names = [name for name in dir(cls) if not name.startswith('_') and callable(getattr(cls, name))]
+
+    for name in set(names).difference(exclude):
+      setattr(obj, name, self.timed(kind, f'{cls.__name__}.{name}')(getattr(obj, name)))
+
+  def render(self) -> str:
+    with self.__lock:
+      requests = dict(self.__requests)
+      request_durations = {labels: list(values) for labels, values in self.__request_durations.items()}
+      span_durations = {labels: list(values) for labels, values in self.__span_durations.items()}
+
+    lines = [
+      '# HELP school_requests_total Requests answered, by method, route and status',
+      '# TYPE school_requests_total counter',
+    ]
+
+    for (method, route, status), count in sorted(requests.items()):
+      lines.append(f'school_requests_total{self.__labels(method=method, route=route, status=status)} {count}')
+
+    lines += self.__histogram('school_request_duration_seconds', 'Time to answer a request, by method and route', ('method', 'route'), request_durations)
+    lines += self.__histogram('school_span_duration_seconds', 'Time spent in controller, repository and serialization calls', ('kind', 'name'), span_durations)
+
+    return '\n'.join(lines) + '\n'
+
+  def __observe(self, histograms: dict, labels: tuple, seconds: float) -> None:
+    values = histograms.get(labels)
+
+    if values is None:
+      values = histograms[labels] = [0] * (len(self.BUCKETS) + 1) + [0.0]
+
+    values[bisect_left(self.BUCKETS, seconds)] += 1
+    values[-1] += seconds
+
+  def __histogram(self, name: str, description: str, label_names: tuple[str, ...], histograms: dict) -> list[str]:
+    lines = [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+
+    for labels, values in sorted(histograms.items()):
+      labels = dict(zip(label_names, labels))
+      count = 0
+
+      for bound, bucket in zip((*self.BUCKETS, '+Inf'), values):
+        count += bucket
+        lines.append(f'{name}_bucket{self.__labels(**labels, le=bound)} {count}')
+
+      lines.append(f'{name}_sum{self.__labels(**labels)} {values[-1]}')
+      lines.append(f'{name}_count{self.__labels(**labels)} {count}')
+
+    return lines
+
+  def __labels(self, **labels) -> str:
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+# Profiles a sample of the requests with cProfile and keeps the report of the
+# slowest ones. A single profiler can run at a time, a request sampled while
+# another one is being profiled just isn't
+class SlowRequestProfiler:
+  REPORT_LINES = 25
+
+  def __init__(self, sample_rate: float = 0, keep: int = 10):
+    self.__sample_rate = sample_rate
+    self.__keep = keep
+    self.__running = threading.Lock()
+    self.__lock = threading.Lock()
+    # min-heap of (seconds, sequence, profile), the fastest kept comes out first
+    self.__slowest: list[tuple[float, int, dict]] = []
+    self.__sequence = 0
+
+  @property
+  def sample_rate(self) -> float:
+    return self.__sample_rate
+
+  @property
+  def profiles(self) -> list[dict]:
+    with self.__lock:
+      return [profile for _, _, profile in sorted(self.__slowest, reverse=True)]
+
+  def start(self) -> cProfile.Profile | None:
+    if self.__sample_rate <= 0 or random.random() >= self.__sample_rate or not self.__running.acquire(blocking=False):
+      return None
+
+    profile = cProfile.Profile()
+    profile.enable()
+
+    return profile
+
+  def stop(self, profile: cProfile.Profile, label: str, status: int, seconds: float) -> None:
+    self.discard(profile)
+
+    with self.__lock:
+      if len(self.__slowest) >= self.__keep and seconds <= self.__slowest[0][0]:
+        return
+
+    # the report is only written for the requests kept
+    report = io.StringIO()
+    pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(self.REPORT_LINES)
+    entry = {"request": label, "status": status, "seconds": seconds, "profile": report.getvalue()}
+
+    with self.__lock:
+      self.__sequence += 1
+      heapq.heappush(self.__slowest, (seconds, self.__sequence, entry))
+
+      if len(self.__slowest) > self.__keep:
+        heapq.heappop(self.__slowest)
+
+  def discard(self, profile: cProfile.Profile) -> None:
+    profile.disable()
+    self.__running.release()
+
+
+# fromisoformat is a C fast path, strptime goes through a regex and the
+# locale. It takes other ISO formats too, the shape is checked first
+def parse_date(value: str) -> datetime:
+  if not isinstance(value, str) or len(value) != 10 or value[4] != '-' or value[7] != '-':
+    raise ValueError('Invalid date format. Use YYYY-MM-DD')
+
+  try:
+    return datetime.fromisoformat(value)
+  except ValueError:
+    raise ValueError('Invalid date format. Use YYYY-MM-DD') from None
+
+def parse_name(value: str) -> str:
+  if not isinstance(value, str) or not value.strip():
+    raise ValueError('must be a non empty string')
+
+  return value
+
+def parse_id(value: int) -> int:
+  # bool is an int too
+  if not isinstance(value, int) or isinstance(value, bool):
+    raise ValueError('must be an integer')
+
+  return value
+
+# Validates JSON objects against fields declared once, each with a parser
+# that returns the value or raises ValueError. All the fields are required,
+# keys that aren't declared are ignored
+class Schema:
+  def __init__(self, **fields):
+    self.__fields = tuple(fields.items())
+
+  def validate(self, data) -> dict:
+    if not isinstance(data, dict):
+      raise ValueError('Body must be a JSON object')
+
+    missing = [name for name, _ in self.__fields if data.get(name) in (None, '')]
+
+    if missing:
+      raise ValueError(f'Missing required fields: {", ".join(missing)}')
+
+    values = {}
+
+    for name, parse in self.__fields:
+      try:
+        values[name] = parse(data[name])
+      except ValueError as e:
+        raise ValueError(f'{name}: {e}') from None
+
+    return values
+
+
+PERSON_SCHEMA = Schema(name=parse_name, birthdate=parse_date)
+COURSE_CLASS_SCHEMA = Schema(teacher_id=parse_id)
+
+# Rows of a bulk import as (line number, row). NDJSON lines that aren't valid
+# JSON come out as None so they can be reported like any other invalid row
+def read_bulk_rows(lines: Iterable[str], format: str) -> Iterator[tuple[int, dict | None]]:
+  if format == 'csv':
+    reader = csv.DictReader(lines)
+
+    for row in reader:
+      yield reader.line_num, {key: value for key, value in row.items() if value}
+
+    return
+
+  for line_number, line in enumerate(lines, start=1):
+    if not line.strip():
+      continue
+
+    try:
+      yield line_number, json.loads(line)
+    except ValueError:
+      yield line_number, None
+
+def encode_cursor(id: int) -> str:
+  return base64.urlsafe_b64encode(str(id).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> int:
+  try:
+    return int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+  except (ValueError, UnicodeDecodeError):
+    raise ValueError('Invalid cursor')
+
+
+"""
+MODELS -> Representation of the entities
+"""
+
+
+class Entity(ABC):
+  __slots__ = ('_id', '_created_at', '_created_at_text', '_version')
+
+  # id, created_at and version are only passed when restoring a stored entity
+  def __init__(self, id: int | None = None, created_at: float | None = None, version: int = 0):
+    if id is None:
+      id = idGenerator.generate()
+    else:
+      idGenerator.reserve(id)
+
+    self._id = id
+    # kept as a timestamp, a float is half the size of a datetime
+    self._created_at = created_at if created_at is not None else datetime.now().timestamp()
+    self._created_at_text = None
+    # bumped by every setter, anything derived from the entity is keyed by it
+    self._version = version
+
+  @property
+  def id(self) -> int:
+    return self._id
+
+  @property
+  def created_at(self) -> datetime:
+    return datetime.fromtimestamp(self._created_at)
+
+  @property
+  def created_at_timestamp(self) -> float:
+    return self._created_at
+
+  @property
+  def version(self) -> int:
+    return self._version
+
+  # created_at never changes, it's formatted on the first serialization only
+  @property
+  def created_at_text(self) -> str:
+    if self._created_at_text is None:
+      self._created_at_text = http_date(self.created_at)
+
+    return self._created_at_text
+
+# the slots for _name and _birthdate live on the concrete classes, two bases
+# of Teacher/Student can't both declare slots
+class Person(ABC):
+  __slots__ = ()
+
+  def __init__(self, name: str, birthdate: datetime):
+    self._name = name
+    self._birthdate = birthdate.toordinal() if isinstance(birthdate, datetime) else None
+
+  @property
+  def name(self) -> str:
+    return self._name
+
+  @name.setter
+  def name(self, name: str) -> None:
+    self._name = name
+    self._version += 1
+  
+  @property
+  def birthdate(self) -> datetime:
+    return datetime.fromordinal(self._birthdate) if self._birthdate is not None else None
+
+  @birthdate.setter
+  def birthdate(self, birthdate: datetime) -> None:
+    self._birthdate = birthdate.toordinal() if isinstance(birthdate, datetime) else None
+    self._version += 1
+
+  @property
+  def birthdate_ordinal(self) -> int | None:
+    return self._birthdate
+
+  @property
+  def age(self) -> int:
+    if self._birthdate is None: return
+
+    return clock.age(self._birthdate)
+
+class Teacher(Entity, Person):
+  __slots__ = ('_name', '_birthdate', '__course_classes')
+
+  def __init__(self, name: str, birthdate: datetime, id: int | None = None, created_at: float | None = None, version: int = 0):
+    Entity.__init__(self, id, created_at, version)
+    Person.__init__(self, name, birthdate)
+    # allocated on the first course class
+    self.__course_classes: HashMap[int, CourseClass] | None = None
+  
+  @property
+  def course_classes(self) -> HashMap[int, 'CourseClass']:
+    return self.__course_classes if self.__course_classes is not None else EMPTY_HASH_MAP
+  
+  @property
+  def course_classes_ammount(self) -> int:
+    return self.course_classes.size
+
+  def add_course_class(self, course_class) -> None:
+    if self.__course_classes is None:
+      self.__course_classes = HashMap()
+
+    self.__course_classes.add(course_class.id, course_class)
+
+  def remove_course_class_by_id(self, course_class_id: int) -> None:
+    self.course_classes.remove(course_class_id)
+
+
+class CourseClass(Entity):
+  __slots__ = ('__teacher', '__students')
+
+  def __init__(self, teacher: Teacher, id: int | None = None, created_at: float | None = None, version: int = 0):
+    super().__init__(id, created_at, version)
+    self.__teacher = teacher
+    # allocated on the first student
+    self.__students: HashMap[int, Student] | None = None
+
+  @property
+  def teacher(self) -> Teacher:
+    return self.__teacher
+
+  @teacher.setter
+  def teacher(self, new_teacher: Teacher) -> None:
+    self.__teacher = new_teacher
+    self._version += 1
+
+  @property
+  def students(self) -> HashMap:
+    return self.__students if self.__students is not None else EMPTY_HASH_MAP
+
+  @property
+  def student_ammount(self) -> int:
+    return self.students.size
+
+  # TODO: type parameter
+  def add_student(self, student) -> None:
+    if self.__students is None:
+      self.__students = HashMap()
+
+    self.__students.add(student.id, student)
+
+  # TODO: type parameter
+  def remove_student_by_id(self, student_id: int) -> None:
+    self.students.remove(student_id)
+
+
+class Student(Entity, Person):
+  __slots__ = ('_name', '_birthdate', '__course_classes')
+
+  def __init__(self, name: str, birthdate: datetime, id: int | None = None, created_at: float | None = None, version: int = 0):
+    Entity.__init__(self, id, created_at, version)
+    Person.__init__(self, name, birthdate)
+    # allocated on the first course class
+    self.__course_classes: HashMap[int, CourseClass] | None = None
+
+  @property
+  def course_classes(self) -> HashMap[int, CourseClass]:
+    return self.__course_classes if self.__course_classes is not None else EMPTY_HASH_MAP
+
+  @property
+  def course_classes_ammount(self) -> int:
+    return self.course_classes.size
+
+  def add_course_class(self, course_class: CourseClass) -> None:
+    if self.__course_classes is None:
+      self.__course_classes = HashMap()
+
+    self.__course_classes.add(course_class.id, course_class)
+
+  def remove_course_class_by_id(self, course_class_id: int) -> None:
+    self.course_classes.remove(course_class_id)
+
+
+"""
+REPOSITORIES -> Classes to interact with the Database
+"""
+
+
+# Students stored column by column in parallel arrays, one row per student, so
+# analytics run over contiguous memory (and through numpy when it's installed)
+# instead of touching every Student object. Birthdates are kept as date keys
+# (yyyymmdd), the ages of a whole column are then a subtraction and a division
+class StudentColumns:
+  # birthdate key for students without a birthdate
+  NO_BIRTHDATE = 0
+
+  def __init__(self):
+    self.__ids = array('q')
+    self.__birthdates = array('q')
+    self.__created_at = array('d')
+    self.__enrollments = array('q')
+    self.__rows: dict[int, int] = {}
+
+  @property
+  def size(self) -> int:
+    return len(self.__ids)
+
+  def add(self, student: Student) -> None:
+    if student.id in self.__rows:
+      return
+
+    self.__rows[student.id] = len(self.__ids)
+    self.__ids.append(student.id)
+    self.__birthdates.append(self.__birthdate_of(student))
+    self.__created_at.append(student.created_at_timestamp)
+    self.__enrollments.append(student.course_classes_ammount)
+
+  def remove(self, student_id: int) -> None:
+    row = self.__rows.pop(student_id, None)
+
+    if row is None:
+      return
+
+    # the last row takes the place of the removed one, so removing is O(1)
+    last = len(self.__ids) - 1
+
+    for column in (self.__ids, self.__birthdates, self.__created_at, self.__enrollments):
+      column[row] = column[last]
+      del column[last]
+
+    if row != last:
+      self.__rows[self.__ids[row]] = row
+
+  def update(self, student: Student) -> None:
+    row = self.__rows.get(student.id)
+
+    if row is not None:
+      self.__birthdates[row] = self.__birthdate_of(student)
+
+  def add_enrollments(self, student_id: int, ammount: int) -> None:
+    row = self.__rows.get(student_id)
+
+    if row is not None:
+      self.__enrollments[row] += ammount
+
+  # ids and ages of the students that have a birthdate, up to today: a
+  # birthdate in the future has no age yet, and is left out like in SQLite
+  def ages(self, today: date | None = None) -> tuple[array, array]:
+    today_key = date_key(today or clock.today)
+
+    if numpy is not None:
+      ids = numpy.frombuffer(self.__ids, dtype=numpy.int64)
+      birthdates = numpy.frombuffer(self.__birthdates, dtype=numpy.int64)
+      known = (birthdates != self.NO_BIRTHDATE) & (birthdates <= today_key)
+
+      return ids[known], (today_key - birthdates[known]) // 10000
+
+    rows = [row for row, birthdate in enumerate(self.__birthdates) if self.NO_BIRTHDATE != birthdate <= today_key]
+
+    return (
+      array('q', [self.__ids[row] for row in rows]),
+      array('q', [(today_key - self.__birthdates[row]) // 10000 for row in rows])
+    )
+
+  def age_histogram(self, bucket: int = 1) -> dict[int, int]:
+    _, ages = self.ages()
+
+    if numpy is not None:
+      counts = numpy.bincount(ages // bucket) if len(ages) else []
+
+      return {index * bucket: int(count) for index, count in enumerate(counts) if count}
+
+    histogram: dict[int, int] = {}
+
+    for age in ages:
+      histogram[age // bucket * bucket] = histogram.get(age // bucket * bucket, 0) + 1
+
+    return dict(sorted(histogram.items()))
+
+  def ids_by_age(self, older_than: int | None = None, younger_than: int | None = None) -> list[int]:
+    ids, ages = self.ages()
+
+    if numpy is not None:
+      mask = numpy.ones(len(ages), dtype=bool)
+
+      if older_than is not None:
+        mask &= ages > older_than
+      if younger_than is not None:
+        mask &= ages < younger_than
+
+      return numpy.sort(ids[mask]).tolist()
+
+    return sorted(
+      id for id, age in zip(ids, ages)
+      if (older_than is None or age > older_than) and (younger_than is None or age < younger_than)
+    )
+
+  def average_age(self) -> float | None:
+    _, ages = self.ages()
+
+    if not len(ages):
+      return None
+
+    return float(ages.mean()) if numpy is not None else sum(ages) / len(ages)
+
+  def total_enrollments(self) -> int:
+    if numpy is not None:
+      return int(numpy.frombuffer(self.__enrollments, dtype=numpy.int64).sum())
+
+    return sum(self.__enrollments)
+
+  def __birthdate_of(self, student: Student) -> int:
+    ordinal = student.birthdate_ordinal
+
+    return ordinal_key(ordinal) if ordinal is not None else self.NO_BIRTHDATE
+
+
+# Secondary indexes of students or teachers: name (case insensitive, for
+# prefix search), birthdate (for age ranges) and created_at. People added wait
+# in a list until flush, which the repository calls at the end of each write
+# and of the replay, so a bulk load is sorted into the indexes at once
+class PersonIndex:
+  def __init__(self):
+    self.__names = SortedIndex()
+    self.__birthdates = SortedIndex('q')
+    self.__created_at = SortedIndex('d')
+    self.__pending: list[Person] = []
+
+  def add(self, person: Person) -> None:
+    self.__pending.append(person)
+
+  def flush(self) -> None:
+    if not self.__pending:
+      return
+
+    people, self.__pending = self.__pending, []
+
+    self.__names.extend([((person.name or '').casefold(), person.id) for person in people])
+    self.__created_at.extend([(person.created_at_timestamp, person.id) for person in people])
+    self.__birthdates.extend([(person.birthdate_ordinal, person.id) for person in people if person.birthdate_ordinal is not None])
+
+  def remove(self, person: Person) -> None:
+    self.flush()
+    self.__names.remove((person.name or '').casefold(), person.id)
+    self.__created_at.remove(person.created_at_timestamp, person.id)
+
+    if person.birthdate_ordinal is not None:
+      self.__birthdates.remove(person.birthdate_ordinal, person.id)
+
+  # ids from the range of the narrowest index the query filters on, the other
+  # filters are left to query.matches. None when the query filters nothing
+  def candidates(self, query: PersonQuery) -> array | None:
+    ranges = []
+
+    if query.name is not None:
+      ranges.append((self.__names, *query.name_range))
+    if query.filters_birthdate:
+      ranges.append((self.__birthdates, query.earliest_birthdate, query.latest_birthdate))
+    if query.created_since is not None:
+      ranges.append((self.__created_at, query.created_since, None))
+
+    if not ranges:
+      return None
+
+    index, low, high = min(ranges, key=lambda range: range[0].count(range[1], range[2]))
+
+    return index.between(low, high)
+
+
+# For each teacher, the ids of the students enrolled in any of their course
+# classes, with how many of those classes each student is in. A student only
+# leaves the index when their last class with the teacher is gone
+class TeacherStudentsIndex:
+  def __init__(self):
+    self.__references: dict[int, dict[int, int]] = {}
+
+  def add(self, teacher_id: int, student_id: int) -> None:
+    students = self.__references.setdefault(teacher_id, {})
+    students[student_id] = students.get(student_id, 0) + 1
+
+  def remove(self, teacher_id: int, student_id: int) -> None:
+    students = self.__references.get(teacher_id)
+
+    if students is None or student_id not in students:
+      return
+
+    if students[student_id] > 1:
+      students[student_id] -= 1
+    else:
+      del students[student_id]
+
+  def remove_student(self, teacher_id: int, student_id: int) -> None:
+    students = self.__references.get(teacher_id)
+
+    if students is not None:
+      students.pop(student_id, None)
+
+  def remove_teacher(self, teacher_id: int) -> None:
+    self.__references.pop(teacher_id, None)
+
+  def student_ids(self, teacher_id: int) -> KeysView[int]:
+    return self.__references.get(teacher_id, {}).keys()
+
+  def count(self, teacher_id: int) -> int:
+    return len(self.__references.get(teacher_id, ()))
+
+
+# Where Repository keeps its mutations so they survive a restart. Records
+# are JSON-compatible lists, [operation, *arguments]
+class Persistence(ABC):
+  # number of records appended so far
+  @property
+  @abstractmethod
+  def sequence(self) -> int:
+    pass
+
+  # called with the repository write locks held, so records keep their order
+  @abstractmethod
+  def append(self, record: list) -> None:
+    pass
+
+  # called after the locks are released, returns once every record up to
+  # sequence is stored
+  @abstractmethod
+  def commit(self, sequence: int) -> None:
+    pass
+
+  @abstractmethod
+  def replay(self) -> Iterator[list]:
+    pass
+
+  @abstractmethod
+  def needs_snapshot(self) -> bool:
+    pass
+
+  # replaces everything stored so far with the records of the current state
+  @abstractmethod
+  def snapshot(self, records: Iterable[list]) -> None:
+    pass
+
+
+# Append-only log of the mutations plus a snapshot of the state at some point.
+# Startup streams the snapshot and then the log written after it.
+#
+# sync='group' fsyncs before commit() returns, but a single fsync covers the
+# records of every thread waiting at that moment (group commit); sync='none'
+# leaves flushing to disk to the OS
+class WriteAheadLog(Persistence):
+  SNAPSHOT_FILE = 'snapshot.ndjson'
+  LOG_FILE = 'wal.ndjson'
+  SNAPSHOT_CHUNK_SIZE = 10_000
+
+  def __init__(self, directory: str, sync: str = 'group', snapshot_every: int = 100_000):
+    if sync not in ('group', 'none'):
+      raise ValueError(f'Unknown sync mode: {sync}')
+
+    os.makedirs(directory, exist_ok=True)
+
+    self.__directory = directory
+    self.__snapshot_path = os.path.join(directory, self.SNAPSHOT_FILE)
+    self.__log_path = os.path.join(directory, self.LOG_FILE)
+    self.__sync = sync
+    self.__snapshot_every = snapshot_every
+    self.__condition = threading.Condition()
+    self.__pending: list[str] = []
+    self.__sequence = 0
+    self.__durable = 0
+    self.__flushing = False
+    self.__logged = 0
+    self.__file = None
+
+  @property
+  def sequence(self) -> int:
+    return self.__sequence
+
+  def append(self, record: list) -> None:
+    with self.__condition:
+      self.__pending.append(json.dumps(record, separators=(',', ':')) + '\n')
+      self.__sequence += 1
+      self.__logged += 1
+
+  def commit(self, sequence: int) -> None:
+    with self.__condition:
+      while self.__durable < sequence:
+        # someone else is writing, their write may already cover this sequence
+        if self.__flushing:
+          self.__condition.wait()
+          continue
+
+        self.__flush_pending()
+
+  def replay(self) -> Iterator[list]:
+    if os.path.exists(self.__snapshot_path):
+      with open(self.__snapshot_path, 'rb') as snapshot:
+        for line in snapshot:
+          yield from json.loads(line)
+
+    if os.path.exists(self.__log_path):
+      yield from self.__replay_log()
+
+    self.__file = open(self.__log_path, 'a', encoding='utf-8')
+
+  def needs_snapshot(self) -> bool:
+    return self.__logged >= self.__snapshot_every
+
+  def snapshot(self, records: Iterable[list]) -> None:
+    # whatever is still pending is part of the state being snapshotted, it
+    # goes to the log first so its writers aren't left waiting
+    with self.__condition:
+      while self.__flushing:
+        self.__condition.wait()
+
+      self.__flush_pending()
+
+    temporary_path = self.__snapshot_path + '.tmp'
+
+    # each line of the snapshot holds a chunk of records, encoding and
+    # decoding them a chunk at a time is much cheaper than one at a time
+    records = iter(records)
+
+    with open(temporary_path, 'w', encoding='utf-8') as snapshot:
+      while chunk := list(islice(records, self.SNAPSHOT_CHUNK_SIZE)):
+        snapshot.write(json.dumps(chunk, separators=(',', ':')) + '\n')
+
+      snapshot.flush()
+      os.fsync(snapshot.fileno())
+
+    os.replace(temporary_path, self.__snapshot_path)
+    self.__fsync_directory()
+
+    # a crash before the truncation replays the old log over the new
+    # snapshot, which is harmless since replaying a record twice is a no-op
+    with self.__condition:
+      self.__file.close()
+      self.__file = open(self.__log_path, 'w', encoding='utf-8')
+      self.__logged = 0
+
+  def close(self) -> None:
+    with self.__condition:
+      self.__flush_pending()
+      self.__file.close()
+
+  # must be called holding the condition, releases it while writing
+  def __flush_pending(self) -> None:
+    lines, target = self.__pending, self.__sequence
+    self.__pending = []
+    self.__flushing = True
+    self.__condition.release()
+
+    try:
+      self.__file.write(''.join(lines))
+      self.__file.flush()
+
+      if self.__sync == 'group':
+        os.fsync(self.__file.fileno())
+    finally:
+      self.__condition.acquire()
+      self.__flushing = False
+      self.__condition.notify_all()
+
+    self.__durable = target
+
+  def __replay_log(self) -> Iterator[list]:
+    valid_until = 0
+
+    with open(self.__log_path, 'rb') as log:
+      for line in log:
+        # a crash in the middle of a write leaves a partial last line behind
+        if not line.endswith(b'\n'):
+          break
+
+        try:
+          record = json.loads(line)
+        except ValueError:
+          break
+
+        valid_until += len(line)
+        self.__logged += 1
+
+        yield record
+
+    if valid_until < os.path.getsize(self.__log_path):
+      os.truncate(self.__log_path, valid_until)
+
+  def __fsync_directory(self) -> None:
+    if not hasattr(os, 'O_DIRECTORY'):
+      return
+
+    directory = os.open(self.__directory, os.O_RDONLY | os.O_DIRECTORY)
+
+    try:
+      os.fsync(directory)
+    finally:
+      os.close(directory)
+
+
+class Repository:
+  PAGE_CHUNK_SIZE = 500
+  # locks are always taken in this order, so two writers can't deadlock
+  LOCK_ORDER = ('students', 'teachers', 'course_classes')
+  CASCADE_BATCH = 10_000
+
+  def __init__(self, columnar: bool = True, persistence: Persistence | None = None, change_log_size: int = 100_000):
+    self.__students = HashMap[int, Student]()
+    self.__teachers = HashMap[int, Teacher]()
+    self.__course_classes = HashMap[int, CourseClass]()
+    self.__student_ids = IdIndex()
+    self.__teacher_ids = IdIndex()
+    self.__course_class_ids = IdIndex()
+    self.__student_columns = StudentColumns() if columnar else None
+    self.__teacher_students = TeacherStudentsIndex()
+    self.__student_index = PersonIndex()
+    self.__teacher_index = PersonIndex()
+    # each lock guards its collection, the relationship maps of its entities
+    # and the indexes derived from them (the teacher->students index belongs
+    # to course_classes, since it's built from the class rosters)
+    self.__locks = {name: ReadWriteLock() for name in self.LOCK_ORDER}
+    self.__persistence = None
+    self.__snapshotting = threading.Lock()
+    # version and time of the last change of each collection. Versions start
+    # over on a restart, the epoch tells them apart from the previous ones
+    self.__epoch = os.urandom(4).hex()
+    started_at = datetime.now().timestamp()
+    self.__revisions = {name: (0, started_at) for name in self.LOCK_ORDER}
+    # what each mutation changed, as tags: ('student', id) and the like for
+    # entities, the collection name when its listing changed. Collected per
+    # thread while the mutation runs and handed to the listeners
+    self.__listeners = []
+    self.__pending = threading.local()
+    # the records of the mutations since the start, for the change feed. A
+    # replay doesn't add to it, the epoch changes on a restart anyway
+    self.__change_log = ChangeLog(change_log_size)
+
+    # replayed before the persistence is set, replaying must not log again
+    if persistence is not None:
+      self.__replay(persistence)
+
+    self.__persistence = persistence
+  
+  @property
+  def students(self) -> HashMap[int, Student]:
+    return self.__students
+
+  @property
+  def teachers(self) -> HashMap[int, Teacher]:
+    return self.__teachers
+
+  @property
+  def course_classes(self) -> HashMap[int, CourseClass]:
+    return self.__course_classes
+
+  @property
+  def student_columns(self) -> StudentColumns | None:
+    return self.__student_columns
+
+  @property
+  def epoch(self) -> str:
+    return self.__epoch
+
+  # changes whenever one of the collections does, along with the relationship
+  # maps and indexes their locks guard. Returns the versions and the time of
+  # the latest change
+  def revision(self, *collections: str) -> tuple[str, float]:
+    revisions = [self.__revisions[name] for name in self.LOCK_ORDER if name in collections]
+
+    return '.'.join(str(version) for version, _ in revisions), max(modified_at for _, modified_at in revisions)
+
+  # listener(tags) is called after each mutation, still under its locks
+  def subscribe(self, listener) -> None:
+    self.__listeners.append(listener)
+
+  # the records of the mutations after sequence, like the ones of the
+  # write-ahead log, numbered. None when they're no longer all kept
+  def changes_since(self, sequence: int, limit: int) -> list[tuple[int, list]] | None:
+    return self.__change_log.since(sequence, limit)
+
+  def last_change(self) -> int:
+    return self.__change_log.sequence
+
+  def wait_for_changes(self, sequence: int, timeout: float) -> bool:
+    return self.__change_log.wait(sequence, timeout)
+
+  def reading(self, *collections: str) -> ExitStack:
+    return self.__acquire(collections, write=False)
+
+  def writing(self, *collections: str) -> ExitStack:
+    return self.__acquire(collections, write=True)
+
+  def add_student(self, student: Student) -> None:
+    with self.__mutating('students'):
+      self.__add_student(student)
+  
+  def delete_student_by_id(self, student_id) -> None:
+    with self.__mutating('students', 'course_classes'):
+      self.__delete_student_by_id(student_id)
+
+  def update_student_by_id(self, student_id: int, name: str, birthdate: datetime) -> None:
+    with self.__mutating('students'):
+      self.__update_student_by_id(student_id, name, birthdate)
+  
+  def add_teacher(self, teacher: Teacher) -> None:
+    with self.__mutating('teachers'):
+      self.__add_teacher(teacher)
+
+  # the course classes of the teacher go with it, a few at a time: each
+  # round deletes classes with about CASCADE_BATCH enrollments in all and
+  # releases the locks, so a teacher with a huge fan-out doesn't stall the
+  # other threads. Every round leaves whole classes deleted, the teacher last
+  def delete_teacher_by_id(self, teacher_id) -> None:
+    while True:
+      with self.__mutating('students', 'teachers', 'course_classes'):
+        if self.__delete_teacher_by_id(teacher_id, self.CASCADE_BATCH):
+          return
+
+  def update_teacher_by_id(self, teacher_id: int, name: str, birthdate: datetime) -> None:
+    with self.__mutating('teachers'):
+      self.__update_teacher_by_id(teacher_id, name, birthdate)
+  
+  def add_course_class(self, course_class: CourseClass) -> None:
+    with self.__mutating('teachers', 'course_classes'):
+      self.__add_course_class(course_class)
+  
+  def delete_course_class_by_id(self, course_class_id) -> None:
+    with self.__mutating('students', 'teachers', 'course_classes'):
+      self.__delete_course_class_by_id(course_class_id)
+
+  def update_course_class_by_id(self, course_class_id: int, teacher: Teacher) -> None:
+    with self.__mutating('teachers', 'course_classes'):
+      self.__update_course_class_by_id(course_class_id, teacher)
+  
+  # both sides of the enrollment change under the same locks, no reader sees
+  # a student in a class that isn't in the student's classes
+  def add_student_to_course_class(self, student: Student, course_class: CourseClass) -> None:
+    with self.__mutating('students', 'course_classes'):
+      self.__add_student_to_course_class(student, course_class)
+
+  def remove_student_from_course_class(self, student: Student, course_class: CourseClass) -> None:
+    with self.__mutating('students', 'course_classes'):
+      self.__remove_student_from_course_class(student, course_class)
+
+  # the roster of a course class changed in one pass under the locks, the
+  # students are enrolled in the order given and, with replace, the ones
+  # left out are removed. None when the course class doesn't exist
+  def update_course_class_students(self, course_class_id: int, student_ids: Iterable[int], replace: bool = False) -> dict[str, list[int]] | None:
+    with self.__mutating('students', 'course_classes'):
+      course_class = self.__course_classes.get(course_class_id)
+
+      if course_class is None:
+        return None
+
+      result = {"added": [], "present": [], "missing": []}
+      wanted = set()
+
+      for student_id in student_ids:
+        student = self.__students.get(student_id)
+
+        if student is None:
+          result['missing'].append(student_id)
+        elif student_id in course_class.students:
+          result['present'].append(student_id)
+        else:
+          self.__add_student_to_course_class(student, course_class)
+          result['added'].append(student_id)
+
+        wanted.add(student_id)
+
+      if replace:
+        result['removed'] = sorted(student_id for student_id in course_class.students.keys() if student_id not in wanted)
+
+        for student_id in result['removed']:
+          self.__remove_student_from_course_class(self.__students.get(student_id), course_class)
+
+      return result
+
+  def add_students(self, students: Iterable[Student]) -> None:
+    with self.__mutating('students'):
+      for student in students:
+        self.__add_student(student)
+
+  def add_teachers(self, teachers: Iterable[Teacher]) -> None:
+    with self.__mutating('teachers'):
+      for teacher in teachers:
+        self.__add_teacher(teacher)
+
+  def add_course_classes(self, course_classes: Iterable[CourseClass]) -> None:
+    with self.__mutating('teachers', 'course_classes'):
+      for course_class in course_classes:
+        self.__add_course_class(course_class)
+
+  # how many of the enrollments were added, the students already in the
+  # class are left as they are
+  def add_students_to_course_classes(self, enrollments: Iterable[tuple[Student, CourseClass]]) -> int:
+    added = 0
+
+    with self.__mutating('students', 'course_classes'):
+      for student, course_class in enrollments:
+        added += self.__add_student_to_course_class(student, course_class)
+
+    return added
+
+  # relationship maps are copied under the lock, they can't be iterated while
+  # another thread changes them
+  def get_student_course_classes(self, student: Student) -> list[CourseClass]:
+    with self.reading('students'):
+      return student.course_classes.to_list()
+
+  def get_teacher_course_classes(self, teacher: Teacher) -> list[CourseClass]:
+    with self.reading('teachers'):
+      return teacher.course_classes.to_list()
+
+  def get_course_class_students(self, course_class: CourseClass) -> list[Student]:
+    with self.reading('course_classes'):
+      return course_class.students.to_list()
+
+  def is_student_in_course_class(self, student_id: int, course_class_id: int) -> bool:
+    with self.reading('course_classes'):
+      course_class = self.__course_classes.get(course_class_id)
+
+      return course_class is not None and student_id in course_class.students
+
+  def get_teacher_students(self, teacher_id: int) -> list[Student]:
+    with self.reading('students', 'course_classes'):
+      return [self.__students.get(student_id) for student_id in self.__teacher_students.student_ids(teacher_id)]
+
+  def count_teacher_students(self, teacher_id: int) -> int:
+    with self.reading('course_classes'):
+      return self.__teacher_students.count(teacher_id)
+
+  # matching entities in id order
+  def search_students(self, query: PersonQuery) -> list[Student]:
+    with self.reading('students'):
+      return self.__search(self.__students, self.__student_index, query)
+
+  def search_teachers(self, query: PersonQuery) -> list[Teacher]:
+    with self.reading('teachers'):
+      return self.__search(self.__teachers, self.__teacher_index, query)
+
+  def page_students(self, after: int | None, limit: int) -> list[Student]:
+    return self.__page('students', self.__students, self.__student_ids, after, limit)
+
+  def page_teachers(self, after: int | None, limit: int) -> list[Teacher]:
+    return self.__page('teachers', self.__teachers, self.__teacher_ids, after, limit)
+
+  def page_course_classes(self, after: int | None, limit: int) -> list[CourseClass]:
+    return self.__page('course_classes', self.__course_classes, self.__course_class_ids, after, limit)
+
+  def iter_students(self, after: int | None = None) -> Iterator[Student]:
+    return self.__iter('students', self.__students, self.__student_ids, after)
+
+  def iter_teachers(self, after: int | None = None) -> Iterator[Teacher]:
+    return self.__iter('teachers', self.__teachers, self.__teacher_ids, after)
+
+  def iter_course_classes(self, after: int | None = None) -> Iterator[CourseClass]:
+    return self.__iter('course_classes', self.__course_classes, self.__course_class_ids, after)
+
+  # the columns are read under the students lock, numpy views of them would
+  # break if a concurrent write resized them
+  def age_histogram(self, bucket: int) -> dict[int, int]:
+    with self.reading('students'):
+      return self.__columns().age_histogram(bucket)
+
+  def students_by_age(self, older_than: int | None = None, younger_than: int | None = None) -> list[int]:
+    with self.reading('students'):
+      return self.__columns().ids_by_age(older_than, younger_than)
+
+  def average_age(self) -> float | None:
+    with self.reading('students'):
+      return self.__columns().average_age()
+
+  def total_enrollments(self) -> int:
+    with self.reading('students'):
+      return self.__columns().total_enrollments()
+
+  # writes the current state as the new snapshot, writers wait while it runs
+  def snapshot(self) -> None:
+    if self.__persistence is None:
+      return
+
+    with self.__snapshotting, self.reading(*self.LOCK_ORDER):
+      self.__persistence.snapshot(self.__dump())
+
+  def __columns(self) -> StudentColumns:
+    if self.__student_columns is None:
+      raise Exception('Armazenamento colunar desativado')
+
+    return self.__student_columns
+
+  def __acquire(self, collections: tuple[str, ...], write: bool) -> ExitStack:
+    stack = ExitStack()
+
+    for name in self.LOCK_ORDER:
+      if name in collections:
+        lock = self.__locks[name]
+        stack.enter_context(lock.write() if write else lock.read())
+
+    return stack
+
+  # the records of the mutation are stored only after the locks are
+  # released, so waiting for the disk doesn't block other threads
+  @contextmanager
+  def __mutating(self, *collections: str):
+    with self.writing(*collections):
+      self.__pending.changes = changes = set()
+      self.__pending.records = records = []
+
+      try:
+        yield
+      finally:
+        self.__pending.changes = None
+        self.__pending.records = None
+
+        if 'students' in collections:
+          self.__student_index.flush()
+        if 'teachers' in collections:
+          self.__teacher_index.flush()
+
+      # still under the locks, the records of conflicting mutations are
+      # numbered in the order they were applied
+      if records:
+        self.__change_log.append(records)
+
+      sequence = self.__persistence.sequence if self.__persistence is not None else 0
+      modified_at = datetime.now().timestamp()
+
+      for name in collections:
+        self.__revisions[name] = (self.__revisions[name][0] + 1, modified_at)
+
+      if changes:
+        for listener in self.__listeners:
+          listener(changes)
+
+    if self.__persistence is None:
+      return
+
+    self.__persistence.commit(sequence)
+
+    if self.__persistence.needs_snapshot() and not self.__snapshotting.locked():
+      threading.Thread(target=self.__snapshot_in_background, daemon=True).start()
+
+  def __snapshot_in_background(self) -> None:
+    # another thread may have started one in the meantime
+    if not self.__snapshotting.acquire(blocking=False):
+      return
+
+    try:
+      with self.reading(*self.LOCK_ORDER):
+        self.__persistence.snapshot(self.__dump())
+    finally:
+      self.__snapshotting.release()
+
+  # replaying runs outside __mutating, there's nothing to collect then
+  def __changed(self, *tags) -> None:
+    changes = getattr(self.__pending, 'changes', None)
+
+    if changes is not None:
+      changes.update(tags)
+
+  # logged=False leaves the record out of the write-ahead log, for what the
+  # replay of another record redoes anyway, like the enrollments a cascade
+  # removes: the change feed still lists them, as SQLite's triggers do
+  def __record(self, *record, logged: bool = True) -> None:
+    records = getattr(self.__pending, 'records', None)
+
+    if records is not None:
+      records.append(list(record))
+
+    if logged and self.__persistence is not None:
+      self.__persistence.append(list(record))
+
+  def __replay(self, persistence: Persistence) -> None:
+    # the replay only allocates objects that live on, running the cycle
+    # collector over them again and again would double the startup time
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+      for record in persistence.replay():
+        self.__apply(record)
+
+      self.__student_index.flush()
+      self.__teacher_index.flush()
+    finally:
+      if gc_enabled:
+        gc.enable()
+
+  def __apply(self, record: list) -> None:
+    operation, *arguments = record
+
+    if operation == 'add_student':
+      id, name, birthdate, created_at = arguments
+      self.__add_student(Student(name, self.__from_ordinal(birthdate), id=id, created_at=created_at))
+    elif operation == 'update_student':
+      id, name, birthdate = arguments
+
+      if id in self.__students:
+        self.__update_student_by_id(id, name, self.__from_ordinal(birthdate))
+    elif operation == 'delete_student':
+      self.__delete_student_by_id(arguments[0])
+    elif operation == 'add_teacher':
+      id, name, birthdate, created_at = arguments
+      self.__add_teacher(Teacher(name, self.__from_ordinal(birthdate), id=id, created_at=created_at))
+    elif operation == 'update_teacher':
+      id, name, birthdate = arguments
+
+      if id in self.__teachers:
+        self.__update_teacher_by_id(id, name, self.__from_ordinal(birthdate))
+    elif operation == 'delete_teacher':
+      self.__delete_teacher_by_id(arguments[0])
+    elif operation == 'add_course_class':
+      id, teacher_id, created_at = arguments
+      teacher = self.__teachers.get(teacher_id)
+
+      if teacher is not None:
+        self.__add_course_class(CourseClass(teacher, id=id, created_at=created_at))
+    elif operation == 'update_course_class':
+      id, teacher_id = arguments
+      teacher = self.__teachers.get(teacher_id)
+
+      if teacher is not None and id in self.__course_classes:
+        self.__update_course_class_by_id(id, teacher)
+    elif operation == 'delete_course_class':
+      self.__delete_course_class_by_id(arguments[0])
+    elif operation in ('enroll', 'unenroll'):
+      student = self.__students.get(arguments[0])
+      course_class = self.__course_classes.get(arguments[1])
+
+      # records pointing to entities that are gone are skipped
+      if student is None or course_class is None:
+        return
+
+      if operation == 'enroll':
+        self.__add_student_to_course_class(student, course_class)
+      else:
+        self.__remove_student_from_course_class(student, course_class)
+    else:
+      raise ValueError(f'Unknown operation: {operation}')
+
+  def __from_ordinal(self, ordinal: int | None) -> datetime | None:
+    return datetime.fromordinal(ordinal) if ordinal is not None else None
+
+  # the current state as records that rebuild it when replayed
+  def __dump(self) -> Iterator[list]:
+    for teacher in self.__teachers.values():
+      yield ['add_teacher', teacher.id, teacher.name, teacher.birthdate_ordinal, teacher.created_at_timestamp]
+
+    for student in self.__students.values():
+      yield ['add_student', student.id, student.name, student.birthdate_ordinal, student.created_at_timestamp]
+
+    for course_class in self.__course_classes.values():
+      yield ['add_course_class', course_class.id, course_class.teacher.id, course_class.created_at_timestamp]
+
+    for course_class in self.__course_classes.values():
+      for student_id in course_class.students.keys():
+        yield ['enroll', student_id, course_class.id]
+
+  def __add_student(self, student: Student) -> None:
+    if student.id in self.__students:
+      return
+
+    self.__students.add(student.id, student)
+    self.__student_ids.add(student.id)
+    self.__student_index.add(student)
+
+    if self.__student_columns is not None:
+      self.__student_columns.add(student)
+
+    self.__changed('students')
+    self.__record('add_student', student.id, student.name, student.birthdate_ordinal, student.created_at_timestamp)
+
+  def __delete_student_by_id(self, student_id: int) -> None:
+    student = self.__students.get(student_id)
+
+    if student is None:
+      return
+
+    # the reverse links, in O(number of classes of the student)
+    for course_class in student.course_classes.values():
+      course_class.remove_student_by_id(student_id)
+      self.__teacher_students.remove_student(course_class.teacher.id, student_id)
+      self.__changed(('course_class', course_class.id), ('teacher', course_class.teacher.id))
+      self.__record('unenroll', student_id, course_class.id, logged=False)
+
+    self.__students.remove(student_id)
+    self.__student_ids.remove(student_id)
+    self.__student_index.remove(student)
+
+    if self.__student_columns is not None:
+      self.__student_columns.remove(student_id)
+
+    self.__changed(('student', student_id), 'students', 'enrollments')
+    self.__record('delete_student', student_id)
+
+  def __update_student_by_id(self, student_id: int, name: str, birthdate: datetime) -> None:
+    student = self.__students.get(student_id)
+
+    self.__student_index.remove(student)
+    student.name = name
+    student.birthdate = birthdate
+    self.__student_index.add(student)
+
+    if self.__student_columns is not None:
+      self.__student_columns.update(student)
+
+    self.__changed(('student', student_id), 'students')
+    self.__record('update_student', student_id, name, student.birthdate_ordinal)
+
+  def __add_teacher(self, teacher: Teacher) -> None:
+    if teacher.id in self.__teachers:
+      return
+
+    self.__teachers.add(teacher.id, teacher)
+    self.__teacher_ids.add(teacher.id)
+    self.__teacher_index.add(teacher)
+    self.__changed('teachers')
+    self.__record('add_teacher', teacher.id, teacher.name, teacher.birthdate_ordinal, teacher.created_at_timestamp)
+
+  # False when budget, in enrollments, ran out before all the course classes
+  # of the teacher were deleted, the teacher is left for another call
+  def __delete_teacher_by_id(self, teacher_id: int, budget: int | None = None) -> bool:
+    teacher = self.__teachers.get(teacher_id)
+
+    if teacher is None:
+      return True
+
+    for course_class in teacher.course_classes.to_list():
+      if budget is not None:
+        if budget <= 0:
+          return False
+
+        budget -= len(course_class.students) + 1
+
+      self.__delete_course_class_by_id(course_class.id)
+
+    self.__teacher_index.remove(teacher)
+    self.__teachers.remove(teacher_id)
+    self.__teacher_ids.remove(teacher_id)
+    self.__teacher_students.remove_teacher(teacher_id)
+    self.__changed(('teacher', teacher_id), 'teachers')
+    self.__record('delete_teacher', teacher_id)
+
+    return True
+
+  def __update_teacher_by_id(self, teacher_id: int, name: str, birthdate: datetime) -> None:
+    teacher = self.__teachers.get(teacher_id)
+
+    self.__teacher_index.remove(teacher)
+    teacher.name = name
+    teacher.birthdate = birthdate
+    self.__teacher_index.add(teacher)
+    self.__changed(('teacher', teacher_id), 'teachers')
+    self.__record('update_teacher', teacher_id, name, teacher.birthdate_ordinal)
+
+  def __add_course_class(self, course_class: CourseClass) -> None:
+    if course_class.id in self.__course_classes:
+      return
+
+    self.__course_classes.add(course_class.id, course_class)
+    self.__course_class_ids.add(course_class.id)
+    course_class.teacher.add_course_class(course_class)
+    self.__changed(('course_class', course_class.id), ('teacher', course_class.teacher.id), 'course_classes')
+    self.__record('add_course_class', course_class.id, course_class.teacher.id, course_class.created_at_timestamp)
+
+  def __delete_course_class_by_id(self, course_class_id: int) -> None:
+    course_class = self.__course_classes.get(course_class_id)
+
+    if course_class is None:
+      return
+
+    course_class.teacher.remove_course_class_by_id(course_class_id)
+
+    # the reverse links, in O(number of students of the class)
+    for student in course_class.students.values():
+      student.remove_course_class_by_id(course_class_id)
+      self.__teacher_students.remove(course_class.teacher.id, student.id)
+
+      if self.__student_columns is not None:
+        self.__student_columns.add_enrollments(student.id, -1)
+
+      self.__changed(('student', student.id))
+      self.__record('unenroll', student.id, course_class_id, logged=False)
+
+    self.__course_classes.remove(course_class_id)
+    self.__course_class_ids.remove(course_class_id)
+    self.__changed(('course_class', course_class_id), ('teacher', course_class.teacher.id), 'course_classes', 'enrollments')
+    self.__record('delete_course_class', course_class_id)
+
+  def __update_course_class_by_id(self, course_class_id: int, teacher: Teacher) -> None:
+    course_class = self.__course_classes.get(course_class_id)
+    old_teacher = course_class.teacher
+
+    if old_teacher is teacher:
+      return
+
+    old_teacher.remove_course_class_by_id(course_class_id)
+    teacher.add_course_class(course_class)
+
+    for student_id in course_class.students.keys():
+      self.__teacher_students.remove(old_teacher.id, student_id)
+      self.__teacher_students.add(teacher.id, student_id)
+
+    course_class.teacher = teacher
+    self.__changed(('course_class', course_class_id), ('teacher', old_teacher.id), ('teacher', teacher.id), 'course_classes')
+    self.__record('update_course_class', course_class_id, teacher.id)
+
+  def __add_student_to_course_class(self, student: Student, course_class: CourseClass) -> bool:
+    if course_class.id in student.course_classes:
+      return False
+
+    course_class.add_student(student)
+    student.add_course_class(course_class)
+    self.__teacher_students.add(course_class.teacher.id, student.id)
+
+    if self.__student_columns is not None:
+      self.__student_columns.add_enrollments(student.id, 1)
+
+    self.__changed(('student', student.id), ('course_class', course_class.id), ('teacher', course_class.teacher.id), 'enrollments')
+    self.__record('enroll', student.id, course_class.id)
+
+    return True
+
+  def __remove_student_from_course_class(self, student: Student, course_class: CourseClass) -> None:
+    if course_class.id not in student.course_classes:
+      return
+
+    student.remove_course_class_by_id(course_class.id)
+    course_class.remove_student_by_id(student.id)
+    self.__teacher_students.remove(course_class.teacher.id, student.id)
+
+    if self.__student_columns is not None:
+      self.__student_columns.add_enrollments(student.id, -1)
+
+    self.__changed(('student', student.id), ('course_class', course_class.id), ('teacher', course_class.teacher.id), 'enrollments')
+    self.__record('unenroll', student.id, course_class.id)
+
+  def __search(self, elements: HashMap, index: PersonIndex, query: PersonQuery) -> list:
+    ids = index.candidates(query)
+
+    if ids is None:
+      ids = elements.keys()
+
+    return sorted((element for element in map(elements.get, ids) if query.matches(element)), key=lambda element: element.id)
+
+  def __page(self, collection: str, elements: HashMap, index: IdIndex, after: int | None, limit: int) -> list:
+    with self.reading(collection):
+      return [elements.get(id) for id in index.page(after, limit)]
+
+  # walks the index one chunk at a time, so only a chunk of entities is held
+  # at once and the lock is released between chunks
+  def __iter(self, collection: str, elements: HashMap, index: IdIndex, after: int | None) -> Iterator:
+    while True:
+      chunk = self.__page(collection, elements, index, after, self.PAGE_CHUNK_SIZE)
+
+      yield from chunk
+
+      if len(chunk) < self.PAGE_CHUNK_SIZE:
+        return
+
+      after = chunk[-1].id
+
+
+# Read only view of a table with the lookups the controllers make on a
+# HashMap, rows are turned into new entities on every read
+class SqliteTable:
+  def __init__(self, connection, table: str, select: str, hydrate):
+    self.__connection = connection
+    self.__hydrate = hydrate
+    # built once, the same strings hit the statement cache of the connection
+    self.__select_one = f'{select} WHERE {table}.id = ?'
+    self.__select_many = f'{select} WHERE {table}.id IN (SELECT value FROM json_each(?))'
+    self.__select_all = f'{select} ORDER BY {table}.id'
+    self.__exists = f'SELECT 1 FROM {table} WHERE id = ?'
+    self.__count = f'SELECT COUNT(*) FROM {table}'
+
+  @property
+  def size(self) -> int:
+    with self.__connection() as connection:
+      return connection.execute(self.__count).fetchone()[0]
+
+  def get(self, key: int):
+    with self.__connection() as connection:
+      row = connection.execute(self.__select_one, (key,)).fetchone()
+
+    return self.__hydrate(row) if row is not None else None
+
+  def get_many(self, keys: Iterable[int]) -> tuple[list, list[int]]:
+    keys = list(keys)
+
+    with self.__connection() as connection:
+      rows = connection.execute(self.__select_many, (json.dumps(keys),)).fetchall()
+
+    elements = {row[0]: self.__hydrate(row) for row in rows}
+    found = []
+    missing = []
+
+    for key in keys:
+      element = elements.get(key)
+
+      if element is None:
+        missing.append(key)
+      else:
+        found.append(element)
+
+    return found, missing
+
+  def values(self) -> Iterator:
+    with self.__connection() as connection:
+      rows = connection.execute(self.__select_all).fetchall()
+
+    return map(self.__hydrate, rows)
+
+  def __len__(self) -> int:
+    return self.size
+
+  def __contains__(self, key: int) -> bool:
+    with self.__connection() as connection:
+      return connection.execute(self.__exists, (key,)).fetchone() is not None
+
+
+# Same interface as Repository, kept in a SQLite database instead of memory.
+# The data can outgrow the RAM and several worker processes can share it: the
+# database is in WAL mode, so readers don't wait for the writer, and ids are
+# handed out in blocks stored in the database itself
+class SqliteRepository:
+  PAGE_CHUNK_SIZE = 500
+  ID_BLOCK_SIZE = 1000
+  CACHED_STATEMENTS = 256
+  CHANGES_POLL_INTERVAL = 0.05
+
+  SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS students (id INTEGER PRIMARY KEY, name TEXT, birthdate INTEGER, created_at REAL NOT NULL, version INTEGER NOT NULL, folded_name TEXT);
+    CREATE INDEX IF NOT EXISTS students_birthdate ON students (birthdate);
+    DROP INDEX IF EXISTS students_name;
+    CREATE INDEX IF NOT EXISTS students_folded_name ON students (folded_name);
+    CREATE INDEX IF NOT EXISTS students_created_at ON students (created_at);
+    CREATE TABLE IF NOT EXISTS teachers (id INTEGER PRIMARY KEY, name TEXT, birthdate INTEGER, created_at REAL NOT NULL, version INTEGER NOT NULL, folded_name TEXT);
+    CREATE INDEX IF NOT EXISTS teachers_birthdate ON teachers (birthdate);
+    DROP INDEX IF EXISTS teachers_name;
+    CREATE INDEX IF NOT EXISTS teachers_folded_name ON teachers (folded_name);
+    CREATE INDEX IF NOT EXISTS teachers_created_at ON teachers (created_at);
+    CREATE TABLE IF NOT EXISTS course_classes (id INTEGER PRIMARY KEY, teacher_id INTEGER NOT NULL, created_at REAL NOT NULL, version INTEGER NOT NULL);
+    CREATE INDEX IF NOT EXISTS course_classes_teacher_id ON course_classes (teacher_id);
+    CREATE TABLE IF NOT EXISTS enrollments (
+      course_class_id INTEGER NOT NULL,
+      student_id INTEGER NOT NULL,
+      PRIMARY KEY (course_class_id, student_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS enrollments_student_id ON enrollments (student_id);
+    CREATE TABLE IF NOT EXISTS id_sequence (id INTEGER PRIMARY KEY CHECK (id = 0), next_id INTEGER NOT NULL);
+    INSERT OR IGNORE INTO id_sequence VALUES (0, 1);
+    CREATE TABLE IF NOT EXISTS epoch (id INTEGER PRIMARY KEY CHECK (id = 0), value TEXT NOT NULL);
+    INSERT OR IGNORE INTO epoch VALUES (0, lower(hex(randomblob(4))));
+    CREATE TABLE IF NOT EXISTS revisions (collection TEXT PRIMARY KEY, version INTEGER NOT NULL, modified_at REAL NOT NULL);
+    INSERT OR IGNORE INTO revisions SELECT value, 0, (julianday('now') - 2440587.5) * 86400 FROM json_each('["students", "teachers", "course_classes"]');
+    CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, record TEXT NOT NULL);
+    CREATE TRIGGER IF NOT EXISTS students_insert AFTER INSERT ON students BEGIN
+      INSERT INTO changes (record) VALUES (json_array('add_student', NEW.id, NEW.name, NEW.birthdate, NEW.created_at));
+    END;
+    CREATE TRIGGER IF NOT EXISTS students_update AFTER UPDATE ON students BEGIN
+      INSERT INTO changes (record) VALUES (json_array('update_student', NEW.id, NEW.name, NEW.birthdate));
+    END;
+    CREATE TRIGGER IF NOT EXISTS students_delete AFTER DELETE ON students BEGIN
+      INSERT INTO changes (record) VALUES (json_array('delete_student', OLD.id));
+    END;
+    CREATE TRIGGER IF NOT EXISTS teachers_insert AFTER INSERT ON teachers BEGIN
+      INSERT INTO changes (record) VALUES (json_array('add_teacher', NEW.id, NEW.name, NEW.birthdate, NEW.created_at));
+    END;
+    CREATE TRIGGER IF NOT EXISTS teachers_update AFTER UPDATE ON teachers BEGIN
+      INSERT INTO changes (record) VALUES (json_array('update_teacher', NEW.id, NEW.name, NEW.birthdate));
+    END;
+    CREATE TRIGGER IF NOT EXISTS teachers_delete AFTER DELETE ON teachers BEGIN
+      INSERT INTO changes (record) VALUES (json_array('delete_teacher', OLD.id));
+    END;
+    CREATE TRIGGER IF NOT EXISTS course_classes_insert AFTER INSERT ON course_classes BEGIN
+      INSERT INTO changes (record) VALUES (json_array('add_course_class', NEW.id, NEW.teacher_id, NEW.created_at));
+    END;
+    CREATE TRIGGER IF NOT EXISTS course_classes_update AFTER UPDATE ON course_classes BEGIN
+      INSERT INTO changes (record) VALUES (json_array('update_course_class', NEW.id, NEW.teacher_id));
+    END;
+    CREATE TRIGGER IF NOT EXISTS course_classes_delete AFTER DELETE ON course_classes BEGIN
+      INSERT INTO changes (record) VALUES (json_array('delete_course_class', OLD.id));
+    END;
+    CREATE TRIGGER IF NOT EXISTS enrollments_insert AFTER INSERT ON enrollments BEGIN
+      INSERT INTO changes (record) VALUES (json_array('enroll', NEW.student_id, NEW.course_class_id));
+    END;
+    CREATE TRIGGER IF NOT EXISTS enrollments_delete AFTER DELETE ON enrollments BEGIN
+      INSERT INTO changes (record) VALUES (json_array('unenroll', OLD.student_id, OLD.course_class_id));
+    END;
+  '''
+
+  SELECT_STUDENTS = 'SELECT students.id, students.name, students.birthdate, students.created_at, students.version FROM students'
+  SELECT_TEACHERS = 'SELECT teachers.id, teachers.name, teachers.birthdate, teachers.created_at, teachers.version FROM teachers'
+  SELECT_COURSE_CLASSES = (
+    'SELECT course_classes.id, course_classes.created_at, course_classes.version, '
+    'teachers.id, teachers.name, teachers.birthdate, teachers.created_at, teachers.version '
+    'FROM course_classes JOIN teachers ON teachers.id = course_classes.teacher_id'
+  )
+
+  # the version column follows the version of the entities, the rows read
+  # back carry it, so caches keyed by it see changes made by other processes
+  INSERT_STUDENT = 'INSERT OR IGNORE INTO students (id, name, birthdate, created_at, version, folded_name) VALUES (?, ?, ?, ?, ?, ?)'
+  UPDATE_STUDENT = 'UPDATE students SET name = ?, birthdate = ?, folded_name = ?, version = version + 1 WHERE id = ?'
+  DELETE_STUDENT = 'DELETE FROM students WHERE id = ?'
+  DELETE_STUDENT_ENROLLMENTS = 'DELETE FROM enrollments WHERE student_id = ?'
+  INSERT_TEACHER = 'INSERT OR IGNORE INTO teachers (id, name, birthdate, created_at, version, folded_name) VALUES (?, ?, ?, ?, ?, ?)'
+  UPDATE_TEACHER = 'UPDATE teachers SET name = ?, birthdate = ?, folded_name = ?, version = version + 1 WHERE id = ?'
+  DELETE_TEACHER = 'DELETE FROM teachers WHERE id = ?'
+  DELETE_TEACHER_ENROLLMENTS = 'DELETE FROM enrollments WHERE course_class_id IN (SELECT id FROM course_classes WHERE teacher_id = ?)'
+  DELETE_TEACHER_COURSE_CLASSES = 'DELETE FROM course_classes WHERE teacher_id = ?'
+  SELECT_TEACHER_COURSE_CLASS_IDS = 'SELECT id FROM course_classes WHERE teacher_id = ?'
+  INSERT_COURSE_CLASS = 'INSERT OR IGNORE INTO course_classes VALUES (?, ?, ?, ?)'
+  UPDATE_COURSE_CLASS = 'UPDATE course_classes SET teacher_id = ?, version = version + 1 WHERE id = ?'
+  DELETE_COURSE_CLASS = 'DELETE FROM course_classes WHERE id = ?'
+  SELECT_COURSE_CLASS_TEACHER = 'SELECT teacher_id FROM course_classes WHERE id = ?'
+  DELETE_COURSE_CLASS_ENROLLMENTS = 'DELETE FROM enrollments WHERE course_class_id = ?'
+  INSERT_ENROLLMENT = 'INSERT OR IGNORE INTO enrollments VALUES (?, ?)'
+  DELETE_ENROLLMENT = 'DELETE FROM enrollments WHERE course_class_id = ? AND student_id = ?'
+  BUMP_REVISION = 'UPDATE revisions SET version = version + 1, modified_at = ? WHERE collection = ?'
+  SELECT_REVISIONS = 'SELECT collection, version, modified_at FROM revisions'
+  SELECT_EPOCH = 'SELECT value FROM epoch'
+  ALLOCATE_IDS = 'UPDATE id_sequence SET next_id = next_id + ? WHERE id = 0 RETURNING next_id - ?'
+  # the triggers log every row that actually changed, in the transaction
+  # that changed it, whichever process it was
+  SELECT_CHANGES = 'SELECT seq, record FROM changes WHERE seq > ? ORDER BY seq LIMIT ?'
+  SELECT_CHANGE_WINDOW = "SELECT (SELECT MIN(seq) FROM changes), (SELECT seq FROM sqlite_sequence WHERE name = 'changes')"
+  SELECT_LAST_CHANGE = "SELECT seq FROM sqlite_sequence WHERE name = 'changes'"
+  TRIM_CHANGES = 'DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?'
+
+  SELECT_STUDENT_COURSE_CLASSES = f'{SELECT_COURSE_CLASSES} JOIN enrollments ON enrollments.course_class_id = course_classes.id WHERE enrollments.student_id = ? ORDER BY course_classes.id'
+  SELECT_TEACHER_COURSE_CLASSES = f'{SELECT_COURSE_CLASSES} WHERE course_classes.teacher_id = ? ORDER BY course_classes.id'
+  SELECT_COURSE_CLASS_STUDENTS = f'{SELECT_STUDENTS} JOIN enrollments ON enrollments.student_id = students.id WHERE enrollments.course_class_id = ? ORDER BY students.id'
+  SELECT_ENROLLMENT = 'SELECT 1 FROM enrollments WHERE course_class_id = ? AND student_id = ?'
+  SELECT_COURSE_CLASS_STUDENT_IDS = 'SELECT student_id FROM enrollments WHERE course_class_id = ?'
+  SELECT_EXISTING_STUDENT_IDS = 'SELECT id FROM students WHERE id IN (SELECT value FROM json_each(?))'
+  TEACHER_STUDENT_IDS = 'SELECT enrollments.student_id FROM course_classes JOIN enrollments ON enrollments.course_class_id = course_classes.id WHERE course_classes.teacher_id = ?'
+  SELECT_TEACHER_STUDENTS = f'{SELECT_STUDENTS} WHERE students.id IN ({TEACHER_STUDENT_IDS}) ORDER BY students.id'
+  COUNT_TEACHER_STUDENTS = f'SELECT COUNT(DISTINCT student_id) FROM ({TEACHER_STUDENT_IDS})'
+  PAGE_STUDENTS = f'{SELECT_STUDENTS} WHERE students.id > ? ORDER BY students.id LIMIT ?'
+  PAGE_TEACHERS = f'{SELECT_TEACHERS} WHERE teachers.id > ? ORDER BY teachers.id LIMIT ?'
+  PAGE_COURSE_CLASSES = f'{SELECT_COURSE_CLASSES} WHERE course_classes.id > ? ORDER BY course_classes.id LIMIT ?'
+
+  # calendar ages from date keys like in StudentColumns, the birthdate ordinal
+  # is a julian day 1721424.5 days off. Birthdates after today have no age.
+  # The age bounds are turned into birthdate bounds so the birthdate index is
+  # used
+  BIRTHDATE_KEY = "CAST(strftime('%Y%m%d', birthdate + 1721424.5) AS INTEGER)"
+  AGE_HISTOGRAM = f'SELECT (? - {BIRTHDATE_KEY}) / 10000 / ? * ? AS age, COUNT(*) FROM students WHERE birthdate <= ? GROUP BY age ORDER BY age'
+  STUDENT_IDS_BY_BIRTHDATE = 'SELECT id FROM students WHERE birthdate > ? AND birthdate <= ? ORDER BY id'
+  AVERAGE_AGE = f'SELECT AVG((? - {BIRTHDATE_KEY}) / 10000) FROM students WHERE birthdate <= ?'
+  TOTAL_ENROLLMENTS = 'SELECT COUNT(*) FROM enrollments'
+
+  def __init__(self, path: str, change_log_size: int = 100_000):
+    self.__path = path
+    self.__change_log_size = change_log_size
+    # connections waiting to be used, a thread takes one for each call and
+    # gives it back, so there are only as many as threads using them at once
+    self.__idle: list[sqlite3.Connection] = []
+    self.__connections: list[sqlite3.Connection] = []
+    self.__connections_lock = threading.Lock()
+    self.__listeners = []
+    os.register_at_fork(after_in_child=self.__forget_connections)
+
+    with self.__connection() as connection:
+      self.__add_folded_names(connection)
+      connection.executescript(self.SCHEMA)
+      self.__epoch = connection.execute(self.SELECT_EPOCH).fetchone()[0]
+
+    self.__students = SqliteTable(self.__connection, 'students', self.SELECT_STUDENTS, self.__student)
+    self.__teachers = SqliteTable(self.__connection, 'teachers', self.SELECT_TEACHERS, self.__teacher)
+    self.__course_classes = SqliteTable(self.__connection, 'course_classes', self.SELECT_COURSE_CLASSES, self.__course_class)
+
+    # other processes create entities in the same database
+    idGenerator.use(self.__allocate_ids, self.ID_BLOCK_SIZE)
+
+  @property
+  def students(self) -> SqliteTable:
+    return self.__students
+
+  @property
+  def teachers(self) -> SqliteTable:
+    return self.__teachers
+
+  @property
+  def course_classes(self) -> SqliteTable:
+    return self.__course_classes
+
+  @property
+  def student_columns(self) -> None:
+    return None
+
+  # kept in the database, like the versions, the same for all the processes
+  @property
+  def epoch(self) -> str:
+    return self.__epoch
+
+  def revision(self, *collections: str) -> tuple[str, float]:
+    with self.__connection() as connection:
+      rows = {collection: (version, modified_at) for collection, version, modified_at in connection.execute(self.SELECT_REVISIONS)}
+
+    revisions = [rows[name] for name in Repository.LOCK_ORDER if name in collections]
+
+    return '.'.join(str(version) for version, _ in revisions), max(modified_at for _, modified_at in revisions)
+
+  # listener(tags) is called after each mutation is committed, with the same
+  # tags as Repository. Only the changes made by this process are seen
+  def subscribe(self, listener) -> None:
+    self.__listeners.append(listener)
+
+  # the log is kept in the database, these see the changes made by all the
+  # processes, in the order they were committed
+  def changes_since(self, sequence: int, limit: int) -> list[tuple[int, list]] | None:
+    with self.__connection() as connection:
+      # a single read transaction, nothing is trimmed between the statements
+      connection.execute('BEGIN')
+
+      try:
+        first, last = connection.execute(self.SELECT_CHANGE_WINDOW).fetchone()
+
+        if sequence < (first if first is not None else (last or 0) + 1) - 1:
+          return None
+
+        rows = connection.execute(self.SELECT_CHANGES, (sequence, limit)).fetchall()
+      finally:
+        connection.execute('COMMIT')
+
+    return [(seq, json.loads(record)) for seq, record in rows]
+
+  def last_change(self) -> int:
+    with self.__connection() as connection:
+      row = connection.execute(self.SELECT_LAST_CHANGE).fetchone()
+
+    return row[0] if row is not None else 0
+
+  # the other processes can't notify this one, the log is polled
+  def wait_for_changes(self, sequence: int, timeout: float) -> bool:
+    deadline = monotonic() + timeout
+
+    while self.last_change() <= sequence:
+      remaining = deadline - monotonic()
+
+      if remaining <= 0:
+        return False
+
+      sleep(min(self.CHANGES_POLL_INTERVAL, remaining))
+
+    return True
+
+  def add_student(self, student: Student) -> None:
+    self.add_students((student,))
+
+  def delete_student_by_id(self, student_id) -> None:
+    with self.__transaction('students', 'course_classes') as connection:
+      connection.execute(self.DELETE_STUDENT_ENROLLMENTS, (student_id,))
+      connection.execute(self.DELETE_STUDENT, (student_id,))
+
+    self.__changed(('student', student_id), 'students', 'enrollments')
+
+  def update_student_by_id(self, student_id: int, name: str, birthdate: datetime) -> None:
+    with self.__transaction('students') as connection:
+      connection.execute(self.UPDATE_STUDENT, (name, self.__ordinal(birthdate), self.__folded(name), student_id))
+
+    self.__changed(('student', student_id), 'students')
+
+  def add_teacher(self, teacher: Teacher) -> None:
+    self.add_teachers((teacher,))
+
+  # the course classes of the teacher and their enrollments go with it, in
+  # the same transaction: SQLite holds the write lock only for the deletes
+  def delete_teacher_by_id(self, teacher_id) -> None:
+    with self.__transaction('students', 'teachers', 'course_classes') as connection:
+      course_class_ids = [course_class_id for course_class_id, in connection.execute(self.SELECT_TEACHER_COURSE_CLASS_IDS, (teacher_id,))]
+      student_ids = {student_id for student_id, in connection.execute(self.TEACHER_STUDENT_IDS, (teacher_id,))}
+      connection.execute(self.DELETE_TEACHER_ENROLLMENTS, (teacher_id,))
+      connection.execute(self.DELETE_TEACHER_COURSE_CLASSES, (teacher_id,))
+      connection.execute(self.DELETE_TEACHER, (teacher_id,))
+
+    self.__changed(
+      ('teacher', teacher_id), 'teachers',
+      *(('course_class', course_class_id) for course_class_id in course_class_ids),
+      *(('student', student_id) for student_id in student_ids),
+      *(('course_classes', 'enrollments') if course_class_ids else ())
+    )
+
+  def update_teacher_by_id(self, teacher_id: int, name: str, birthdate: datetime) -> None:
+    with self.__transaction('teachers') as connection:
+      connection.execute(self.UPDATE_TEACHER, (name, self.__ordinal(birthdate), self.__folded(name), teacher_id))
+
+    self.__changed(('teacher', teacher_id), 'teachers')
+
+  def add_course_class(self, course_class: CourseClass) -> None:
+    self.add_course_classes((course_class,))
+
+  def delete_course_class_by_id(self, course_class_id) -> None:
+    with self.__transaction('students', 'teachers', 'course_classes') as connection:
+      row = connection.execute(self.SELECT_COURSE_CLASS_TEACHER, (course_class_id,)).fetchone()
+      student_ids = [student_id for student_id, in connection.execute(self.SELECT_COURSE_CLASS_STUDENT_IDS, (course_class_id,))]
+      connection.execute(self.DELETE_COURSE_CLASS_ENROLLMENTS, (course_class_id,))
+      connection.execute(self.DELETE_COURSE_CLASS, (course_class_id,))
+
+    if row is not None:
+      self.__changed(
+        ('course_class', course_class_id), ('teacher', row[0]), 'course_classes', 'enrollments',
+        *(('student', student_id) for student_id in student_ids)
+      )
+
+  def update_course_class_by_id(self, course_class_id: int, teacher: Teacher) -> None:
+    with self.__transaction('teachers', 'course_classes') as connection:
+      row = connection.execute(self.SELECT_COURSE_CLASS_TEACHER, (course_class_id,)).fetchone()
+      connection.execute(self.UPDATE_COURSE_CLASS, (teacher.id, course_class_id))
+
+    if row is not None:
+      self.__changed(('course_class', course_class_id), ('teacher', row[0]), ('teacher', teacher.id), 'course_classes')
+
+  def add_student_to_course_class(self, student: Student, course_class: CourseClass) -> None:
+    self.add_students_to_course_classes(((student, course_class),))
+
+  def remove_student_from_course_class(self, student: Student, course_class: CourseClass) -> None:
+    with self.__transaction('students', 'course_classes') as connection:
+      connection.execute(self.DELETE_ENROLLMENT, (course_class.id, student.id))
+
+    self.__changed(('student', student.id), ('course_class', course_class.id), ('teacher', course_class.teacher.id), 'enrollments')
+
+  def add_students(self, students: Iterable[Student]) -> None:
+    with self.__transaction('students') as connection:
+      connection.executemany(self.INSERT_STUDENT, (
+        (student.id, student.name, student.birthdate_ordinal, student.created_at_timestamp, student.version, self.__folded(student.name))
+        for student in students
+      ))
+
+    self.__changed('students')
+
+  def add_teachers(self, teachers: Iterable[Teacher]) -> None:
+    with self.__transaction('teachers') as connection:
+      connection.executemany(self.INSERT_TEACHER, (
+        (teacher.id, teacher.name, teacher.birthdate_ordinal, teacher.created_at_timestamp, teacher.version, self.__folded(teacher.name))
+        for teacher in teachers
+      ))
+
+    self.__changed('teachers')
+
+  def add_course_classes(self, course_classes: Iterable[CourseClass]) -> None:
+    course_classes = list(course_classes)
+
+    with self.__transaction('teachers', 'course_classes') as connection:
+      connection.executemany(self.INSERT_COURSE_CLASS, (
+        (course_class.id, course_class.teacher.id, course_class.created_at_timestamp, course_class.version) for course_class in course_classes
+      ))
+
+    self.__changed('course_classes', *(
+      tag for course_class in course_classes for tag in (('course_class', course_class.id), ('teacher', course_class.teacher.id))
+    ))
+
+  def update_course_class_students(self, course_class_id: int, student_ids: Iterable[int], replace: bool = False) -> dict[str, list[int]] | None:
+    student_ids = list(student_ids)
+
+    with self.__transaction('students', 'course_classes') as connection:
+      row = connection.execute(self.SELECT_COURSE_CLASS_TEACHER, (course_class_id,)).fetchone()
+
+      if row is None:
+        return None
+
+      enrolled = {student_id for student_id, in connection.execute(self.SELECT_COURSE_CLASS_STUDENT_IDS, (course_class_id,))}
+      found = {student_id for student_id, in connection.execute(self.SELECT_EXISTING_STUDENT_IDS, (json.dumps(student_ids),))}
+      result = {
+        "added": [id for id in student_ids if id in found and id not in enrolled],
+        "present": [id for id in student_ids if id in enrolled],
+        "missing": [id for id in student_ids if id not in found],
+      }
+      connection.executemany(self.INSERT_ENROLLMENT, ((course_class_id, student_id) for student_id in result['added']))
+
+      if replace:
+        result['removed'] = sorted(enrolled.difference(student_ids))
+        connection.executemany(self.DELETE_ENROLLMENT, ((course_class_id, student_id) for student_id in result['removed']))
+
+    changed = result['added'] + result.get('removed', [])
+
+    if changed:
+      self.__changed('enrollments', ('course_class', course_class_id), ('teacher', row[0]), *(('student', id) for id in changed))
+
+    return result
+
+  def add_students_to_course_classes(self, enrollments: Iterable[tuple[Student, CourseClass]]) -> int:
+    enrollments = list(enrollments)
+
+    with self.__transaction('students', 'course_classes') as connection:
+      # the rows ignored as already there aren't counted
+      added = connection.executemany(self.INSERT_ENROLLMENT, (
+        (course_class.id, student.id) for student, course_class in enrollments
+      )).rowcount
+
+    self.__changed('enrollments', *(
+      tag for student, course_class in enrollments
+      for tag in (('student', student.id), ('course_class', course_class.id), ('teacher', course_class.teacher.id))
+    ))
+
+    return added
+
+  def get_student_course_classes(self, student: Student) -> list[CourseClass]:
+    return self.__select(self.SELECT_STUDENT_COURSE_CLASSES, (student.id,), self.__course_class)
+
+  def get_teacher_course_classes(self, teacher: Teacher) -> list[CourseClass]:
+    return self.__select(self.SELECT_TEACHER_COURSE_CLASSES, (teacher.id,), self.__course_class)
+
+  def get_course_class_students(self, course_class: CourseClass) -> list[Student]:
+    return self.__select(self.SELECT_COURSE_CLASS_STUDENTS, (course_class.id,), self.__student)
+
+  def is_student_in_course_class(self, student_id: int, course_class_id: int) -> bool:
+    with self.__connection() as connection:
+      return connection.execute(self.SELECT_ENROLLMENT, (course_class_id, student_id)).fetchone() is not None
+
+  def get_teacher_students(self, teacher_id: int) -> list[Student]:
+    return self.__select(self.SELECT_TEACHER_STUDENTS, (teacher_id,), self.__student)
+
+  def count_teacher_students(self, teacher_id: int) -> int:
+    with self.__connection() as connection:
+      return connection.execute(self.COUNT_TEACHER_STUDENTS, (teacher_id,)).fetchone()[0]
+
+  def search_students(self, query: PersonQuery) -> list[Student]:
+    return self.__search(self.SELECT_STUDENTS, 'students', query, self.__student)
+
+  def search_teachers(self, query: PersonQuery) -> list[Teacher]:
+    return self.__search(self.SELECT_TEACHERS, 'teachers', query, self.__teacher)
+
+  def page_students(self, after: int | None, limit: int) -> list[Student]:
+    return self.__select(self.PAGE_STUDENTS, (after or 0, limit), self.__student)
+
+  def page_teachers(self, after: int | None, limit: int) -> list[Teacher]:
+    return self.__select(self.PAGE_TEACHERS, (after or 0, limit), self.__teacher)
+
+  def page_course_classes(self, after: int | None, limit: int) -> list[CourseClass]:
+    return self.__select(self.PAGE_COURSE_CLASSES, (after or 0, limit), self.__course_class)
+
+  def iter_students(self, after: int | None = None) -> Iterator[Student]:
+    return self.__iter(self.page_students, after)
+
+  def iter_teachers(self, after: int | None = None) -> Iterator[Teacher]:
+    return self.__iter(self.page_teachers, after)
+
+  def iter_course_classes(self, after: int | None = None) -> Iterator[CourseClass]:
+    return self.__iter(self.page_course_classes, after)
+
+  def age_histogram(self, bucket: int) -> dict[int, int]:
+    today = clock.today
+
+    with self.__connection() as connection:
+      rows = connection.execute(self.AGE_HISTOGRAM, (date_key(today), bucket, bucket, today.toordinal())).fetchall()
+
+    return dict(rows)
+
+  def students_by_age(self, older_than: int | None = None, younger_than: int | None = None) -> list[int]:
+    today = clock.today
+    # age > older_than <=> birthdate <= latest_birthdate(today, older_than + 1)
+    # age < younger_than <=> birthdate > latest_birthdate(today, younger_than)
+    latest = latest_birthdate(today, older_than + 1) if older_than is not None else today.toordinal()
+    earliest = latest_birthdate(today, younger_than) if younger_than is not None else 0
+
+    with self.__connection() as connection:
+      return [row[0] for row in connection.execute(self.STUDENT_IDS_BY_BIRTHDATE, (earliest, latest))]
+
+  def average_age(self) -> float | None:
+    today = clock.today
+
+    with self.__connection() as connection:
+      return connection.execute(self.AVERAGE_AGE, (date_key(today), today.toordinal())).fetchone()[0]
+
+  def total_enrollments(self) -> int:
+    with self.__connection() as connection:
+      return connection.execute(self.TOTAL_ENROLLMENTS).fetchone()[0]
+
+  # every change is already on disk once its transaction commits
+  def snapshot(self) -> None:
+    pass
+
+  def close(self) -> None:
+    with self.__connections_lock:
+      for connection in self.__connections:
+        connection.close()
+
+      self.__connections.clear()
+      self.__idle.clear()
+
+  # SQLite connections must not be used across a fork, a forked process opens
+  # its own. The inherited ones are kept open, closing them here would act on
+  # the database files the parent is still using
+  def __forget_connections(self) -> None:
+    self.__inherited = self.__connections
+    self.__idle = []
+    self.__connections = []
+    self.__connections_lock = threading.Lock()
+
+  @contextmanager
+  def __connection(self):
+    try:
+      connection = self.__idle.pop()
+    except IndexError:
+      connection = self.__connect()
+
+    try:
+      yield connection
+    finally:
+      self.__idle.append(connection)
+
+  def __connect(self) -> sqlite3.Connection:
+    # in autocommit mode, the transactions are started by __transaction
+    connection = sqlite3.connect(
+      self.__path,
+      timeout=30,
+      isolation_level=None,
+      check_same_thread=False,
+      cached_statements=self.CACHED_STATEMENTS
+    )
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+
+    with self.__connections_lock:
+      self.__connections.append(connection)
+
+    return connection
+
+  # the write lock of the database is taken up front, a transaction that
+  # reads before writing can't fail midway because another one wrote first.
+  # The revisions of the collections it changes are bumped in it as well
+  @contextmanager
+  def __transaction(self, *collections: str):
+    with self.__connection() as connection:
+      connection.execute('BEGIN IMMEDIATE')
+
+      try:
+        yield connection
+        modified_at = datetime.now().timestamp()
+        connection.executemany(self.BUMP_REVISION, ((modified_at, name) for name in collections))
+
+        if collections:
+          connection.execute(self.TRIM_CHANGES, (self.__change_log_size,))
+      except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+
+      connection.execute('COMMIT')
+
+  def __changed(self, *tags) -> None:
+    changes = set(tags)
+
+    for listener in self.__listeners:
+      listener(changes)
+
+  @staticmethod
+  def __folded(name: str | None) -> str | None:
+    return name.casefold() if name is not None else None
+
+  # databases created before folded_name get the column, filled once. The
+  # update triggers log the fill as changes, they are dropped again
+  def __add_folded_names(self, connection: sqlite3.Connection) -> None:
+    connection.execute('BEGIN IMMEDIATE')
+
+    try:
+      self.__fill_folded_names(connection)
+    except BaseException:
+      connection.execute('ROLLBACK')
+      raise
+
+    connection.execute('COMMIT')
+
+  def __fill_folded_names(self, connection: sqlite3.Connection) -> None:
+    has_changes = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'changes'").fetchone()
+    last_change = connection.execute(f'SELECT COALESCE(({self.SELECT_LAST_CHANGE}), 0)').fetchone()[0] if has_changes else 0
+
+    for table in ('students', 'teachers'):
+      columns = {row[1] for row in connection.execute(f'PRAGMA table_info({table})')}
+
+      if not columns or 'folded_name' in columns:
+        continue
+
+      connection.execute(f'ALTER TABLE {table} ADD COLUMN folded_name TEXT')
+      rows = connection.execute(f'SELECT id, name FROM {table}').fetchall()
+      connection.executemany(f'UPDATE {table} SET folded_name = ? WHERE id = ?', ((self.__folded(name), id) for id, name in rows))
+
+    if has_changes:
+      connection.execute('DELETE FROM changes WHERE seq > ?', (last_change,))
+      connection.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'changes'", (last_change,))
+
+  def __allocate_ids(self, block: int) -> int:
+    with self.__transaction() as connection:
+      return connection.execute(self.ALLOCATE_IDS, (block, block)).fetchone()[0]
+
+  def __select(self, statement: str, parameters: tuple, hydrate) -> list:
+    with self.__connection() as connection:
+      rows = connection.execute(statement, parameters).fetchall()
+
+    return [hydrate(row) for row in rows]
+
+  # one statement per combination of filters, each one is cached once.
+  # Names are compared casefolded like in PersonIndex, NOCASE would only fold
+  # the ASCII letters
+  def __search(self, select: str, table: str, query: PersonQuery, hydrate) -> list:
+    conditions = []
+    parameters = []
+
+    if query.name is not None:
+      conditions.append(f'{table}.folded_name BETWEEN ? AND ?')
+      parameters.extend(query.name_range)
+    if query.earliest_birthdate is not None:
+      conditions.append(f'{table}.birthdate >= ?')
+      parameters.append(query.earliest_birthdate)
+    if query.latest_birthdate is not None:
+      conditions.append(f'{table}.birthdate <= ?')
+      parameters.append(query.latest_birthdate)
+    if query.created_since is not None:
+      conditions.append(f'{table}.created_at >= ?')
+      parameters.append(query.created_since)
+
+    where = ' AND '.join(conditions) or '1'
+
+    return self.__select(f'{select} WHERE {where} ORDER BY {table}.id', tuple(parameters), hydrate)
+
+  def __iter(self, page, after: int | None) -> Iterator:
+    while True:
+      chunk = page(after, self.PAGE_CHUNK_SIZE)
+
+      yield from chunk
+
+      if len(chunk) < self.PAGE_CHUNK_SIZE:
+        return
+
+      after = chunk[-1].id
+
+  def __student(self, row: tuple) -> Student:
+    id, name, birthdate, created_at, version = row
+
+    return Student(name, self.__from_ordinal(birthdate), id=id, created_at=created_at, version=version)
+
+  def __teacher(self, row: tuple) -> Teacher:
+    id, name, birthdate, created_at, version = row
+
+    return Teacher(name, self.__from_ordinal(birthdate), id=id, created_at=created_at, version=version)
+
+  def __course_class(self, row: tuple) -> CourseClass:
+    return CourseClass(self.__teacher(row[3:]), id=row[0], created_at=row[1], version=row[2])
+
+  def __ordinal(self, birthdate: datetime | None) -> int | None:
+    return birthdate.toordinal() if isinstance(birthdate, datetime) else None
+
+  def __from_ordinal(self, ordinal: int | None) -> datetime | None:
+    return datetime.fromordinal(ordinal) if ordinal is not None else None
+
+
+def create_repository() -> Repository | SqliteRepository:
+  change_log_size = int(os.environ.get('SCHOOL_CHANGES_SIZE', 100_000))
+
+  if os.environ.get('SCHOOL_STORAGE', 'memory') == 'sqlite':
+    return SqliteRepository(os.environ.get('SCHOOL_SQLITE_PATH', 'school.db'), change_log_size)
+
+  data_directory = os.environ.get('SCHOOL_DATA_DIR')
+
+  if not data_directory:
+    return Repository(change_log_size=change_log_size)
+
+  return Repository(persistence=WriteAheadLog(
+    data_directory,
+    sync=os.environ.get('SCHOOL_WAL_SYNC', 'group'),
+    snapshot_every=int(os.environ.get('SCHOOL_SNAPSHOT_EVERY', 100_000))
+  ), change_log_size=change_log_size)
+
+
+repository = create_repository()
+
+
+"""
+CONTROLLERS -> Classes that will deal with the HTTP request
+"""
+
+
+class BaseController[Model](ABC):
+  def __init__(self):
+    self._repository = repository
+
+  @abstractmethod
+  def get_all(self) -> Iterable[Model]:
+    pass
+
+  @abstractmethod
+  def get_page(self, after: int | None, limit: int) -> list[Model]:
+    pass
+
+  @abstractmethod
+  def iter_all(self, after: int | None = None) -> Iterator[Model]:
+    pass
+
+  @abstractmethod
+  def get_by_id(self, id: int) -> Model:
+    pass
+
+  @abstractmethod
+  def get_many(self, ids: Iterable[int]) -> tuple[list[Model], list[int]]:
+    pass
+
+  @abstractmethod
+  def delete_by_id(self, id: int) -> None:
+    pass
+
+  @abstractmethod
+  # TODO: find a way to type the data
+  def update_by_id(self, id: int, *data) -> None:
+    pass
+
+  @abstractmethod
+  def create(self, data: Model) -> int:
+    pass
+
+
+class StudentController(BaseController[Student]):
+  def __init__(self):
+    super().__init__()
+  
+  def get_all(self):
+    return self._repository.iter_students()
+
+  def get_page(self, after: int | None, limit: int):
+    return self._repository.page_students(after, limit)
+
+  def iter_all(self, after: int | None = None):
+    return self._repository.iter_students(after)
+
+  def get_many(self, ids: Iterable[int]):
+    return self._repository.students.get_many(ids)
+
+  def get_by_id(self, id: int):
+    student = self.__validate_student_existence_and_return(id)
+
+    return student
+  
+  def delete_by_id(self, id: int):
+    self.__validate_student_existence_and_return(id)
+
+    self._repository.delete_student_by_id(id)
+
+  def update_by_id(self, id: int, name: str, birthdate: datetime):
+    self.__validate_student_existence_and_return(id)
+
+    self._repository.update_student_by_id(id, name, birthdate)
+  
+  def create(self, data):
+    if not isinstance(data, Student):
+      raise Exception('Dados incorretos')
+
+    self._repository.add_student(data)
+
+    return data.id
+  
+  def search(self, query: PersonQuery) -> list[Student]:
+    return self._repository.search_students(query)
+
+  def get_course_classes_by_student_id(self, id: int) -> dict:
+    student = self.__validate_student_existence_and_return(id)
+
+    return {
+      "student": {
+        "name": student.name,
+        "age": student.age
+      },
+      "course_classes": [serialize_course_class(course_class) for course_class in self._repository.get_student_course_classes(student)]
+    }
+  
+  def __validate_student_existence_and_return(self, id: int) -> Student:
+    student = self._repository.students.get(id)
+
+    if student is None:
+      raise Exception('Aluno não encontrado')
+    
+    return student
+
+
+class TeacherController(BaseController[Teacher]):
+  def __init__(self):
+    super().__init__()
+
+  def get_all(self):
+    return self._repository.iter_teachers()
+
+  def get_page(self, after: int | None, limit: int):
+    return self._repository.page_teachers(after, limit)
+
+  def iter_all(self, after: int | None = None):
+    return self._repository.iter_teachers(after)
+
+  def get_many(self, ids: Iterable[int]):
+    return self._repository.teachers.get_many(ids)
+
+  def get_by_id(self, id: int):
+    teacher = self.__validate_teacher_existence_and_return(id)
+
+    return teacher
+  
+  def delete_by_id(self, id: int):
+    self.__validate_teacher_existence_and_return(id)
+
+    self._repository.delete_teacher_by_id(id)
+
+  def update_by_id(self, id: int, name: str, birthdate: datetime):
+    self.__validate_teacher_existence_and_return(id)
+
+    self._repository.update_teacher_by_id(id, name, birthdate)
+  
+  def create(self, data):
+    if not isinstance(data, Teacher):
+      raise Exception('Dados incorretos')
+
+    self._repository.add_teacher(data)
+
+    return data.id
+  
+  def search(self, query: PersonQuery) -> list[Teacher]:
+    return self._repository.search_teachers(query)
+
+  def get_course_classes_by_teacher_id(self, id: int) -> dict:
+    teacher = self.__validate_teacher_existence_and_return(id)
+
+    return {
+      "teacher": {
+        "name": teacher.name,
+        "age": teacher.age
+      },
+      "course_classes": [serialize_course_class(course_class) for course_class in self._repository.get_teacher_course_classes(teacher)]
+    }
+  
+  def get_teacher_students_by_id(self, id: int) -> list[Student]:
+    self.__validate_teacher_existence_and_return(id)
+
+    return self._repository.get_teacher_students(id)
+
+  def count_teacher_students_by_id(self, id: int) -> int:
+    self.__validate_teacher_existence_and_return(id)
+
+    return self._repository.count_teacher_students(id)
+
+  def __validate_teacher_existence_and_return(self, id) -> Teacher:
+    teacher = self._repository.teachers.get(id)
+
+    if teacher is None:
+      raise Exception('Professor não encontrado')
+    
+    return teacher
+  
+
+class CourseClassController(BaseController[CourseClass]):
+  def __init__(self):
+    super().__init__()
+
+  def get_all(self):
+    return self._repository.iter_course_classes()
+
+  def get_page(self, after: int | None, limit: int):
+    return self._repository.page_course_classes(after, limit)
+
+  def iter_all(self, after: int | None = None):
+    return self._repository.iter_course_classes(after)
+
+  def get_many(self, ids: Iterable[int]):
+    return self._repository.course_classes.get_many(ids)
+
+  def get_by_id(self, id: int):
+    course_class = self.__validate_course_class_existence_and_return(id)
+
+    return course_class
+  
+  def delete_by_id(self, id: int):
+    exist = self.__validate_course_class_existence_and_return(id)
+
+    if exist is None:
+        return "Course class not found", 404
+
+    self._repository.delete_course_class_by_id(id)
+
+    return "Deleted course class successfully", 200
+
+  def update_by_id(self, id: int, teacher_id: int):
+    self.__validate_course_class_existence_and_return(id)
+
+    teacher = self._repository.teachers.get(teacher_id)
+
+    if teacher is None:
+      raise Exception('Professor não encontrado')
+
+    self._repository.update_course_class_by_id(id, teacher)
+  
+  def create(self, teacher_id):
+    teacher = self._repository.teachers.get(teacher_id)
+
+    if teacher is None:
+        return 
+
+    course_class = CourseClass(teacher)
+
+    self._repository.add_course_class(course_class)
+
+    return course_class.id
+  
+  def get_students_by_course_class_id(self, id: int) -> dict:
+    course_class = self.__validate_course_class_existence_and_return(id)
+
+    return {
+      "teacher": {
+        "id": course_class.teacher.id,
+        "name": course_class.teacher.name,
+      },
+      "students": [serialize_teacher(student) for student in self._repository.get_course_class_students(course_class)]
+    }
+  
+  def remove_student_from_course_class(self, course_class_id: int, student_id: int) -> None:
+    course_class = self.__validate_course_class_existence_and_return(course_class_id)
+    student: Student = self._repository.students.get(student_id)
+
+    if student is None or not self._repository.is_student_in_course_class(student_id, course_class.id):
+      raise Exception('Aluno não encontrado')
+    
+    self._repository.remove_student_from_course_class(student, course_class)
+
+  def add_student_to_course_class(self, course_class_id: int, student_id: int) -> None:
+    course_class = self.__validate_course_class_existence_and_return(course_class_id)
+
+    if course_class is None:
+        return "Turma não encontrada", 404
+
+    student: Student = self._repository.students.get(student_id)
+
+    if student is None:
+      return 'Aluno não encontrado', 404
+    
+    self._repository.add_student_to_course_class(student, course_class)
+
+    return "Aluno adicionado com sucesso", 201
+  
+  def enroll_students(self, course_class_id: int, student_ids: list[int]) -> dict[str, list[int]]:
+    return self.__update_students(course_class_id, student_ids, replace=False)
+
+  def replace_students(self, course_class_id: int, student_ids: list[int]) -> dict[str, list[int]]:
+    return self.__update_students(course_class_id, student_ids, replace=True)
+
+  def __update_students(self, course_class_id: int, student_ids: list[int], replace: bool) -> dict[str, list[int]]:
+    result = self._repository.update_course_class_students(course_class_id, student_ids, replace)
+
+    if result is None:
+      raise Exception('Turma não encontrada')
+
+    return result
+
+  def __validate_course_class_existence_and_return(self, id: int) -> CourseClass:
+    course_class = self._repository.course_classes.get(id)
+
+    return course_class
+
+
+class StatsController:
+  def __init__(self):
+    self._repository = repository
+
+  def get_age_histogram(self, bucket: int) -> list[dict]:
+    histogram = self._repository.age_histogram(bucket)
+
+    return [{"from": age, "to": age + bucket - 1, "count": count} for age, count in histogram.items()]
+
+  def get_students_by_age(self, older_than: int | None = None, younger_than: int | None = None) -> list[int]:
+    return self._repository.students_by_age(older_than, younger_than)
+
+  def get_average_class_size(self) -> dict:
+    return self.__class_size(self._repository.total_enrollments())
+
+  def get_summary(self) -> dict:
+    return {
+      "students": self._repository.students.size,
+      "teachers": self._repository.teachers.size,
+      "course_classes": self._repository.course_classes.size,
+      "average_age": self._repository.average_age(),
+      "average_class_size": self.__class_size(self._repository.total_enrollments())["average_size"]
+    }
+
+  def __class_size(self, enrollments: int) -> dict:
+    course_classes = self._repository.course_classes.size
+
+    return {
+      "course_classes": course_classes,
+      "enrollments": enrollments,
+      "average_size": enrollments / course_classes if course_classes else 0
+    }
+
+
+class RevisionController:
+  def __init__(self):
+    self._repository = repository
+
+  # tag and last modification time of a response built from the collections
+  def get_revision(self, *collections: str) -> tuple[str, float]:
+    version, modified_at = self._repository.revision(*collections)
+
+    return f'{self._repository.epoch}-{version}', modified_at
+
+  # same for a single entity, the tag only changes with the entity itself (and
+  # the teacher of a course class, which goes in its representation)
+  def get_entity_revision(self, collection: str, id: int) -> tuple[str, float] | None:
+    entity = getattr(self._repository, collection).get(id)
+
+    if entity is None:
+      return None
+
+    tag = f'{self._repository.epoch}-{entity.id}.{entity.version}'
+
+    if isinstance(entity, CourseClass):
+      _, modified_at = self._repository.revision('teachers', 'course_classes')
+
+      return f'{tag}-{entity.teacher.id}.{entity.teacher.version}', modified_at
+
+    _, modified_at = self._repository.revision(collection)
+
+    return tag, modified_at
+
+
+class ChangeController:
+  # record of the log -> what changed and the names of its arguments
+  OPERATIONS = {
+    'add_student': ('create', 'student', ('id', 'name', 'birthdate', 'created_at')),
+    'update_student': ('update', 'student', ('id', 'name', 'birthdate')),
+    'delete_student': ('delete', 'student', ('id',)),
+    'add_teacher': ('create', 'teacher', ('id', 'name', 'birthdate', 'created_at')),
+    'update_teacher': ('update', 'teacher', ('id', 'name', 'birthdate')),
+    'delete_teacher': ('delete', 'teacher', ('id',)),
+    'add_course_class': ('create', 'course_class', ('id', 'teacher_id', 'created_at')),
+    'update_course_class': ('update', 'course_class', ('id', 'teacher_id')),
+    'delete_course_class': ('delete', 'course_class', ('id',)),
+    'enroll': ('create', 'enrollment', ('student_id', 'course_class_id')),
+    'unenroll': ('delete', 'enrollment', ('student_id', 'course_class_id')),
+  }
+
+  def __init__(self):
+    self._repository = repository
+
+  @property
+  def epoch(self) -> str:
+    return self._repository.epoch
+
+  def last_change(self) -> int:
+    return self._repository.last_change()
+
+  # up to limit changes after since, None when the oldest of them were
+  # already dropped from the log. last_seq is the since of the next call
+  def get_changes(self, since: int, limit: int) -> dict | None:
+    changes = self._repository.changes_since(since, limit)
+
+    if changes is None:
+      return None
+
+    return {
+      "epoch": self._repository.epoch,
+      "changes": [self.__serialize(sequence, record) for sequence, record in changes],
+      "last_seq": changes[-1][0] if changes else since,
+      "has_more": len(changes) == limit
+    }
+
+  def wait_for_changes(self, since: int, timeout: float) -> bool:
+    return self._repository.wait_for_changes(since, timeout)
+
+  def __serialize(self, sequence: int, record: list) -> dict:
+    operation, *arguments = record
+    op, type, fields = self.OPERATIONS[operation]
+    change = {"seq": sequence, "op": op, "type": type, **dict(zip(fields, arguments))}
+
+    if change.get('birthdate') is not None:
+      change['birthdate'] = date.fromordinal(change['birthdate']).isoformat()
+
+    if 'created_at' in change:
+      change['created_at'] = http_date(datetime.fromtimestamp(change['created_at']))
+
+    return change
+
+
+class BulkController:
+  BATCH_SIZE = 1000
+  COUNTERS = {"student": "students", "teacher": "teachers", "course_class": "course_classes", "enrollment": "enrollments"}
+
+  def __init__(self):
+    self._repository = repository
+
+  # rows are validated as they are read and created in batches, a row that
+  # fails validation is reported and skipped without stopping the import
+  def import_rows(self, rows: Iterable[tuple[int, dict | None]]) -> dict:
+    declared_refs: dict[str, str] = {}
+    refs: dict[str, Entity] = {}
+    created = dict.fromkeys(self.COUNTERS.values(), 0)
+    errors = []
+    batch = []
+
+    for line, row in rows:
+      try:
+        batch.append(self.__validate(row, declared_refs))
+      except ValueError as e:
+        errors.append({"line": line, "error": str(e)})
+        continue
+
+      if len(batch) == self.BATCH_SIZE:
+        self.__create(batch, refs, created)
+        batch = []
+
+    self.__create(batch, refs, created)
+
+    return {
+      "created": created,
+      "refs": {ref: entity.id for ref, entity in refs.items()},
+      "errors": errors
+    }
+
+  def __validate(self, row: dict | None, declared_refs: dict[str, str]) -> tuple:
+    if not isinstance(row, dict):
+      raise ValueError('Row must be a JSON object')
+
+    type = row.get('type')
+    ref = row.get('ref')
+
+    if type not in self.COUNTERS:
+      raise ValueError(f'Unknown type: {type}')
+
+    if ref is not None and ref in declared_refs:
+      raise ValueError(f'Duplicated ref: {ref}')
+
+    if type in ('student', 'teacher'):
+      values = PERSON_SCHEMA.validate(row)
+      entry = (type, ref, values['name'], values['birthdate'])
+    elif type == 'course_class':
+      entry = (type, ref, self.__reference(row, 'teacher', declared_refs))
+    else:
+      entry = (
+        type,
+        None,
+        self.__reference(row, 'student', declared_refs),
+        self.__reference(row, 'course_class', declared_refs)
+      )
+
+    if ref is not None and type != 'enrollment':
+      declared_refs[ref] = type
+
+    return entry
+
+  # an entity is referenced either by the id of an existing one (<type>_id)
+  # or by the ref of a row earlier in the same import (<type>_ref)
+  def __reference(self, row: dict, type: str, declared_refs: dict[str, str]) -> tuple[str, int | str]:
+    if row.get(f'{type}_ref') is not None:
+      ref = row[f'{type}_ref']
+
+      if declared_refs.get(ref) != type:
+        raise ValueError(f'Unknown {type} ref: {ref}')
+
+      return 'ref', ref
+
+    try:
+      id = int(row[f'{type}_id'])
+    except (KeyError, TypeError, ValueError):
+      raise ValueError(f'Missing required field: {type}_id or {type}_ref')
+
+    if self.__existing(type).get(id) is None:
+      raise ValueError(f'{type} {id} not found')
+
+    return 'id', id
+
+  def __existing(self, type: str) -> HashMap:
+    return getattr(self._repository, self.COUNTERS[type])
+
+  def __resolve(self, type: str, reference: tuple[str, int | str], refs: dict[str, Entity]) -> Entity:
+    kind, key = reference
+
+    return refs[key] if kind == 'ref' else self.__existing(type).get(key)
+
+  def __create(self, batch: list[tuple], refs: dict[str, Entity], created: dict[str, int]) -> None:
+    teachers, students, course_classes, enrollments = [], [], [], []
+
+    for entry in batch:
+      type, ref = entry[0], entry[1]
+
+      if type == 'teacher':
+        entity = Teacher(name=entry[2], birthdate=entry[3])
+        teachers.append(entity)
+      elif type == 'student':
+        entity = Student(name=entry[2], birthdate=entry[3])
+        students.append(entity)
+      elif type == 'course_class':
+        entity = CourseClass(self.__resolve('teacher', entry[2], refs))
+        course_classes.append(entity)
+      else:
+        enrollments.append((self.__resolve('student', entry[2], refs), self.__resolve('course_class', entry[3], refs)))
+        continue
+
+      if ref is not None:
+        refs[ref] = entity
+
+    # rows only reference rows before them, so creating by dependency order is enough
+    self._repository.add_teachers(teachers)
+    self._repository.add_students(students)
+    self._repository.add_course_classes(course_classes)
+    # an enrollment that was already there isn't created again
+    created['enrollments'] += self._repository.add_students_to_course_classes(enrollments)
+
+    created['teachers'] += len(teachers)
+    created['students'] += len(students)
+    created['course_classes'] += len(course_classes)
+
+
+"""
+ROUTES -> Definition of the routes pointing to each specific controller
+"""
+app = Flask(__name__)
+app.json = FastJSONProvider(app)
+student_controller = StudentController()
+teacher_controller = TeacherController()
+course_class_controller = CourseClassController()
+stats_controller = StatsController()
+bulk_controller = BulkController()
+revision_controller = RevisionController()
+change_controller = ChangeController()
+response_cache = ResponseCache(
+    max_size=int(os.environ.get('SCHOOL_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('SCHOOL_CACHE_TTL', 60))
+)
+repository.subscribe(response_cache.invalidate)
+metrics = Metrics()
+profiler = SlowRequestProfiler(
+    sample_rate=float(os.environ.get('SCHOOL_PROFILE_SAMPLE', 0)),
+    keep=int(os.environ.get('SCHOOL_PROFILE_KEEP', 10))
+)
+
+for controller in (student_controller, teacher_controller, course_class_controller, stats_controller, bulk_controller, revision_controller):
+    metrics.instrument(controller, 'controller')
+
+# the long polls would swamp the histograms of wait_for_changes
+metrics.instrument(change_controller, 'controller', exclude=('wait_for_changes',))
+
+# reading and writing only hand out the locks
+metrics.instrument(repository, 'repository', exclude=('reading', 'writing', 'subscribe', 'wait_for_changes'))
+# not encode, it runs once per cached fragment
+metrics.instrument(app.json, 'serialization', names=('dumps', 'loads', 'response'))
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+NDJSON_CHUNK_ROWS = 500
+MAX_BATCH_IDS = 1000
+SEARCH_ARGS = ('name', 'min_age', 'max_age', 'created_since')
+# the long polls of /changes wait up to this many seconds, the event streams
+# end after CHANGES_STREAM_SECONDS and the client reconnects
+CHANGES_MAX_WAIT = 30
+CHANGES_KEEP_ALIVE = 15
+CHANGES_STREAM_SECONDS = float(os.environ.get('SCHOOL_CHANGES_STREAM_SECONDS', 300))
+# set when the server starts to shut down, the event streams end then
+stopping = threading.Event()
+# environ key of a threading.Event a server sets when the client went away
+# (the ASGI adapter does), so a stream doesn't hold its thread until it ends
+DISCONNECTED_KEY = 'school.disconnected'
+# smaller bodies aren't worth the time, and may even grow
+COMPRESS_MIN_SIZE = int(os.environ.get('SCHOOL_COMPRESS_MIN_SIZE', 1024))
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'application/msgpack', 'text/plain'}
+# fast settings, the bodies are compressed on every cache miss
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+# in order of preference, when the client accepts both alike
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+# the listings as plain rows, for MessagePack, and as one list per field
+# for ?layout=columns, where the keys aren't repeated on every row
+LISTING_ROWS = {"students": serialize_student, "teachers": serialize_teacher, "course_classes": serialize_course_class}
+PERSON_COLUMNS = {"ids": attrgetter('id'), "names": attrgetter('name'), "created_at": attrgetter('created_at_text')}
+LISTING_COLUMNS = {
+    "students": PERSON_COLUMNS,
+    "teachers": PERSON_COLUMNS,
+    "course_classes": {
+        "ids": attrgetter('id'),
+        "created_at": attrgetter('created_at_text'),
+        "teacher_ids": attrgetter('teacher.id'),
+        "teacher_names": attrgetter('teacher.name'),
+        "teacher_created_at": attrgetter('teacher.created_at_text')
+    }
+}
+
+
+def parse_page_args() -> tuple[int | None, int | None]:
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+
+    try:
+        limit = None if limit is None else int(limit)
+        after = None if after is None else decode_cursor(after)
+    except ValueError:
+        abort(400, 'Invalid pagination parameters')
+
+    if limit is not None and limit < 1:
+        abort(400, 'limit must be greater than 0')
+
+    return limit, after
+
+def parse_search_args() -> PersonQuery | None:
+    if not any(arg in request.args for arg in SEARCH_ARGS):
+        return None
+
+    min_age = request.args.get('min_age')
+    max_age = request.args.get('max_age')
+    created_since = request.args.get('created_since')
+
+    try:
+        return PersonQuery(
+            name=request.args.get('name'),
+            min_age=None if min_age is None else int(min_age),
+            max_age=None if max_age is None else int(max_age),
+            created_since=None if created_since is None else datetime.fromisoformat(created_since)
+        )
+    except ValueError:
+        abort(400, 'Invalid search parameters')
+
+# ids of a JSON body, a list of integers: true, 1.5 or "7" aren't ids
+def parse_ids(ids, key: str = 'ids', allow_empty: bool = False) -> list[int]:
+    if not isinstance(ids, list) or not (ids or allow_empty):
+        abort(400, f'{key} must be a non empty list of ids')
+
+    if len(ids) > MAX_BATCH_IDS:
+        abort(400, f'At most {MAX_BATCH_IDS} ids per request')
+
+    if any(type(id) is not int for id in ids):
+        abort(400, f'{key} must be integers')
+
+    # repeated ids are only looked up once, the first occurrence sets the order
+    return list(dict.fromkeys(ids))
+
+# the ids of the query, comma separated
+def parse_ids_arg() -> list[int] | None:
+    ids = request.args.get('ids')
+
+    if ids is None:
+        return None
+
+    try:
+        return parse_ids([int(id) for id in ids.split(',') if id.strip()])
+    except ValueError:
+        abort(400, 'ids must be integers')
+
+# validated before the try blocks of the views, which would turn the 400
+# into a 404 or a 500
+def parse_body(schema: Schema) -> dict:
+    try:
+        return schema.validate(request.get_json(silent=True))
+    except ValueError as e:
+        abort(400, str(e))
+
+def parse_ids_body(key: str = 'ids', allow_empty: bool = False) -> list[int]:
+    data = request.get_json(silent=True)
+
+    return parse_ids(data.get(key) if isinstance(data, dict) else None, key, allow_empty)
+
+# entities are encoded once per version, responses splice the cached bytes
+student_fragments = FragmentCache(lambda student: app.json.encode(serialize_student(student)))
+teacher_fragments = FragmentCache(lambda teacher: app.json.encode(serialize_teacher(teacher)))
+# without the teacher, it's spliced from its own fragment, so a teacher
+# change doesn't reencode all of its classes
+course_class_fragments = FragmentCache(lambda course_class: app.json.encode({
+    "id": course_class.id, "created_at": course_class.created_at_text
+}))
+
+def encode_student(student) -> bytes:
+    return student_fragments.get(student)
+
+def encode_teacher(teacher) -> bytes:
+    return teacher_fragments.get(teacher)
+
+def encode_course_class(course_class) -> bytes:
+    # "teacher" sorts after the other keys, it goes right before the closing brace
+    return course_class_fragments.get(course_class)[:-1] + b',"teacher":' + teacher_fragments.get(course_class.teacher) + b'}'
+
+@metrics.timed('serialization', 'encode_list')
+def encode_list(encode, entities: Iterable) -> bytes:
+    return b'[' + b','.join(map(encode, entities)) + b']'
+
+# a JSON object with keys sorted like the JSON provider does, the bytes
+# values are already encoded and go in as they are
+@metrics.timed('serialization', 'encoded_response')
+def encoded_response(fields: dict) -> Response:
+    body = b','.join(
+        app.json.encode(key) + b':' + (value if isinstance(value, bytes) else app.json.encode(value))
+        for key, value in sorted(fields.items())
+    )
+
+    return app.response_class(b'{' + body + b'}\n', mimetype='application/json')
+
+def fragment_response(fragment: bytes) -> Response:
+    return app.response_class(fragment + b'\n', mimetype='application/json')
+
+# Answers a GET with 304 when the client already has the current version,
+# before the view runs, so nothing is loaded or serialized for it. revision
+# gets the view arguments and returns the tag and the last modification time
+# of what the response is built from, None runs the view without them
+def conditional(revision, daily: bool = False):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            current = revision(**kwargs)
+
+            if current is None:
+                return view(**kwargs)
+
+            tag, modified_at = current
+
+            # ages in the response change with the date
+            if daily:
+                today = clock.today
+                tag = f'{tag}-{today.isoformat()}'
+                modified_at = max(modified_at, datetime.combine(today, datetime.min.time()).timestamp())
+
+            format = response_format()
+            encoding = accepted_encoding()
+
+            if format != 'json':
+                tag = f'{tag}-{format}'
+
+            if encoding is not None:
+                tag = f'{tag}-{encoding}'
+
+            last_modified = datetime.fromtimestamp(modified_at, timezone.utc)
+            g.revision = tag
+
+            if is_resource_modified(request.environ, etag=tag, last_modified=last_modified):
+                response = make_response(view(**kwargs))
+
+                if response.status_code != 200:
+                    return response
+            else:
+                response = Response(status=304)
+
+            response.set_etag(tag)
+            response.last_modified = last_modified
+            response.vary.add('Accept')
+            response.vary.add('Accept-Encoding')
+
+            return response
+
+        return wrapper
+
+    return decorator
+
+# Keeps the body of successful GETs in response_cache, keyed by the route,
+# its arguments, the query string and the revision found by conditional.
+# dependencies gets the view arguments and returns the tags the response is
+# built from, the repository invalidates them when they change. Changes made
+# by other processes sharing the storage show in the revision instead.
+# Bodies are kept compressed, so a hit isn't compressed again. Streamed
+# responses aren't cached
+def cached(dependencies, daily: bool = False):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            format = response_format()
+
+            if format == 'ndjson':
+                return view(**kwargs)
+
+            encoding = accepted_encoding()
+            key = (view.__name__, tuple(sorted(kwargs.items())), request.query_string, format, encoding, clock.today if daily else None, g.get('revision'))
+            entry = response_cache.get(key)
+
+            if entry is not None:
+                data, mimetype, content_encoding = entry
+                response = app.response_class(data, mimetype=mimetype)
+                response.content_encoding = content_encoding
+
+                return response
+
+            generation = response_cache.generation
+            response = make_response(view(**kwargs))
+
+            if response.status_code == 200 and not response.is_streamed:
+                if encoding is not None:
+                    compress_response(response, encoding)
+
+                response_cache.put(key, (response.get_data(), response.mimetype, response.content_encoding), dependencies(**kwargs), generation)
+
+            return response
+
+        return wrapper
 
-    self._repository.update_student_by_id(id, name, birthdate)
-  
-  def create(self, data):
-    if not isinstance(data, Student):
-      raise Exception('Dados incorretos')
+    return decorator
 
-    self._repository.add_student(data)
+def collections_revision(*collections: str):
+    return lambda **kwargs: revision_controller.get_revision(*collections)
 
-    return data.id
-  
-  def get_course_classes_by_student_id(self, id: int) -> dict:
-    student = self.__validate_student_existence_and_return(id)
+def entity_revision(collection: str):
+    return lambda id: revision_controller.get_entity_revision(collection, id)
 
-    return {
-      "student": {
-        "name": student.name,
-        "age": student.age
-      },
-      "course_classes": student.course_classes.to_list()
-    }
-  
-  def __validate_student_existence_and_return(self, id: int) -> Student:
-    student = self._repository.students.get(id)
+def batch_response(key: str, controller: BaseController, encode, ids: list[int], layout: str = 'rows'):
+    found, missing = controller.get_many(ids)
 
-    if student is None:
-      raise Exception('Aluno não encontrado')
-    
-    return student
+    return listing_response(key, encode, found, {"missing": missing}, layout)
 
+# json, ndjson or msgpack, from ?stream=1 or the Accept header. JSON wins
+# ties, so */* still gets it
+def response_format() -> str:
+    if request.args.get('stream') in ('1', 'true'):
+        return 'ndjson'
 
-class TeacherController(BaseController[Teacher]):
-  def __init__(self):
-    super().__init__()
+    accept = request.accept_mimetypes
+    json_quality = accept.quality('application/json')
 
-  def get_all(self):
-    return self._repository.teachers.to_list()
+    if accept.quality('application/x-ndjson') > json_quality:
+        return 'ndjson'
 
-  def get_by_id(self, id: int):
-    teacher = self.__validate_teacher_existence_and_return(id)
+    if msgpack is not None and accept.quality('application/msgpack') > json_quality:
+        return 'msgpack'
 
-    return teacher
-  
-  def delete_by_id(self, id: int):
-    self.__validate_teacher_existence_and_return(id)
+    return 'json'
 
-    self._repository.delete_teacher_by_id(id)
+def accepted_encoding() -> str | None:
+    return request.accept_encodings.best_match(ENCODINGS)
 
-  def update_by_id(self, id: int, name: str, birthdate: datetime):
-    self.__validate_teacher_existence_and_return(id)
+def parse_layout() -> str:
+    layout = request.args.get('layout', 'rows')
 
-    self._repository.update_teacher_by_id(id, name, birthdate)
-  
-  def create(self, data):
-    if not isinstance(data, Teacher):
-      raise Exception('Dados incorretos')
+    if layout not in ('rows', 'columns'):
+        abort(400, 'layout must be rows or columns')
 
-    self._repository.add_teacher(data)
+    return layout
 
-    return data.id
-  
-  def get_course_classes_by_teacher_id(self, id: int) -> dict:
-    teacher = self.__validate_teacher_existence_and_return(id)
+# the entities under key, with the other fields, in the format and layout
+# asked for. Plain JSON rows splice the cached fragments, the others are
+# built from the entities
+def listing_response(key: str, encode, entities: Iterable, fields: dict, layout: str = 'rows') -> Response:
+    format = response_format()
 
-    return {
-      "teacher": {
-        "name": teacher.name,
-        "age": teacher.age
-      },
-      "course_classes": teacher.course_classes.to_list()
-    }
-  
-  def get_teacher_students_by_id(self, id: int) -> list[Student]:
-    teacher = self.__validate_teacher_existence_and_return(id)
-    students_set = set[Student]()
+    if layout == 'columns':
+        # one pass per column
+        entities = list(entities)
+        value = {name: [get(entity) for entity in entities] for name, get in LISTING_COLUMNS[key].items()}
+    elif format == 'msgpack':
+        value = [LISTING_ROWS[key](entity) for entity in entities]
+    else:
+        value = encode_list(encode, entities)
 
-    for course_class in teacher.course_classes.to_list():
-      for student in course_class.students.to_list():
-        students_set.add(student)
+    if format == 'msgpack':
+        return msgpack_response({key: value, **fields})
 
-    return list(students_set)
+    return encoded_response({key: value, **fields})
 
-  def __validate_teacher_existence_and_return(self, id) -> Teacher:
-    teacher = self._repository.teachers.get(id)
+@metrics.timed('serialization', 'msgpack')
+def msgpack_response(fields: dict) -> Response:
+    return app.response_class(msgpack.packb(fields), mimetype='application/msgpack')
 
-    if teacher is None:
-      raise Exception('Professor não encontrado')
-    
-    return teacher
-  
+@metrics.timed('serialization', 'compress')
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
 
-class CourseClassController(BaseController[CourseClass]):
-  def __init__(self):
-    super().__init__()
+    # without a timestamp, the same body always compresses to the same bytes
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
 
-  def get_all(self):
-    return jsonify({"course_classes": [serialize_course_class(course_class) for course_class in self._repository.course_classes.to_list()]})
+# every chunk is flushed as it's compressed, a streamed listing still
+# reaches the client row by row
+def compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        process, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
 
-  def get_by_id(self, id: int):
-    course_class = self.__validate_course_class_existence_and_return(id)
+    for chunk in chunks:
+        yield process(chunk) + flush()
 
-    if not isinstance(course_class, CourseClass):
-        return "Course class not found", 404
+    yield finish()
 
-    return jsonify(serialize_course_class(course_class))
-  
-  def delete_by_id(self, id: int):
-    exist = self.__validate_course_class_existence_and_return(id)
+def compress_response(response: Response, encoding: str) -> None:
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop('Content-Length', None)
+    elif response.content_length is not None and response.content_length >= COMPRESS_MIN_SIZE:
+        response.set_data(compress(response.get_data(), encoding))
+    else:
+        return
 
-    if exist is None:
-        return "Course class not found", 404
+    response.content_encoding = encoding
 
-    self._repository.delete_course_class_by_id(id)
+def stream_ndjson(rows: Iterator[bytes]) -> Response:
+    # rows are encoded lazily and flushed in small chunks, the full listing is never built
+    def generate():
+        lines = []
 
-    return "Deleted course class successfully", 200
+        for row in rows:
+            lines.append(row)
 
-  def update_by_id(self, id: int, teacher_id: int):
-    self.__validate_course_class_existence_and_return(id)
+            if len(lines) == NDJSON_CHUNK_ROWS:
+                yield b'\n'.join(lines) + b'\n'
+                lines = []
 
-    teacher = self._repository.teachers.get(teacher_id)
+        if lines:
+            yield b'\n'.join(lines) + b'\n'
 
-    if teacher is None:
-      raise Exception('Professor não encontrado')
+    return Response(generate(), mimetype='application/x-ndjson')
 
-    self._repository.update_course_class_by_id(id, teacher)
-  
-  def create(self, teacher_id):
-    teacher = self._repository.teachers.get(teacher_id)
+def list_response(key: str, controller: BaseController, encode, limit: int | None, after: int | None, query: PersonQuery | None = None, layout: str = 'rows'):
+    if query is not None:
+        # search results come in id order and are paged in memory
+        found = [entity for entity in controller.search(query) if after is None or entity.id > after]
+        iter_all, get_all, get_page = (lambda after: found), (lambda: found), (lambda after, limit: found[:limit])
+    else:
+        iter_all, get_all, get_page = controller.iter_all, controller.get_all, controller.get_page
 
-    if teacher is None:
-        return 
+    if response_format() == 'ndjson':
+        return stream_ndjson(map(encode, iter_all(after)))
 
-    course_class = CourseClass(teacher)
+    if limit is None and after is None:
+        return listing_response(key, encode, get_all(), {}, layout)
 
-    self._repository.add_course_class(course_class)
+    limit = min(limit or DEFAULT_PAGE_LIMIT, MAX_PAGE_LIMIT)
+    page = get_page(after, limit)
 
-    return course_class.id
-  
-  def get_students_by_course_class_id(self, id: int) -> dict:
-    course_class = self.__validate_course_class_existence_and_return(id)
+    return listing_response(key, encode, page, {
+        "next_cursor": encode_cursor(page[-1].id) if len(page) == limit else None
+    }, layout)
 
-    return {
-      "teacher": {
-        "id": course_class.teacher.id,
-        "name": course_class.teacher.name,
-      },
-      "students": [serialize_teacher(student) for student in course_class.students.to_list()]
-    }
-  
-  def remove_student_from_course_class(self, course_class_id: int, student_id: int) -> None:
-    course_class = self.__validate_course_class_existence_and_return(course_class_id)
-    student: Student = course_class.students.get(student_id)
+@app.before_request
+def start_request_metrics():
+    g.request_started = perf_counter()
+    g.profile = profiler.start()
 
-    if student is None:
-      raise Exception('Aluno não encontrado')
-    
-    self._repository.remove_student_from_course_class(student, course_class)
+# also runs for the errors raised with abort and for the unexpected ones.
+# Streamed bodies are produced after it, their time isn't counted
+@app.after_request
+def record_request_metrics(response):
+    seconds = perf_counter() - g.request_started
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    profile = g.pop('profile', None)
 
-  def add_student_to_course_class(self, course_class_id: int, student_id: int) -> None:
-    course_class = self.__validate_course_class_existence_and_return(course_class_id)
+    metrics.observe_request(request.method, route, response.status_code, seconds)
 
-    if course_class is None:
-        return "Turma não encontrada", 404
+    if profile is not None:
+        profiler.stop(profile, f'{request.method} {route}', response.status_code, seconds)
 
-    student: Student = self._repository.students.get(student_id)
+    return response
 
-    if student is None:
-      return 'Aluno não encontrado', 404
-    
-    self._repository.add_student_to_course_class(student, course_class)
+# runs before record_request_metrics, the compression is counted in the
+# request time. Bodies from response_cache come already compressed
+@app.after_request
+def compress_response_body(response):
+    if response.status_code != 200 or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
 
-    return "Aluno adicionado com sucesso", 201
-  
-  def __validate_course_class_existence_and_return(self, id: int) -> CourseClass:
-    course_class = self._repository.course_classes.get(id)
+    response.vary.add('Accept-Encoding')
+    encoding = accepted_encoding()
 
-    return course_class
+    if encoding is not None and response.content_encoding is None:
+        compress_response(response, encoding)
 
+    return response
 
-"""
-ROUTES -> Definition of the routes pointing to each specific controller
-"""
-app = Flask(__name__)
-student_controller = StudentController()
-teacher_controller = TeacherController()
-course_class_controller = CourseClassController()
+@app.teardown_request
+def discard_request_profile(exception):
+    profile = g.pop('profile', None)
+
+    if profile is not None:
+        profiler.discard(profile)
 
 
 ## ALUNOS
 @app.route('/students', methods=['GET'])
+@conditional(collections_revision('students'), daily=True)
+@cached(lambda: ['students'], daily=True)
 def get_all_students():
+    limit, after = parse_page_args()
+    ids = parse_ids_arg()
+    layout = parse_layout()
+    query = parse_search_args()
+
+    try:
+        if ids is not None:
+            return batch_response("students", student_controller, encode_student, ids, layout)
+
+        return list_response("students", student_controller, encode_student, limit, after, query, layout)
+    except Exception as e:
+        abort(500, description=str(e))
+
+@app.route('/students:batchGet', methods=['POST'])
+def batch_get_students():
+    ids = parse_ids_body()
+    layout = parse_layout()
+
     try:
-        result = student_controller.get_all()
-        return jsonify({
-            "students": [{"id": s.id, "name": s.name, "created_at": s.created_at} for s in result]
-        })
+        return batch_response("students", student_controller, encode_student, ids, layout)
     except Exception as e:
         abort(500, description=str(e))
 
 @app.route('/students/<int:id>', methods=['GET'])
+@conditional(entity_revision('students'))
+@cached(lambda id: [('student', id)])
 def get_student_by_id(id):
     try:
         student = student_controller.get_by_id(id)
-        return jsonify({
-            "id": student.id, "name": student.name, "created_at": student.created_at
-        })
+        return fragment_response(encode_student(student))
     except Exception as e:
         abort(404, description=str(e))
 
@@ -531,42 +3976,29 @@ def delete_student(id):
 
 @app.route('/students/<int:id>', methods=['PUT'])
 def update_student(id):
-    try:
-        data = request.get_json()
-        name = data.get('name')
-        birthdate = datetime.strptime(data.get('birthdate'), '%Y-%m-%d')
-
-        if not name or not birthdate:
-            abort(400, description="Missing required fields")
+    data = parse_body(PERSON_SCHEMA)
 
-        student_controller.update_by_id(id, name, birthdate)
+    try:
+        student_controller.update_by_id(id, data['name'], data['birthdate'])
         return jsonify({"message": "Student updated successfully"})
-    except ValueError:
-        abort(400, description="Invalid date format. Use YYYY-MM-DD")
     except Exception as e:
         abort(404, description=str(e))
 
 @app.route('/students', methods=['POST'])
 def create_student():
-    data = request.get_json()
+    data = parse_body(PERSON_SCHEMA)
 
     try:
-        name = data.get('name')
-        birthdate = datetime.strptime(data.get('birthdate'), '%Y-%m-%d')
-
-        if not name or not birthdate:
-            abort(400, description="Missing required fields")
-
-        student = Student(name=name, birthdate=birthdate)
+        student = Student(name=data['name'], birthdate=data['birthdate'])
         student_controller.create(student)
 
         return jsonify({"id": student.id, "message": "Student created successfully"}), 201
-    except ValueError:
-        abort(400, description="Invalid date format. Use YYYY-MM-DD")
     except Exception as e:
         abort(500, description=str(e))
 
 @app.route('/students/<int:id>/course-classes', methods=['GET'])
+@conditional(collections_revision('students', 'teachers', 'course_classes'), daily=True)
+@cached(lambda id: [('student', id), 'teachers', 'course_classes'], daily=True)
 def get_student_course_classes(id):
     try:
         result = student_controller.get_course_classes_by_student_id(id)
@@ -578,54 +4010,63 @@ def get_student_course_classes(id):
 
 ## PROFESSORES
 @app.route('/teachers', methods=['GET'])
+@conditional(collections_revision('teachers'), daily=True)
+@cached(lambda: ['teachers'], daily=True)
 def get_all_teachers():
+    limit, after = parse_page_args()
+    ids = parse_ids_arg()
+    layout = parse_layout()
+    query = parse_search_args()
+
     try:
-        teachers = teacher_controller.get_all()
-        return jsonify({"teachers": [serialize_teacher(t) for t in teachers]})
+        if ids is not None:
+            return batch_response("teachers", teacher_controller, encode_teacher, ids, layout)
+
+        return list_response("teachers", teacher_controller, encode_teacher, limit, after, query, layout)
+    except Exception as e:
+        abort(500, str(e))
+
+@app.route('/teachers:batchGet', methods=['POST'])
+def batch_get_teachers():
+    ids = parse_ids_body()
+    layout = parse_layout()
+
+    try:
+        return batch_response("teachers", teacher_controller, encode_teacher, ids, layout)
     except Exception as e:
         abort(500, str(e))
 
 @app.route('/teachers/<int:id>', methods=['GET'])
+@conditional(entity_revision('teachers'))
+@cached(lambda id: [('teacher', id)])
 def get_teacher_by_id(id):
     try:
         teacher = teacher_controller.get_by_id(id)
-        return jsonify(serialize_teacher(teacher))
+        return fragment_response(encode_teacher(teacher))
     except Exception as e:
         abort(404, str(e))
 
 @app.route('/teachers', methods=['POST'])
 def create_teacher():
-    try:
-        data = request.get_json()
-
-        if not data or 'name' not in data or 'birthdate' not in data:
-            abort(400, 'Missing required fields: name, birthdate')
+    data = parse_body(PERSON_SCHEMA)
 
-        birthdate = datetime.strptime(data['birthdate'], '%Y-%m-%d')
-        teacher_id = teacher_controller.create(Teacher(name=data['name'], birthdate=birthdate))
+    try:
+        teacher_id = teacher_controller.create(Teacher(name=data['name'], birthdate=data['birthdate']))
 
         return jsonify({"id": teacher_id, "message": "Professor criado com sucesso"}), 201
 
-    except ValueError:
-        abort(400, 'Invalid date format. Use YYYY-MM-DD')
     except Exception as e:
         abort(500, str(e))
 
 @app.route('/teachers/<int:id>', methods=['PUT'])
 def update_teacher(id):
-    try:
-        data = request.get_json()
-
-        if not data or 'name' not in data or 'birthdate' not in data:
-            abort(400, 'Missing required fields: name, birthdate')
+    data = parse_body(PERSON_SCHEMA)
 
-        birthdate = datetime.strptime(data['birthdate'], '%Y-%m-%d')
-        teacher_controller.update_by_id(id, data['name'], birthdate)
+    try:
+        teacher_controller.update_by_id(id, data['name'], data['birthdate'])
 
         return jsonify({"message": "Teacher updated successfully"})
 
-    except ValueError:
-        abort(400, 'Invalid date format. Use YYYY-MM-DD')
     except Exception as e:
         abort(404, str(e))
 
@@ -638,6 +4079,8 @@ def delete_teacher(id):
         abort(404, str(e))
 
 @app.route('/teachers/<int:id>/course-classes', methods=['GET'])
+@conditional(collections_revision('teachers', 'course_classes'), daily=True)
+@cached(lambda id: [('teacher', id)], daily=True)
 def get_course_classes_by_teacher_id(id):
     try:
         result = teacher_controller.get_course_classes_by_teacher_id(id)
@@ -646,43 +4089,69 @@ def get_course_classes_by_teacher_id(id):
         abort(404, str(e))
 
 @app.route('/teachers/<int:id>/students', methods=['GET'])
+@conditional(collections_revision('students', 'teachers', 'course_classes'), daily=True)
+@cached(lambda id: [('teacher', id), 'students'], daily=True)
 def get_teacher_students_by_id(id):
     try:
         students = teacher_controller.get_teacher_students_by_id(id)
-        return jsonify({"students": [
-            {"id": s.id, "name": s.name, "age": s.age} for s in students
-        ]})
+        return jsonify({"students": serialize_students_age(students)})
+    except Exception as e:
+        abort(404, str(e))
+
+@app.route('/teachers/<int:id>/students/count', methods=['GET'])
+@conditional(collections_revision('teachers', 'course_classes'))
+@cached(lambda id: [('teacher', id), 'students'])
+def count_teacher_students_by_id(id):
+    try:
+        return jsonify({"count": teacher_controller.count_teacher_students_by_id(id)})
     except Exception as e:
         abort(404, str(e))
 
 
 ## TURMAS
 @app.route('/course-classes', methods=['GET'])
+@conditional(collections_revision('teachers', 'course_classes'))
+@cached(lambda: ['course_classes', 'teachers'])
 def get_all_course_classes():
+    limit, after = parse_page_args()
+    ids = parse_ids_arg()
+    layout = parse_layout()
+
+    try:
+        if ids is not None:
+            return batch_response("course_classes", course_class_controller, encode_course_class, ids, layout)
+
+        return list_response("course_classes", course_class_controller, encode_course_class, limit, after, layout=layout)
+    except Exception as e:
+        abort(500, str(e))
+
+@app.route('/course-classes:batchGet', methods=['POST'])
+def batch_get_course_classes():
+    ids = parse_ids_body()
+    layout = parse_layout()
+
     try:
-        return course_class_controller.get_all()
+        return batch_response("course_classes", course_class_controller, encode_course_class, ids, layout)
     except Exception as e:
         abort(500, str(e))
 
 @app.route('/course-classes/<int:id>', methods=['GET'])
+@conditional(entity_revision('course_classes'))
+@cached(lambda id: [('course_class', id), 'teachers'])
 def get_course_class_by_id(id):
     try:
         course_class = course_class_controller.get_by_id(id)
 
-        return course_class
+        return fragment_response(encode_course_class(course_class))
     except Exception as e:
         abort(404, str(e))
 
 @app.route('/course-classes', methods=['POST'])
 def create_course_class():
-    data = request.get_json()
+    data = parse_body(COURSE_CLASS_SCHEMA)
 
     try:
-        if not data or 'teacher_id' not in data:
-            abort(400, 'Missing required field: teacher_id')
-
-        teacher_id = data['teacher_id']
-        course_class_id = course_class_controller.create(teacher_id)
+        course_class_id = course_class_controller.create(data['teacher_id'])
 
         return jsonify({"id": course_class_id, "message": "Course class created successfully"}), 201
 
@@ -691,14 +4160,10 @@ def create_course_class():
 
 @app.route('/course-classes/<int:id>', methods=['PUT'])
 def update_course_class(id):
-    try:
-        data = request.get_json()
-
-        if not data or 'teacher_id' not in data:
-            abort(400, 'Missing required field: teacher_id')
+    data = parse_body(COURSE_CLASS_SCHEMA)
 
-        teacher_id = data['teacher_id']
-        course_class_controller.update_by_id(id, teacher_id)
+    try:
+        course_class_controller.update_by_id(id, data['teacher_id'])
 
         return jsonify({"message": "Course class updated successfully"})
 
@@ -713,6 +4178,8 @@ def delete_course_class(id):
         abort(500, str(e))
 
 @app.route('/course-classes/<int:id>/students', methods=['GET'])
+@conditional(collections_revision('students', 'teachers', 'course_classes'))
+@cached(lambda id: [('course_class', id), 'students', 'teachers'])
 def get_students_by_course_class_id(id):
     try:
         result = course_class_controller.get_students_by_course_class_id(id)
@@ -721,6 +4188,25 @@ def get_students_by_course_class_id(id):
         print(e)
         abort(500, str(e))
 
+@app.route('/course-classes/<int:id>/students', methods=['POST'])
+def enroll_students_in_course_class(id):
+    student_ids = parse_ids_body('student_ids')
+
+    try:
+        return jsonify(course_class_controller.enroll_students(id, student_ids))
+    except Exception as e:
+        abort(404, str(e))
+
+@app.route('/course-classes/<int:id>/students', methods=['PUT'])
+def replace_course_class_students(id):
+    # an empty list leaves the course class without students
+    student_ids = parse_ids_body('student_ids', allow_empty=True)
+
+    try:
+        return jsonify(course_class_controller.replace_students(id, student_ids))
+    except Exception as e:
+        abort(404, str(e))
+
 @app.route('/course-classes/<int:course_class_id>/students/<int:student_id>', methods=['DELETE'])
 def remove_student_from_course_class(course_class_id, student_id):
     try:
@@ -737,5 +4223,299 @@ def add_student_to_course_class(course_class_id, student_id):
         abort(500, str(e))
 
 
+## ESTATISTICAS
+@app.route('/stats', methods=['GET'])
+@conditional(collections_revision('students', 'teachers', 'course_classes'), daily=True)
+@cached(lambda: ['students', 'teachers', 'course_classes', 'enrollments'], daily=True)
+def get_stats():
+    try:
+        return jsonify(stats_controller.get_summary())
+    except Exception as e:
+        abort(500, str(e))
+
+@app.route('/stats/students/ages', methods=['GET'])
+@conditional(collections_revision('students'), daily=True)
+@cached(lambda: ['students'], daily=True)
+def get_students_age_histogram():
+    bucket = request.args.get('bucket', '1')
+
+    try:
+        bucket = int(bucket)
+    except ValueError:
+        abort(400, 'bucket must be an integer')
+
+    if bucket < 1:
+        abort(400, 'bucket must be greater than 0')
+
+    try:
+        return jsonify({"bucket": bucket, "ages": stats_controller.get_age_histogram(bucket)})
+    except Exception as e:
+        abort(500, str(e))
+
+@app.route('/stats/students/older-than/<int:age>', methods=['GET'])
+@conditional(collections_revision('students'), daily=True)
+@cached(lambda age: ['students'], daily=True)
+def get_students_older_than(age):
+    try:
+        ids = stats_controller.get_students_by_age(older_than=age)
+        return jsonify({"age": age, "count": len(ids), "ids": ids})
+    except Exception as e:
+        abort(500, str(e))
+
+@app.route('/stats/students/younger-than/<int:age>', methods=['GET'])
+@conditional(collections_revision('students'), daily=True)
+@cached(lambda age: ['students'], daily=True)
+def get_students_younger_than(age):
+    try:
+        ids = stats_controller.get_students_by_age(younger_than=age)
+        return jsonify({"age": age, "count": len(ids), "ids": ids})
+    except Exception as e:
+        abort(500, str(e))
+
+@app.route('/stats/course-classes/average-size', methods=['GET'])
+@conditional(collections_revision('students', 'course_classes'))
+@cached(lambda: ['course_classes', 'enrollments'])
+def get_average_course_class_size():
+    try:
+        return jsonify(stats_controller.get_average_class_size())
+    except Exception as e:
+        abort(500, str(e))
+
+
+## CACHE
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(response_cache.stats)
+
+
+## METRICAS
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/metrics/profiles', methods=['GET'])
+def get_metrics_profiles():
+    return jsonify({"sample_rate": profiler.sample_rate, "profiles": profiler.profiles})
+
+
+## ALTERACOES
+# since comes from the query or, when an event stream reconnects, from the
+# id of the last event it got, epoch:seq
+def parse_since() -> tuple[int | None, str | None]:
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    epoch = request.args.get('epoch')
+
+    if since is not None and ':' in since:
+        epoch, since = since.split(':', 1)
+
+    try:
+        since = None if since is None else int(since)
+    except ValueError:
+        abort(400, 'since must be an integer')
+
+    if since is not None and since < 0:
+        abort(400, 'since must not be negative')
+
+    return since, epoch
+
+def wants_event_stream() -> bool:
+    accept = request.accept_mimetypes
+
+    return accept.quality('text/event-stream') > accept.quality('application/json')
+
+def reset_event() -> bytes:
+    data = app.json.encode({"epoch": change_controller.epoch, "last_seq": change_controller.last_change()})
+
+    return b'event: reset\ndata: ' + data + b'\n\n'
+
+# Server-Sent Events, one per change, with epoch:seq as the id. Waits in
+# slices of a second, so a shutdown or a disconnect ends the stream quickly
+def change_events(since: int, disconnected: threading.Event | None = None) -> Iterator[bytes]:
+    deadline = monotonic() + CHANGES_STREAM_SECONDS
+    last_event = monotonic()
+
+    while not stopping.is_set() and not (disconnected is not None and disconnected.is_set()) and monotonic() < deadline:
+        result = change_controller.get_changes(since, MAX_PAGE_LIMIT)
+
+        if result is None:
+            yield reset_event()
+            return
+
+        if result['changes']:
+            yield b''.join(
+                f'id: {result["epoch"]}:{change["seq"]}\nevent: change\ndata: '.encode() + app.json.encode(change) + b'\n\n'
+                for change in result['changes']
+            )
+            last_event = monotonic()
+
+        since = result['last_seq']
+
+        if result['has_more'] or change_controller.wait_for_changes(since, 1):
+            continue
+
+        # comments keep proxies from closing an idle stream
+        if monotonic() - last_event >= CHANGES_KEEP_ALIVE:
+            yield b': keep-alive\n\n'
+            last_event = monotonic()
+
+@app.route('/changes', methods=['GET'])
+def get_changes():
+    since, epoch = parse_since()
+    limit, _ = parse_page_args()
+    limit = min(limit or MAX_PAGE_LIMIT, MAX_PAGE_LIMIT)
+    wait = min(max(request.args.get('wait', 0, type=float), 0), CHANGES_MAX_WAIT)
+    # the sequence numbers start over with the epoch
+    stale = epoch is not None and epoch != change_controller.epoch
+
+    # without since, the feed starts now
+    if since is None or stale:
+        since = change_controller.last_change()
+
+    if wants_event_stream():
+        events = iter([reset_event()]) if stale else change_events(since, request.environ.get(DISCONNECTED_KEY))
+
+        return Response(events, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+    if stale:
+        abort(410, 'The changes are from another epoch, sync the listings again')
+
+    result = change_controller.get_changes(since, limit)
+
+    if result is not None and not result['changes'] and wait and change_controller.wait_for_changes(since, wait):
+        result = change_controller.get_changes(since, limit)
+
+    if result is None:
+        abort(410, 'The changes after since are no longer kept, sync the listings again')
+
+    return jsonify(result)
+
+
+## IMPORTACAO EM LOTE
+@app.route('/bulk', methods=['POST'])
+def bulk_import():
+    format = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    # request.stream is unbuffered, reading lines straight from it costs a call per byte
+    lines = io.TextIOWrapper(io.BufferedReader(request.stream, 1 << 16), encoding='utf-8', newline='')
+
+    try:
+        return jsonify(bulk_controller.import_rows(read_bulk_rows(lines, format)))
+    except Exception as e:
+        abort(500, str(e))
+
+@app.cli.command('bulk-import')
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', type=click.Choice(['ndjson', 'csv']), default=None, help='Defaults to the file extension')
+def bulk_import_command(file, format):
+    """Imports students, teachers, course classes and enrollments from an NDJSON or CSV file"""
+    format = format or ('csv' if file.name.endswith('.csv') else 'ndjson')
+    result = bulk_controller.import_rows(read_bulk_rows(file, format))
+
+    click.echo(json.dumps(result, indent=2))
+
+
+## SERVIDOR
+def serve_worker(listener: socket.socket, host: str, port: int, keep_alive: float) -> None:
+    # idle connections are closed after keep_alive seconds
+    handler = type('RequestHandler', (WSGIRequestHandler,), {'timeout': keep_alive})
+    server = make_server(host, port, app, threaded=True, request_handler=handler, fd=listener.fileno())
+    # server_close then waits for the requests in progress
+    server.daemon_threads = False
+
+    # shutdown waits for serve_forever, which runs on this thread
+    def stop(signum, frame):
+        stopping.set()
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.pthread_sigmask(signal.SIG_SETMASK, set())
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+def spawn_worker(listener: socket.socket, host: str, port: int, keep_alive: float) -> int:
+    pid = os.fork()
+
+    if pid == 0:
+        status = 1
+
+        try:
+            serve_worker(listener, host, port, keep_alive)
+            status = 0
+        finally:
+            os._exit(status)
+
+    return pid
+
+def stop_workers(workers: set[int], timeout: float) -> None:
+    for pid in workers:
+        os.kill(pid, signal.SIGTERM)
+
+    deadline = monotonic() + timeout
+
+    while workers and monotonic() < deadline:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+
+        if pid:
+            workers.discard(pid)
+        else:
+            sleep(0.05)
+
+    for pid in workers:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+@app.cli.command('serve')
+@click.option('--host', envvar='SCHOOL_HOST', default='127.0.0.1', show_default=True)
+@click.option('--port', envvar='SCHOOL_PORT', type=int, default=5000, show_default=True)
+@click.option('--workers', envvar='SCHOOL_WORKERS', type=click.IntRange(min=1), default=None, show_default='CPU count with SQLite, 1 in memory')
+@click.option('--backlog', envvar='SCHOOL_BACKLOG', type=int, default=1024, show_default=True)
+@click.option('--keep-alive', envvar='SCHOOL_KEEP_ALIVE', type=float, default=5, show_default=True, help='Seconds an idle connection is kept open')
+@click.option('--graceful-timeout', envvar='SCHOOL_GRACEFUL_TIMEOUT', type=float, default=30, show_default=True, help='Seconds given to the requests in progress on shutdown')
+def serve_command(host, port, workers, backlog, keep_alive, graceful_timeout):
+    """Serves the API from worker processes forked from this one"""
+    if workers is None:
+        workers = 1 if isinstance(repository, Repository) else os.cpu_count() or 1
+
+    if workers > 1 and isinstance(repository, Repository):
+        raise click.UsageError('The data in memory is not shared between processes, use SCHOOL_STORAGE=sqlite or --workers 1')
+
+    listener = socket.create_server((host, port), backlog=backlog)
+
+    # the threads of the write-ahead log wouldn't survive a fork, the data in
+    # memory is served from this process
+    if isinstance(repository, Repository):
+        click.echo(f'Serving on http://{host}:{listener.getsockname()[1]}, pid {os.getpid()}')
+        serve_worker(listener, host, port, keep_alive)
+        listener.close()
+        repository.snapshot()
+        return
+
+    # the workers share the pages of everything loaded so far until they
+    # write to them, the collector would write to all of them
+    gc.collect()
+    gc.freeze()
+
+    # signals are only taken by sigwait below, the workers unblock them
+    signals = {signal.SIGINT, signal.SIGTERM, signal.SIGCHLD}
+    signal.pthread_sigmask(signal.SIG_BLOCK, signals)
+    running = {spawn_worker(listener, host, port, keep_alive) for _ in range(workers)}
+
+    click.echo(f'Serving on http://{host}:{listener.getsockname()[1]} with {workers} worker(s), master pid {os.getpid()}')
+
+    while (signum := signal.sigwait(signals)) == signal.SIGCHLD:
+        while running and (pid := os.waitpid(-1, os.WNOHANG)[0]):
+            running.discard(pid)
+            click.echo(f'Worker {pid} exited, starting another one', err=True)
+            running.add(spawn_worker(listener, host, port, keep_alive))
+
+    click.echo(f'{signal.Signals(signum).name}, waiting up to {graceful_timeout:g}s for the requests in progress')
+    stop_workers(running, graceful_timeout)
+    listener.close()
+    repository.close()
+
+
 if __name__ == '__main__':
   app.run(debug=True)
@@ -0,0 +1,161 @@
+"""
+ASGI entry point of the school API, for any ASGI server:
+    uvicorn asgi:application
+
+The routes and controllers are the ones of app.py. They are synchronous, so
+each request runs on a thread of an executor, blocking work (the write-ahead
+log, SQLite) included, while the event loop only reads requests and writes
+responses. Idle and slow connections cost a coroutine, not a thread, and a
+client that goes away in the middle of a response (an event stream of
+/changes) gives its thread back.
+"""
+import asyncio
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import DISCONNECTED_KEY, app
+
+
+class WsgiAdapter:
+  def __init__(self, wsgi_app, max_workers: int):
+    self.__wsgi_app = wsgi_app
+    self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='asgi')
+
+  async def __call__(self, scope, receive, send) -> None:
+    if scope['type'] == 'lifespan':
+      await self.__lifespan(receive, send)
+    elif scope['type'] == 'http':
+      await self.__http(scope, receive, send)
+    else:
+      raise ValueError(f"Unsupported scope: {scope['type']}")
+
+  async def __lifespan(self, receive, send) -> None:
+    while True:
+      message = await receive()
+
+      if message['type'] == 'lifespan.startup':
+        await send({'type': 'lifespan.startup.complete'})
+      elif message['type'] == 'lifespan.shutdown':
+        self.__executor.shutdown(wait=True)
+        await send({'type': 'lifespan.shutdown.complete'})
+        return
+
+  async def __http(self, scope, receive, send) -> None:
+    body = bytearray()
+
+    while True:
+      message = await receive()
+
+      if message['type'] == 'http.disconnect':
+        return
+
+      body += message.get('body', b'')
+
+      if not message.get('more_body', False):
+        break
+
+    environ = self.__environ(scope, bytes(body))
+    disconnected = environ[DISCONNECTED_KEY] = threading.Event()
+    loop = asyncio.get_running_loop()
+    watcher = asyncio.ensure_future(self.__watch_disconnect(receive, disconnected))
+
+    try:
+      await loop.run_in_executor(self.__executor, self.__run, environ, send, loop)
+    finally:
+      watcher.cancel()
+
+  # the only message left after the body is the disconnect
+  async def __watch_disconnect(self, receive, disconnected: threading.Event) -> None:
+    while (await receive())['type'] != 'http.disconnect':
+      pass
+
+    disconnected.set()
+
+  # runs on the executor, the response goes out through the event loop as the
+  # app produces it, waiting for each send keeps a slow client from piling
+  # the response up in memory
+  def __run(self, environ: dict, send, loop: asyncio.AbstractEventLoop) -> None:
+    def call(message: dict) -> None:
+      asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    start = {}
+
+    def start_response(status: str, headers: list[tuple[str, str]], exc_info=None):
+      start['message'] = {
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+      }
+
+    result = self.__wsgi_app(environ, start_response)
+    disconnected = environ[DISCONNECTED_KEY]
+
+    try:
+      started = False
+
+      for chunk in result:
+        # nobody reads the rest, closing the iterator ends it
+        if disconnected.is_set():
+          return
+
+        if not chunk:
+          continue
+
+        if not started:
+          call(start['message'])
+          started = True
+
+        call({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+      if disconnected.is_set():
+        return
+
+      if not started:
+        call(start['message'])
+
+      call({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+      if hasattr(result, 'close'):
+        result.close()
+
+  def __environ(self, scope: dict, body: bytes) -> dict:
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+      'REQUEST_METHOD': scope['method'],
+      'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+      'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+      'QUERY_STRING': scope['query_string'].decode('latin-1'),
+      'SERVER_NAME': server_name,
+      'SERVER_PORT': str(server_port),
+      'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+      'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+      'CONTENT_LENGTH': str(len(body)),
+      'wsgi.version': (1, 0),
+      'wsgi.url_scheme': scope.get('scheme', 'http'),
+      'wsgi.input': io.BytesIO(body),
+      'wsgi.errors': sys.stderr,
+      'wsgi.multithread': True,
+      'wsgi.multiprocess': False,
+      'wsgi.run_once': False,
+    }
+
+    for name, value in scope['headers']:
+      name = name.decode('latin-1').upper().replace('-', '_')
+      value = value.decode('latin-1')
+
+      if name == 'CONTENT_LENGTH':
+        continue
+      if name == 'CONTENT_TYPE':
+        environ['CONTENT_TYPE'] = value
+        continue
+
+      key = f'HTTP_{name}'
+      environ[key] = f'{environ[key]},{value}' if key in environ else value
+
+    return environ
+
+
+application = WsgiAdapter(app, max_workers=int(os.environ.get('SCHOOL_ASGI_THREADS', 64)))
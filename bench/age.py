@@ -0,0 +1,71 @@
+"""
+Cost of the ages of a roster: the previous date.today() and // 365 on every
+access against the process clock, one student at a time (Student.age), for
+the whole roster at once (serialize_students_age) and over the columns
+(StudentColumns.ages). Also counts how many of the old ages were wrong
+
+Run from the project root:
+    python -m bench.age [students]
+"""
+import random
+import sys
+from datetime import date, datetime
+from time import perf_counter
+
+import app
+from app import StudentColumns, Student, clock, serialize_students_age
+
+COUNT = 100_000
+REPEAT = 5
+
+
+def legacy_age(student: Student) -> int:
+  return (date.today().toordinal() - student.birthdate_ordinal) // 365
+
+
+def legacy_roster(students: list[Student]) -> list[dict]:
+  return [{"id": student.id, "name": student.name, "age": legacy_age(student)} for student in students]
+
+
+def fastest(function) -> float:
+  best = float('inf')
+
+  for _ in range(REPEAT):
+    start = perf_counter()
+    function()
+    best = min(best, perf_counter() - start)
+
+  return best
+
+
+def main(count: int) -> None:
+  generator = random.Random(0)
+  columns = StudentColumns()
+  students = []
+
+  for i in range(count):
+    student = Student(f'Student {i}', datetime.fromordinal(generator.randint(date(1950, 1, 1).toordinal(), date(2020, 12, 31).toordinal())))
+    columns.add(student)
+    students.append(student)
+
+  wrong = sum(legacy_age(student) != student.age for student in students)
+
+  cases = {
+    "date.today() // 365": lambda: [legacy_age(student) for student in students],
+    "Student.age": lambda: [student.age for student in students],
+    "clock.ages": lambda: clock.ages([student.birthdate_ordinal for student in students]),
+    "StudentColumns.ages": columns.ages,
+    "roster, // 365": lambda: legacy_roster(students),
+    "roster, batch": lambda: serialize_students_age(students),
+  }
+
+  print(f"{count:,} students, numpy {'on' if app.numpy is not None else 'off'}")
+
+  for name, case in cases.items():
+    print(f"  {name:<22} {fastest(case) * 1e3:>8.1f} ms")
+
+  print(f"{wrong:,} ages off by // 365 ({wrong / count:.1%})")
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else COUNT)
@@ -0,0 +1,143 @@
+"""
+Load test: the threaded WSGI server vs the ASGI entry point (asgi.py under
+uvicorn), requests per second and latency percentiles with many concurrent
+keep-alive connections
+
+Run from the project root (needs uvicorn for the ASGI side):
+    python -m bench.asgi_load [connections] [seconds]
+"""
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import urllib.request
+from time import monotonic, perf_counter, sleep
+
+CONNECTIONS = 1000
+SECONDS = 10
+PORT = 5100
+PATH = '/students?limit=20'
+SERVERS = {
+  "wsgi (threaded)": [sys.executable, '-c', f'import app; app.app.run(port={PORT}, threaded=True)'],
+  "asgi (uvicorn)": [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(PORT), '--log-level', 'warning', '--backlog', '4096'],
+}
+
+
+def start(command: list[str]) -> subprocess.Popen:
+  server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+  for _ in range(100):
+    try:
+      urllib.request.urlopen(f'http://127.0.0.1:{PORT}/students?limit=1')
+      return server
+    except OSError:
+      sleep(0.1)
+
+  server.kill()
+  raise RuntimeError(f'server did not start: {command}')
+
+
+def seed(count: int = 100) -> None:
+  for i in range(count):
+    request = urllib.request.Request(
+      f'http://127.0.0.1:{PORT}/students',
+      data=json.dumps({"name": f'student {i}', "birthdate": '2000-01-01'}).encode(),
+      headers={'Content-Type': 'application/json'}
+    )
+    urllib.request.urlopen(request).read()
+
+
+async def connection(deadline: float, latencies: list[float], errors: list[int]) -> None:
+  request = f'GET {PATH} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n'.encode()
+  reader = writer = None
+
+  while monotonic() < deadline:
+    try:
+      if writer is None:
+        reader, writer = await asyncio.open_connection('127.0.0.1', PORT)
+
+      start = perf_counter()
+      writer.write(request)
+      status = await reader.readline()
+      length, close = 0, False
+
+      while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+
+        if name.lower() == 'content-length':
+          length = int(value)
+        elif name.lower() == 'connection' and value.strip().lower() == 'close':
+          close = True
+
+      await reader.readexactly(length)
+      latencies.append(perf_counter() - start)
+
+      if not status.startswith(b'HTTP/1.1 200') and not status.startswith(b'HTTP/1.0 200'):
+        errors.append(1)
+
+      if close:
+        writer.close()
+        writer = None
+    except (OSError, asyncio.IncompleteReadError, ValueError):
+      errors.append(1)
+
+      if writer is not None:
+        writer.close()
+        writer = None
+
+      await asyncio.sleep(0.05)
+
+  if writer is not None:
+    writer.close()
+
+
+async def load(connections: int, seconds: float) -> tuple[list[float], int]:
+  latencies: list[float] = []
+  errors: list[int] = []
+  deadline = monotonic() + seconds
+
+  await asyncio.gather(*(connection(deadline, latencies, errors) for _ in range(connections)))
+
+  return latencies, len(errors)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+  return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+def main(connections: int, seconds: float) -> None:
+  # one descriptor per connection on each side, plus some slack
+  soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+  resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, 2 * connections + 256)), hard))
+
+  print(f"{connections:,} connections, {seconds} s, GET {PATH}")
+
+  for name, command in SERVERS.items():
+    try:
+      server = start(command)
+    except RuntimeError as e:
+      print(f"  {name:<16} skipped ({e})")
+      continue
+
+    try:
+      seed()
+      latencies, errors = asyncio.run(load(connections, seconds))
+    finally:
+      server.terminate()
+      server.wait()
+
+    latencies.sort()
+    print(
+      f"  {name:<16} {len(latencies) / seconds:>8.0f} req/s"
+      f"  p50 {percentile(latencies, 0.50) * 1e3:>7.1f} ms"
+      f"  p99 {percentile(latencies, 0.99) * 1e3:>7.1f} ms"
+      f"  errors {errors}"
+    )
+
+
+if __name__ == '__main__':
+  main(
+    int(sys.argv[1]) if len(sys.argv) > 1 else CONNECTIONS,
+    float(sys.argv[2]) if len(sys.argv) > 2 else SECONDS
+  )
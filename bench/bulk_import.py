@@ -0,0 +1,80 @@
+"""
+Rows per second of POST /bulk against one request per row, both through
+Flask's test client so only the server side is measured
+
+Run from the project root:
+    python -m bench.bulk_import [students]
+"""
+import json
+import sys
+from time import perf_counter
+
+from app import app
+
+COUNT = 10_000
+
+
+def rows(count: int) -> list[dict]:
+  teacher = {"type": "teacher", "ref": "teacher", "name": "Teacher", "birthdate": "1980-01-01"}
+  course_class = {"type": "course_class", "ref": "class", "teacher_ref": "teacher"}
+  students = [
+    {"type": "student", "ref": f"student {i}", "name": f"Student {i}", "birthdate": "2005-06-15"}
+    for i in range(count)
+  ]
+  enrollments = [
+    {"type": "enrollment", "student_ref": f"student {i}", "course_class_ref": "class"}
+    for i in range(count)
+  ]
+
+  return [teacher, course_class, *students, *enrollments]
+
+
+def per_row(client, count: int) -> float:
+  start = perf_counter()
+
+  teacher_id = client.post('/teachers', json={"name": "Teacher", "birthdate": "1980-01-01"}).json["id"]
+  course_class_id = client.post('/course-classes', json={"teacher_id": teacher_id}).json["id"]
+
+  for i in range(count):
+    student_id = client.post('/students', json={"name": f"Student {i}", "birthdate": "2005-06-15"}).json["id"]
+    client.post(f'/course-classes/{course_class_id}/students/{student_id}')
+
+  return perf_counter() - start
+
+
+def bulk(client, count: int, format: str) -> float:
+  data = rows(count)
+
+  if format == 'csv':
+    columns = ["type", "ref", "name", "birthdate", "teacher_ref", "student_ref", "course_class_ref"]
+    lines = [",".join(columns)] + [",".join(row.get(column, "") for column in columns) for row in data]
+    content_type = 'text/csv'
+  else:
+    lines = [json.dumps(row) for row in data]
+    content_type = 'application/x-ndjson'
+
+  body = "\n".join(lines).encode()
+  start = perf_counter()
+  response = client.post('/bulk', data=body, content_type=content_type)
+  elapsed = perf_counter() - start
+
+  assert not response.json["errors"], response.json["errors"][:3]
+
+  return elapsed
+
+
+def main(count: int) -> None:
+  client = app.test_client()
+  # a student and an enrollment per student, plus the teacher and the class
+  total = count * 2 + 2
+
+  for name, elapsed in [
+    ("one request per row", per_row(client, count)),
+    ("POST /bulk ndjson", bulk(client, count, 'ndjson')),
+    ("POST /bulk csv", bulk(client, count, 'csv')),
+  ]:
+    print(f"{name:<22} {total / elapsed:>12,.0f} rows/s  ({elapsed:.2f} s)")
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else COUNT)
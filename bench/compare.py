@@ -0,0 +1,59 @@
+"""
+Compares two results of bench.suite route by route: throughput and p99
+latency of the new run against the base one. Exits with 1 when a route got
+slower than the threshold, so it can gate a change
+
+Run from the project root:
+    python -m bench.compare base.json new.json [threshold %]
+"""
+import json
+import sys
+
+THRESHOLD = 10.0
+
+
+def change(base: float, new: float) -> float:
+  return (new - base) / base * 100 if base else 0.0
+
+
+def main(base_path: str, new_path: str, threshold: float) -> int:
+  with open(base_path) as file:
+    base = json.load(file)
+
+  with open(new_path) as file:
+    new = json.load(file)
+
+  print(f"{base['commit']} -> {new['commit']}, slower than {threshold:g}% marked with !")
+  regressions = 0
+
+  for route, modes in new['routes'].items():
+    for mode, result in modes.items():
+      previous = base['routes'].get(route, {}).get(mode)
+
+      if previous is None:
+        continue
+
+      throughput = change(previous['throughput'], result['throughput'])
+      p99 = change(previous['p99_ms'], result['p99_ms'])
+      slower = throughput < -threshold or p99 > threshold
+      regressions += slower
+
+      print(
+        f"{'!' if slower else ' '} {mode:<6} {route:<48}"
+        f" {previous['throughput']:>9.0f} -> {result['throughput']:>9.0f} req/s ({throughput:>+6.1f}%)"
+        f"  p99 {previous['p99_ms']:>8.2f} -> {result['p99_ms']:>8.2f} ms ({p99:>+6.1f}%)"
+      )
+
+  for mode in new['memory'].keys() & base['memory'].keys():
+    print(f"  memory {mode}: {base['memory'][mode]} -> {new['memory'][mode]}")
+
+  print(f"{regressions} slower route(s)")
+
+  return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+  if len(sys.argv) < 3:
+    sys.exit(__doc__)
+
+  sys.exit(main(sys.argv[1], sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else THRESHOLD))
@@ -0,0 +1,104 @@
+"""
+Multi-threaded stress test of Repository: checks that concurrent writers
+leave it consistent and reports throughput as the thread count grows
+
+Run from the project root:
+    python -m bench.concurrency [operations per thread]
+"""
+import random
+import sys
+import threading
+from datetime import datetime
+from time import perf_counter, sleep
+
+from app import CourseClass, Repository, Student, Teacher
+
+OPERATIONS = 5_000
+THREADS = [1, 2, 4, 8, 16]
+BIRTHDATE = datetime(2005, 6, 15)
+# stands in for the socket and WSGI work a real request does outside the repository
+REQUEST_IO = 0.0002
+
+
+def worker(repository: Repository, course_classes: list[CourseClass], operations: int, io: float, ids: list[int], barrier) -> None:
+  generator = random.Random()
+  mine: list[Student] = []
+  barrier.wait()
+
+  for _ in range(operations):
+    if io:
+      sleep(io)
+
+    roll = generator.random()
+
+    if roll < 0.3 or not mine:
+      student = Student('student', BIRTHDATE)
+      repository.add_student(student)
+      ids.append(student.id)
+      mine.append(student)
+    elif roll < 0.6:
+      repository.add_student_to_course_class(generator.choice(mine), generator.choice(course_classes))
+    elif roll < 0.7:
+      repository.remove_student_from_course_class(generator.choice(mine), generator.choice(course_classes))
+    else:
+      repository.page_students(generator.choice(ids), 50)
+      repository.count_teacher_students(course_classes[0].teacher.id)
+
+
+def check(repository: Repository, ids: list[int]) -> None:
+  assert len(ids) == len(set(ids)), "duplicated ids"
+  assert repository.students.size == len(ids), "student count drifted"
+
+  enrollments = 0
+
+  for course_class in repository.course_classes.values():
+    for student in course_class.students.values():
+      assert course_class.id in student.course_classes, "one sided enrollment"
+
+    enrollments += course_class.student_ammount
+
+  assert enrollments == sum(student.course_classes_ammount for student in repository.students.values()), "one sided enrollment"
+
+  if repository.student_columns is not None:
+    assert repository.student_columns.total_enrollments() == enrollments, "enrollment counts drifted"
+
+
+def run(threads: int, operations: int, io: float = 0.0) -> float:
+  repository = Repository()
+  teacher = Teacher('teacher', BIRTHDATE)
+  repository.add_teacher(teacher)
+  course_classes = [CourseClass(teacher) for _ in range(20)]
+  repository.add_course_classes(course_classes)
+
+  ids: list[int] = []
+  barrier = threading.Barrier(threads + 1)
+  workers = [
+    threading.Thread(target=worker, args=(repository, course_classes, operations, io, ids, barrier))
+    for _ in range(threads)
+  ]
+
+  for thread in workers:
+    thread.start()
+
+  barrier.wait()
+  start = perf_counter()
+
+  for thread in workers:
+    thread.join()
+
+  elapsed = perf_counter() - start
+  check(repository, ids)
+
+  return threads * operations / elapsed
+
+
+def main(operations: int) -> None:
+  print(f"{operations:,} operations per thread, consistency checked after every run")
+  print(f"{'threads':>8} {'ops/s':>12} {'ops/s with request io':>24}")
+
+  for threads in THREADS:
+    print(f"{threads:>8} {run(threads, operations):>12,.0f} {run(threads, operations, REQUEST_IO):>24,.0f}")
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else OPERATIONS)
@@ -0,0 +1,96 @@
+"""
+Leak check for the cascading deletes: cycles of creating a teacher with its
+course classes and students, enrolling them and deleting everything again,
+alternating the order of the deletes. The memory traced after each round of
+cycles has to stay flat and the repository has to end empty, otherwise some
+reverse reference kept a deleted entity alive. Exits with 1 when it didn't
+
+Run from the project root:
+    python -m bench.delete_leak [cycles]
+"""
+import gc
+import sys
+import tracemalloc
+from datetime import datetime
+
+from app import CourseClass, Repository, Student, Teacher
+
+CYCLES = 2_000
+ROUNDS = 10
+COURSE_CLASSES = 5
+STUDENTS = 20
+BIRTHDATE = datetime(2000, 1, 1)
+# growth allowed between the first and the last round, for the allocator
+# and interpreter caches, far less than what a leaked cycle would hold
+TOLERANCE = 64 * 1024
+
+
+def cycle(repository: Repository, order: int) -> None:
+  teacher = Teacher('Teacher', BIRTHDATE)
+  repository.add_teacher(teacher)
+
+  course_classes = [CourseClass(teacher) for _ in range(COURSE_CLASSES)]
+  repository.add_course_classes(course_classes)
+
+  students = [Student(f'Student {i}', BIRTHDATE) for i in range(STUDENTS)]
+  repository.add_students(students)
+  repository.add_students_to_course_classes(
+    (student, course_classes[(i + j) % COURSE_CLASSES]) for i, student in enumerate(students) for j in range(2)
+  )
+
+  # the teacher first cascades to the classes, the students go after. Or the
+  # other way around, the students leave the classes before they go
+  if order % 3 == 0:
+    repository.delete_teacher_by_id(teacher.id)
+  elif order % 3 == 1:
+    for course_class in course_classes:
+      repository.delete_course_class_by_id(course_class.id)
+
+  for student in students:
+    repository.delete_student_by_id(student.id)
+
+  repository.delete_teacher_by_id(teacher.id)
+
+
+def traced() -> int:
+  gc.collect()
+
+  return tracemalloc.get_traced_memory()[0]
+
+
+def main(cycles: int) -> int:
+  # the change log is bounded but holds up to twice its size, it's left out
+  repository = Repository(change_log_size=0)
+  per_round = max(cycles // ROUNDS, 1)
+
+  # the first round warms up the maps and caches, it isn't measured
+  for order in range(per_round):
+    cycle(repository, order)
+
+  tracemalloc.start()
+  samples = [traced()]
+
+  for _ in range(ROUNDS):
+    for order in range(per_round):
+      cycle(repository, order)
+
+    samples.append(traced())
+
+  tracemalloc.stop()
+
+  growth = samples[-1] - samples[0]
+  left = len(repository.students) + len(repository.teachers) + len(repository.course_classes)
+
+  print(f"{per_round * (ROUNDS + 1):,} cycles, traced memory per round (bytes):")
+  print("  " + " ".join(f"{sample:,}" for sample in samples))
+  print(f"growth {growth:+,} bytes, {left} entities left")
+
+  if growth > TOLERANCE or left:
+    print("memory isn't flat, deleted entities are still referenced")
+    return 1
+
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else CYCLES))
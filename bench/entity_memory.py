@@ -0,0 +1,70 @@
+"""
+Memory per entity, measured with tracemalloc, for the slotted models vs the
+previous __dict__ based ones
+
+Run from the project root:
+    python -m bench.entity_memory [count]
+"""
+import sys
+import tracemalloc
+from datetime import datetime
+
+from app import CourseClass, Student, Teacher
+
+COUNT = 100_000
+BIRTHDATE = datetime(2000, 1, 1)
+
+
+# the previous model layer, reduced to what it allocates per instance
+class LegacyHashMap:
+  def __init__(self):
+    self.__size = 0
+    self.__elements = {}
+
+
+class LegacyPerson:
+  def __init__(self, name: str, birthdate: datetime):
+    self._id = 0
+    self._created_at = datetime.now()
+    self._name = name
+    self._birthdate = birthdate
+    self.__course_classes = LegacyHashMap()
+
+
+class LegacyCourseClass:
+  def __init__(self, teacher):
+    self._id = 0
+    self._created_at = datetime.now()
+    self.__teacher = teacher
+    self.__students = LegacyHashMap()
+
+
+def bytes_per_entity(factory, count: int) -> float:
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  # birthdates are copied so every entity owns its own datetime, like parsed input
+  entities = [factory(i) for i in range(count)]
+  after = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+
+  # the list holding the entities isn't part of their footprint
+  return (after - before - sys.getsizeof(entities)) / count
+
+
+def main(count: int) -> None:
+  teacher = Teacher('teacher', BIRTHDATE)
+  legacy_teacher = LegacyPerson('teacher', BIRTHDATE)
+  cases = [
+    ("Student", lambda i: LegacyPerson(f'student {i}', BIRTHDATE.replace()), lambda i: Student(f'student {i}', BIRTHDATE.replace())),
+    ("Teacher", lambda i: LegacyPerson(f'teacher {i}', BIRTHDATE.replace()), lambda i: Teacher(f'teacher {i}', BIRTHDATE.replace())),
+    ("CourseClass", lambda i: LegacyCourseClass(legacy_teacher), lambda i: CourseClass(teacher)),
+  ]
+
+  print(f"{'entity':<12} {'before':>10} {'after':>10}   bytes per entity ({count:,} entities)")
+
+  for name, legacy, current in cases:
+    print(f"{name:<12} {bytes_per_entity(legacy, count):>10.1f} {bytes_per_entity(current, count):>10.1f}")
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else COUNT)
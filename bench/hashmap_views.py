@@ -0,0 +1,63 @@
+"""
+Microbenchmark: HashMap views vs the old copy-everything to_list()
+
+Run from the project root:
+    python -m bench.hashmap_views
+"""
+import sys
+from timeit import timeit
+
+from app import HashMap
+
+SIZES = [10_000, 100_000, 1_000_000]
+PAGE = 100
+
+
+# the previous to_list(), kept here as the baseline
+def legacy_to_list(elements: dict) -> list:
+  arr = []
+
+  for key in elements:
+    arr.append(elements[key])
+
+  return arr
+
+
+def best_of(stmt, number: int) -> float:
+  return min(timeit(stmt, number=number) for _ in range(3)) / number
+
+
+def run(size: int) -> dict[str, float]:
+  hash_map = HashMap[int, int]()
+
+  for key in range(size):
+    hash_map.add(key, key)
+
+  elements = dict(hash_map.items())
+  number = max(1, 1_000_000 // size)
+
+  def walk(iterable):
+    for _ in iterable:
+      pass
+
+  return {
+    "legacy to_list + walk": best_of(lambda: walk(legacy_to_list(elements)), number),
+    "values() walk": best_of(lambda: walk(hash_map.values()), number),
+    "legacy to_list + last page": best_of(lambda: legacy_to_list(elements)[-PAGE:], number),
+    "slice() last page": best_of(lambda: list(hash_map.slice(size - PAGE)), number),
+    "legacy to_list + first page": best_of(lambda: legacy_to_list(elements)[:PAGE], number),
+    "slice() first page": best_of(lambda: list(hash_map.slice(0, PAGE)), number),
+    "len()": best_of(lambda: len(hash_map), number * 1000),
+  }
+
+
+def main(sizes: list[int]) -> None:
+  for size in sizes:
+    print(f"\n{size:,} entries")
+
+    for name, seconds in run(size).items():
+      print(f"  {name:<30} {seconds * 1e3:>10.3f} ms")
+
+
+if __name__ == '__main__':
+  main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,92 @@
+"""
+Bytes on the wire and client decode time of the full GET /students and
+GET /course-classes listings in each representation: JSON rows and columns,
+MessagePack, each also compressed with gzip and brotli. Server time is
+measured on cache misses, through Flask's test client
+
+Run from the project root:
+    python -m bench.listing_formats [students]
+"""
+import gzip
+import json
+import sys
+from time import perf_counter
+
+import app
+from bench.synthetic import generate, seed
+
+try:
+  import msgpack
+except ImportError:
+  msgpack = None
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+STUDENTS = 20_000
+REPEAT = 5
+
+
+def representations() -> list[tuple[str, dict, dict]]:
+  cases = [("json", {}, {}), ("json columns", {"layout": "columns"}, {})]
+
+  if msgpack is not None:
+    cases += [
+      ("msgpack", {}, {"Accept": "application/msgpack"}),
+      ("msgpack columns", {"layout": "columns"}, {"Accept": "application/msgpack"})
+    ]
+
+  return cases
+
+
+def decoder(mimetype: str, encoding: str | None):
+  parse = msgpack.unpackb if mimetype == 'application/msgpack' else json.loads
+  decompress = {"gzip": gzip.decompress, "br": brotli.decompress if brotli is not None else None}.get(encoding)
+
+  return (lambda data: parse(decompress(data))) if decompress else parse
+
+
+def fastest(function) -> float:
+  best = float('inf')
+
+  for _ in range(REPEAT):
+    start = perf_counter()
+    function()
+    best = min(best, perf_counter() - start)
+
+  return best
+
+
+def main(students: int) -> None:
+  seed(app.repository, generate(students // 10, students // 10, students))
+  client = app.app.test_client()
+  encodings = ["identity", "gzip"] + (["br"] if brotli is not None else [])
+
+  if msgpack is None:
+    print("msgpack isn't installed, only the JSON representations are measured")
+
+  print(f"{'route':<16} {'representation':<16} {'encoding':<9} {'bytes':>11} {'server ms':>10} {'decode ms':>10}")
+
+  for route in ('/students', '/course-classes'):
+    for name, params, headers in representations():
+      for encoding in encodings:
+        def request(route=route, params=params, headers=headers, encoding=encoding):
+          return client.get(route, query_string=params, headers={**headers, "Accept-Encoding": encoding})
+
+        response = request()
+
+        # every request after a clear is a miss, encoded and compressed again
+        server = fastest(lambda: (app.response_cache.invalidate([route.strip('/').replace('-', '_')]), request()))
+        decode = decoder(response.mimetype, response.content_encoding)
+        client_time = fastest(lambda: decode(response.data))
+
+        print(
+          f"{route:<16} {name:<16} {encoding:<9} {len(response.data):>11,}"
+          f" {server * 1000:>10.1f} {client_time * 1000:>10.1f}"
+        )
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else STUDENTS)
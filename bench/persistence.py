@@ -0,0 +1,94 @@
+"""
+Write-ahead log benchmark: write throughput with group commit as threads are
+added, and cold start time (snapshot + log replay) for a large data set
+
+Run from the project root:
+    python -m bench.persistence [entities for the cold start]
+"""
+import shutil
+import sys
+import tempfile
+import threading
+from datetime import datetime
+from time import perf_counter
+
+from app import CourseClass, Repository, Student, Teacher, WriteAheadLog
+
+WRITES = 2_000
+THREADS = [1, 4, 16, 64]
+ENTITIES = 1_000_000
+BIRTHDATE = datetime(2005, 6, 15)
+
+
+def write_throughput(threads: int, sync: str) -> float:
+  directory = tempfile.mkdtemp()
+  repository = Repository(persistence=WriteAheadLog(directory, sync=sync, snapshot_every=10 ** 9))
+  per_thread = WRITES // threads
+
+  def worker():
+    for _ in range(per_thread):
+      repository.add_student(Student('student', BIRTHDATE))
+
+  workers = [threading.Thread(target=worker) for _ in range(threads)]
+  start = perf_counter()
+
+  for thread in workers:
+    thread.start()
+  for thread in workers:
+    thread.join()
+
+  elapsed = perf_counter() - start
+  shutil.rmtree(directory)
+
+  return per_thread * threads / elapsed
+
+
+def cold_start(entities: int) -> None:
+  directory = tempfile.mkdtemp()
+  persistence = WriteAheadLog(directory, sync='none', snapshot_every=10 ** 9)
+  repository = Repository(persistence=persistence)
+
+  teachers = [Teacher(f'teacher {i}', BIRTHDATE) for i in range(max(1, entities // 1000))]
+  repository.add_teachers(teachers)
+  course_classes = [CourseClass(teachers[i % len(teachers)]) for i in range(max(1, entities // 100))]
+  repository.add_course_classes(course_classes)
+  students = [Student(f'student {i}', BIRTHDATE) for i in range(entities)]
+  repository.add_students(students)
+  repository.add_students_to_course_classes(
+    (student, course_classes[i % len(course_classes)]) for i, student in enumerate(students)
+  )
+
+  start = perf_counter()
+  repository.snapshot()
+  print(f"snapshot of {entities:,} students: {perf_counter() - start:.2f} s")
+
+  del repository, students, course_classes, teachers
+  persistence.close()
+
+  start = perf_counter()
+  restored = Repository(persistence=WriteAheadLog(directory, snapshot_every=10 ** 9))
+  print(f"cold start from snapshot: {perf_counter() - start:.2f} s ({restored.students.size:,} students)")
+
+  for i in range(10_000):
+    restored.add_student(Student(f'late {i}', BIRTHDATE))
+
+  del restored
+
+  start = perf_counter()
+  Repository(persistence=WriteAheadLog(directory, snapshot_every=10 ** 9))
+  print(f"cold start from snapshot + 10,000 logged writes: {perf_counter() - start:.2f} s")
+
+  shutil.rmtree(directory)
+
+
+def main(entities: int) -> None:
+  print(f"{'threads':>8} {'group commit':>14} {'no fsync':>14}   writes/s")
+
+  for threads in THREADS:
+    print(f"{threads:>8} {write_throughput(threads, 'group'):>14,.0f} {write_throughput(threads, 'none'):>14,.0f}")
+
+  cold_start(entities)
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else ENTITIES)
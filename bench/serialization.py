@@ -0,0 +1,77 @@
+"""
+Serialization time of 100k row listings, the response body included, and of
+the same listings spliced from the cached fragments of each entity
+
+Run from the project root:
+    python -m bench.serialization [rows]
+"""
+import sys
+from datetime import datetime
+from time import perf_counter
+
+from flask.json.provider import DefaultJSONProvider
+
+import app
+from app import (
+  CourseClass, FastJSONProvider, Student, Teacher,
+  encode_course_class, encode_list, encode_student, encoded_response, serialize_course_class, serialize_student
+)
+
+ROWS = 100_000
+
+
+# the serializers before the formatted created_at, kept here as the baseline
+def legacy_student(student):
+  return {"id": student.id, "name": student.name, "created_at": student.created_at}
+
+
+def legacy_course_class(course_class):
+  teacher = course_class.teacher
+
+  return {
+    "id": course_class.id,
+    "teacher": {"id": teacher.id, "name": teacher.name, "created_at": teacher.created_at},
+    "created_at": course_class.created_at
+  }
+
+
+def timed(listing) -> float:
+  start = perf_counter()
+  listing()
+  return perf_counter() - start
+
+
+def main(rows: int) -> None:
+  teachers = [Teacher(f'teacher {i}', datetime(1970 + i % 30, 1, 1)) for i in range(max(1, rows // 100))]
+  students = [Student(f'student {i}', datetime(1990 + i % 20, 1 + i % 12, 1)) for i in range(rows)]
+  course_classes = [CourseClass(teachers[i % len(teachers)]) for i in range(rows)]
+  providers = {"default": DefaultJSONProvider(app.app), "fast": FastJSONProvider(app.app)}
+
+  print(f"{rows:,} rows, orjson {'on' if app.orjson is not None else 'off'}")
+
+  with app.app.app_context():
+    for label, provider in providers.items():
+      cases = {
+        "students (legacy dicts)": lambda: provider.response({"students": [legacy_student(s) for s in students]}),
+        "students": lambda: provider.response({"students": [serialize_student(s) for s in students]}),
+        "course classes (legacy dicts)": lambda: provider.response({"course_classes": [legacy_course_class(c) for c in course_classes]}),
+        "course classes": lambda: provider.response({"course_classes": [serialize_course_class(c) for c in course_classes]}),
+      }
+
+      for name, listing in cases.items():
+        # the first run formats and caches created_at, the second shows the steady state
+        first, second = timed(listing), timed(listing)
+        print(f"  {label:<8} {name:<30} {first * 1e3:>9.1f} ms  then {second * 1e3:>9.1f} ms")
+
+    cases = {
+      "students": lambda: encoded_response({"students": encode_list(encode_student, students)}),
+      "course classes": lambda: encoded_response({"course_classes": encode_list(encode_course_class, course_classes)}),
+    }
+
+    for name, listing in cases.items():
+      first, second = timed(listing), timed(listing)
+      print(f"  {'cached':<8} {name:<30} {first * 1e3:>9.1f} ms  then {second * 1e3:>9.1f} ms")
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS)
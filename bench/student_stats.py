@@ -0,0 +1,48 @@
+"""
+Timing of the /stats queries over the columnar student store
+
+Run from the project root:
+    python -m bench.student_stats [students]
+"""
+import sys
+from datetime import datetime
+from time import perf_counter
+
+import app
+from app import StudentColumns, Student
+
+COUNT = 1_000_000
+
+
+def timed(query) -> float:
+  start = perf_counter()
+  query()
+  return perf_counter() - start
+
+
+def main(count: int) -> None:
+  columns = StudentColumns()
+  students = []
+
+  for i in range(count):
+    student = Student(f'student {i}', datetime(1950 + i % 60, 1 + i % 12, 1 + i % 28))
+    columns.add(student)
+    students.append(student)
+
+  queries = {
+    "age histogram": lambda: columns.age_histogram(5),
+    "older than 40": lambda: columns.ids_by_age(older_than=40),
+    "younger than 18": lambda: columns.ids_by_age(younger_than=18),
+    "total enrollments": columns.total_enrollments,
+    # what the endpoints would cost walking the objects
+    "age histogram (objects)": lambda: [student.age // 5 for student in students],
+  }
+
+  print(f"{count:,} students, numpy {'on' if app.numpy is not None else 'off'}")
+
+  for name, query in queries.items():
+    print(f"  {name:<25} {timed(query) * 1e3:>10.1f} ms")
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else COUNT)
@@ -0,0 +1,392 @@
+"""
+Benchmark suite of the API: seeds a synthetic school (bench.synthetic) and
+drives every route of app.py, through Flask's test client and over HTTP with
+concurrent keep-alive connections, recording throughput, latency percentiles
+and memory. The results are written as JSON, compare two runs with
+bench.compare
+
+The storage comes from the same variables as the API, with SCHOOL_STORAGE=sqlite
+point SCHOOL_SQLITE_PATH to a scratch database, the school is written to it.
+
+Run from the project root:
+    python -m bench.suite [--students K] [--requests R] [--mode client|http|both] [--output FILE]
+    python -m bench.suite --help
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import tracemalloc
+import urllib.error
+import urllib.request
+from datetime import datetime
+from time import perf_counter
+from urllib.parse import quote
+
+from werkzeug.serving import make_server
+
+import app
+from bench import synthetic
+
+# (method, path, body, content type)
+Request = tuple[str, str, bytes | None, str | None]
+
+PORT = 5100
+SAMPLED_IDS = 1000
+
+
+def json_request(method: str, path: str, body=None) -> Request:
+  return (method, path, None if body is None else json.dumps(body).encode(), None if body is None else 'application/json')
+
+
+def sample_ids(school: synthetic.School, seed: int) -> dict[str, list[int]]:
+  generator = random.Random(seed)
+  ids = {
+    "teachers": [teacher.id for teacher in school.teachers],
+    "course_classes": [course_class.id for course_class in school.course_classes],
+    "students": [student.id for student in school.students],
+  }
+
+  return {key: generator.sample(values, min(SAMPLED_IDS, len(values))) for key, values in ids.items()}
+
+
+# Yields (route, requests) for every route. The requests of the routes that
+# delete are prepared with fetch(request) -> body right before they run, so
+# the school left for the next routes stays about the same size
+def plan(ids: dict[str, list[int]], count: int, fetch):
+  def create(request: Request) -> int:
+    return fetch(request)['id']
+
+  def cycle(values: list) -> list:
+    return [values[i % len(values)] for i in range(count)]
+
+  def person(kind: str, i: int) -> dict:
+    return {"name": f'Bench {kind} {i}', "birthdate": '2000-01-01'}
+
+  students, teachers, course_classes = ids['students'], ids['teachers'], ids['course_classes']
+
+  for collection, path in (('students', '/students'), ('teachers', '/teachers'), ('course_classes', '/course-classes')):
+    batch = ','.join(map(str, ids[collection][:100]))
+
+    yield f'GET {path}', [json_request('GET', path)] * count
+    yield f'GET {path}?limit=100', [json_request('GET', f'{path}?limit=100')] * count
+    yield f'GET {path}?ids=', [json_request('GET', f'{path}?ids={batch}')] * count
+    yield f'POST {path}:batchGet', [json_request('POST', f'{path}:batchGet', {"ids": ids[collection][:100]})] * count
+    yield f'GET {path}/<id>', [json_request('GET', f'{path}/{id}') for id in cycle(ids[collection])]
+
+    if collection != 'course_classes':
+      yield f'GET {path}?name=&min_age=', [json_request('GET', f'{path}?name={quote(name)}&min_age=10') for name in cycle(['Student 1', 'Teacher 2', 'S', 'T'])]
+
+  yield 'GET /students/<id>/course-classes', [json_request('GET', f'/students/{id}/course-classes') for id in cycle(students)]
+  yield 'GET /teachers/<id>/course-classes', [json_request('GET', f'/teachers/{id}/course-classes') for id in cycle(teachers)]
+  yield 'GET /teachers/<id>/students', [json_request('GET', f'/teachers/{id}/students') for id in cycle(teachers)]
+  yield 'GET /teachers/<id>/students/count', [json_request('GET', f'/teachers/{id}/students/count') for id in cycle(teachers)]
+  yield 'GET /course-classes/<id>/students', [json_request('GET', f'/course-classes/{id}/students') for id in cycle(course_classes)]
+
+  for path in ('/stats', '/stats/students/ages', '/stats/students/older-than/18', '/stats/students/younger-than/18', '/stats/course-classes/average-size', '/cache/stats', '/metrics', '/metrics/profiles'):
+    yield f'GET {path}', [json_request('GET', path)] * count
+
+  yield 'POST /students', [json_request('POST', '/students', person('student', i)) for i in range(count)]
+  yield 'PUT /students/<id>', [json_request('PUT', f'/students/{id}', person('student', i)) for i, id in enumerate(cycle(students))]
+  yield 'POST /teachers', [json_request('POST', '/teachers', person('teacher', i)) for i in range(count)]
+  yield 'PUT /teachers/<id>', [json_request('PUT', f'/teachers/{id}', person('teacher', i)) for i, id in enumerate(cycle(teachers))]
+  yield 'POST /course-classes', [json_request('POST', '/course-classes', {"teacher_id": id}) for id in cycle(teachers)]
+  yield 'PUT /course-classes/<id>', [json_request('PUT', f'/course-classes/{id}', {"teacher_id": teacher}) for id, teacher in zip(cycle(course_classes), cycle(teachers[1:] + teachers[:1]))]
+
+  new_students = [create(json_request('POST', '/students', person('enrolled', i))) for i in range(count)]
+  enrollments = list(zip(cycle(course_classes), new_students))
+
+  yield 'POST /course-classes/<id>/students/<id>', [json_request('POST', f'/course-classes/{c}/students/{s}') for c, s in enrollments]
+  yield 'DELETE /course-classes/<id>/students/<id>', [json_request('DELETE', f'/course-classes/{c}/students/{s}') for c, s in enrollments]
+
+  rosters = [new_students[i:i + 40] for i in range(0, len(new_students), 40)]
+
+  yield 'POST /course-classes/<id>/students (40 ids)', [json_request('POST', f'/course-classes/{c}/students', {"student_ids": ids}) for c, ids in zip(cycle(course_classes), cycle(rosters))]
+  yield 'PUT /course-classes/<id>/students (40 ids)', [json_request('PUT', f'/course-classes/{c}/students', {"student_ids": ids[::-1]}) for c, ids in zip(cycle(course_classes), cycle(rosters[1:] + rosters[:1]))]
+  yield 'DELETE /students/<id>', [json_request('DELETE', f'/students/{id}') for id in new_students]
+
+  new_teachers = [create(json_request('POST', '/teachers', person('deleted', i))) for i in range(count)]
+  new_course_classes = [create(json_request('POST', '/course-classes', {"teacher_id": id})) for id in cycle(teachers)]
+
+  yield 'DELETE /course-classes/<id>', [json_request('DELETE', f'/course-classes/{id}') for id in new_course_classes]
+  yield 'DELETE /teachers/<id>', [json_request('DELETE', f'/teachers/{id}') for id in new_teachers]
+
+  rows = [{"type": "student", "name": f'Bulk {i}', "birthdate": '2000-01-01'} for i in range(10)]
+  body = ''.join(json.dumps(row) + '\n' for row in rows).encode()
+
+  yield 'POST /bulk (10 rows)', [('POST', '/bulk', body, 'application/x-ndjson')] * count
+
+  # the last 100 changes, the writes above are in the feed
+  since = max(fetch(json_request('GET', '/changes'))['last_seq'] - 100, 0)
+
+  yield 'GET /changes', [json_request('GET', '/changes')] * count
+  yield 'GET /changes?since=', [json_request('GET', f'/changes?since={since}&limit=100')] * count
+
+
+class ClientDriver:
+  def __init__(self):
+    self.__client = app.app.test_client()
+
+  def call(self, request: Request) -> tuple[int, bytes]:
+    method, path, body, content_type = request
+    response = self.__client.open(path, method=method, data=body, content_type=content_type)
+
+    return response.status_code, response.get_data()
+
+  def run(self, requests: list[Request]) -> tuple[list[float], int, float]:
+    latencies, errors = [], 0
+    started = perf_counter()
+
+    for request in requests:
+      start = perf_counter()
+      status, _ = self.call(request)
+      latencies.append(perf_counter() - start)
+      errors += status >= 400
+
+    return latencies, errors, perf_counter() - started
+
+
+class HttpDriver:
+  def __init__(self, port: int, connections: int):
+    self.__port = port
+    self.__connections = connections
+
+  def call(self, request: Request) -> tuple[int, bytes]:
+    method, path, body, content_type = request
+    headers = {} if content_type is None else {'Content-Type': content_type}
+
+    try:
+      with urllib.request.urlopen(urllib.request.Request(f'http://127.0.0.1:{self.__port}{path}', body, headers, method=method)) as response:
+        return response.status, response.read()
+    except urllib.error.HTTPError as e:
+      return e.code, e.read()
+
+  def run(self, requests: list[Request]) -> tuple[list[float], int, float]:
+    return asyncio.run(self.__run(requests))
+
+  async def __run(self, requests: list[Request]) -> tuple[list[float], int, float]:
+    pending = iter([self.__encode(request) for request in requests])
+    latencies: list[float] = []
+    errors = [0]
+    started = perf_counter()
+
+    await asyncio.gather(*(self.__connection(pending, latencies, errors) for _ in range(min(self.__connections, len(requests)))))
+
+    return latencies, errors[0], perf_counter() - started
+
+  async def __connection(self, pending, latencies: list[float], errors: list[int]) -> None:
+    reader, writer = await asyncio.open_connection('127.0.0.1', self.__port)
+
+    try:
+      for request in pending:
+        start = perf_counter()
+        writer.write(request)
+        status = int((await reader.readline()).split()[1])
+        length, close = 0, False
+
+        while (line := await reader.readline()) not in (b'\r\n', b''):
+          name, _, value = line.decode('latin-1').partition(':')
+
+          if name.lower() == 'content-length':
+            length = int(value)
+          elif name.lower() == 'connection' and value.strip().lower() == 'close':
+            close = True
+
+        await reader.readexactly(length)
+        latencies.append(perf_counter() - start)
+        errors[0] += status >= 400
+
+        if close:
+          writer.close()
+          reader, writer = await asyncio.open_connection('127.0.0.1', self.__port)
+    finally:
+      writer.close()
+
+  def __encode(self, request: Request) -> bytes:
+    method, path, body, content_type = request
+    headers = f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Length: {len(body or b"")}\r\n'
+
+    if content_type is not None:
+      headers += f'Content-Type: {content_type}\r\n'
+
+    return (headers + '\r\n').encode() + (body or b'')
+
+
+def summary(latencies: list[float], errors: int, seconds: float) -> dict:
+  latencies = sorted(latencies)
+
+  def percentile(fraction: float) -> float:
+    return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1e3, 3)
+
+  return {
+    "requests": len(latencies),
+    "errors": errors,
+    "seconds": round(seconds, 4),
+    "throughput": round(len(latencies) / seconds, 1),
+    "p50_ms": percentile(0.50),
+    "p90_ms": percentile(0.90),
+    "p99_ms": percentile(0.99),
+    "max_ms": percentile(1),
+  }
+
+
+def rss_kb(pid: int | str = 'self') -> int | None:
+  try:
+    with open(f'/proc/{pid}/status') as status:
+      return next(int(line.split()[1]) for line in status if line.startswith('VmRSS:'))
+  except (OSError, StopIteration):
+    return None
+
+
+def git_revision() -> dict:
+  try:
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True, check=True).stdout.strip())
+  except (OSError, subprocess.CalledProcessError):
+    return {"commit": None, "dirty": None}
+
+  return {"commit": commit, "dirty": dirty}
+
+
+def school_args(args) -> list[str]:
+  return [
+    '--teachers', str(args.teachers), '--course-classes', str(args.course_classes), '--students', str(args.students),
+    '--enrollments', str(args.enrollments), '--distribution', args.distribution, '--seed', str(args.seed),
+  ]
+
+
+def generate(args) -> synthetic.School:
+  return synthetic.generate(args.teachers, args.course_classes, args.students, args.enrollments, args.distribution, args.seed)
+
+
+# the server of the http mode, it seeds its own school and writes its ids on
+# the first line of stdout once it is ready
+def serve(args) -> None:
+  school = generate(args)
+  synthetic.seed(app.repository, school)
+  server = make_server('127.0.0.1', args.serve, app.app, threaded=True)
+
+  print(json.dumps(sample_ids(school, args.seed)), flush=True)
+  server.serve_forever()
+
+
+def measure(label: str, driver, ids: dict[str, list[int]], count: int, results: dict) -> None:
+  def fetch(request: Request) -> dict:
+    status, body = driver.call(request)
+
+    if status >= 400:
+      raise RuntimeError(f'{request[0]} {request[1]} answered {status}: {body[:200]!r}')
+
+    return json.loads(body)
+
+  for route, requests in plan(ids, count, fetch):
+    result = results.setdefault(route, {})[label] = summary(*driver.run(requests))
+    print(
+      f"  {label:<6} {route:<48} {result['throughput']:>9.0f} req/s"
+      f"  p50 {result['p50_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms"
+      + (f"  errors {result['errors']}" if result['errors'] else '')
+    )
+
+
+def main(args) -> None:
+  results: dict[str, dict] = {}
+  memory: dict[str, dict] = {}
+
+  print(
+    f"{args.teachers:,} teachers, {args.course_classes:,} course classes, {args.students:,} students, "
+    f"{args.enrollments} enrollments each ({args.distribution}), {args.requests} requests per route"
+  )
+
+  if args.mode in ('client', 'both'):
+    tracemalloc.start()
+    school = generate(args)
+    synthetic.seed(app.repository, school)
+    seeded = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    memory['client'] = {"seeded_bytes": seeded, "rss_kb_seeded": rss_kb()}
+    measure('client', ClientDriver(), sample_ids(school, args.seed), args.requests, results)
+    memory['client']['rss_kb_end'] = rss_kb()
+
+  if args.mode in ('http', 'both'):
+    server = subprocess.Popen(
+      [sys.executable, '-m', 'bench.suite', '--serve', str(args.port), *school_args(args)],
+      stdout=subprocess.PIPE,
+      stderr=subprocess.PIPE,
+      text=True
+    )
+    # the server logs every request, its stderr is drained as it runs and the
+    # last lines kept to tell why it didn't start
+    errors = collections.deque(maxlen=50)
+    drain = threading.Thread(target=errors.extend, args=(server.stderr,), daemon=True)
+    drain.start()
+
+    try:
+      line = server.stdout.readline()
+
+      if not line:
+        server.wait()
+        drain.join(5)
+        raise RuntimeError(f"the benchmark server exited with {server.returncode}:\n{''.join(errors)}")
+
+      ids = json.loads(line)
+      memory['http'] = {"rss_kb_seeded": rss_kb(server.pid)}
+      measure('http', HttpDriver(args.port, args.connections), ids, args.requests, results)
+      memory['http']['rss_kb_end'] = rss_kb(server.pid)
+    finally:
+      server.terminate()
+      server.wait()
+
+  report = {
+    **git_revision(),
+    "date": datetime.now().isoformat(timespec='seconds'),
+    "python": platform.python_version(),
+    "platform": platform.platform(),
+    "orjson": app.orjson is not None,
+    "numpy": app.numpy is not None,
+    "storage": os.environ.get('SCHOOL_STORAGE', 'memory'),
+    "config": {key: value for key, value in vars(args).items() if key not in ('output', 'serve')},
+    "memory": memory,
+    "routes": results,
+  }
+  output = args.output or os.path.join('bench', 'results', f"{report['commit'] or 'unknown'}{'-dirty' if report['dirty'] else ''}.json")
+  os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+
+  with open(output, 'w') as file:
+    json.dump(report, file, indent=2)
+
+  print(f"memory: {json.dumps(memory)}")
+  print(f"results written to {output}")
+
+
+def parse_args(argv: list[str]):
+  parser = argparse.ArgumentParser(prog='python -m bench.suite', description='Benchmarks every route of the API')
+  parser.add_argument('--teachers', type=int, default=synthetic.TEACHERS)
+  parser.add_argument('--course-classes', type=int, default=synthetic.COURSE_CLASSES)
+  parser.add_argument('--students', type=int, default=synthetic.STUDENTS)
+  parser.add_argument('--enrollments', type=int, default=synthetic.ENROLLMENTS, help='course classes per student')
+  parser.add_argument('--distribution', choices=synthetic.DISTRIBUTIONS, default='uniform', help='of the students among the course classes')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--requests', type=int, default=200, help='per route')
+  parser.add_argument('--connections', type=int, default=32, help='concurrent connections of the http mode')
+  parser.add_argument('--mode', choices=('client', 'http', 'both'), default='both')
+  parser.add_argument('--port', type=int, default=PORT)
+  parser.add_argument('--output', help='defaults to bench/results/<commit>.json')
+  parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+
+  return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+  arguments = parse_args(sys.argv[1:])
+
+  if arguments.serve is not None:
+    serve(arguments)
+  else:
+    main(arguments)
@@ -0,0 +1,104 @@
+"""
+Synthetic schools for the benchmarks: teachers, their course classes and the
+students enrolled in them. The same arguments and seed give the same school,
+ids included when generated in a fresh process
+
+Run from the project root to write a school as NDJSON for POST /bulk or
+flask bulk-import:
+    python -m bench.synthetic [teachers] [course classes] [students] > school.ndjson
+"""
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from app import CourseClass, Student, Teacher
+
+TEACHERS = 100
+COURSE_CLASSES = 1_000
+STUDENTS = 10_000
+ENROLLMENTS = 3
+DISTRIBUTIONS = ('uniform', 'skewed')
+
+
+class School(NamedTuple):
+  teachers: list[Teacher]
+  course_classes: list[CourseClass]
+  students: list[Student]
+  enrollments: list[tuple[Student, CourseClass]]
+
+
+def birthdate(generator: random.Random, oldest: int, youngest: int) -> datetime:
+  today = datetime.combine(datetime.today(), datetime.min.time())
+
+  return today - timedelta(days=generator.randint(youngest * 365, oldest * 365))
+
+
+# each student takes up to `enrollments` distinct course classes, picked
+# uniformly or, when skewed, with the n-th class n times less likely than
+# the first, like a few popular classes and a long tail
+def generate(
+  teachers: int = TEACHERS,
+  course_classes: int = COURSE_CLASSES,
+  students: int = STUDENTS,
+  enrollments: int = ENROLLMENTS,
+  distribution: str = 'uniform',
+  seed: int = 0
+) -> School:
+  if distribution not in DISTRIBUTIONS:
+    raise ValueError(f'distribution must be one of {DISTRIBUTIONS}')
+
+  generator = random.Random(seed)
+  school = School(
+    [Teacher(f'Teacher {i}', birthdate(generator, 70, 25)) for i in range(teachers)],
+    [],
+    [Student(f'Student {i}', birthdate(generator, 30, 6)) for i in range(students)],
+    []
+  )
+  school.course_classes.extend(CourseClass(generator.choice(school.teachers)) for _ in range(course_classes))
+
+  weights = [1 / (rank + 1) for rank in range(course_classes)] if distribution == 'skewed' else None
+  per_student = min(enrollments, course_classes)
+
+  for student in school.students:
+    taken = set()
+
+    while len(taken) < per_student:
+      course_class = generator.choices(school.course_classes, weights)[0] if weights else generator.choice(school.course_classes)
+
+      if course_class.id not in taken:
+        taken.add(course_class.id)
+        school.enrollments.append((student, course_class))
+
+  return school
+
+
+def seed(repository, school: School) -> None:
+  repository.add_teachers(school.teachers)
+  repository.add_course_classes(school.course_classes)
+  repository.add_students(school.students)
+  repository.add_students_to_course_classes(school.enrollments)
+
+
+def rows(school: School):
+  for teacher in school.teachers:
+    yield {"type": "teacher", "ref": f't{teacher.id}', "name": teacher.name, "birthdate": teacher.birthdate.strftime('%Y-%m-%d')}
+
+  for course_class in school.course_classes:
+    yield {"type": "course_class", "ref": f'c{course_class.id}', "teacher_ref": f't{course_class.teacher.id}'}
+
+  for student in school.students:
+    yield {"type": "student", "ref": f's{student.id}', "name": student.name, "birthdate": student.birthdate.strftime('%Y-%m-%d')}
+
+  for student, course_class in school.enrollments:
+    yield {"type": "enrollment", "student_ref": f's{student.id}', "course_class_ref": f'c{course_class.id}'}
+
+
+def main(teachers: int, course_classes: int, students: int) -> None:
+  for row in rows(generate(teachers, course_classes, students)):
+    sys.stdout.write(json.dumps(row) + '\n')
+
+
+if __name__ == '__main__':
+  main(*(int(arg) for arg in sys.argv[1:4]), *(TEACHERS, COURSE_CLASSES, STUDENTS)[len(sys.argv[1:4]):])
@@ -0,0 +1,74 @@
+"""
+Parse and validation cost of a POST/PUT student or teacher body: the previous
+ad-hoc checks with strptime against PERSON_SCHEMA with the fromisoformat
+fast path, from the raw body to the validated values
+
+Run from the project root:
+    python -m bench.validation [bodies]
+"""
+import json
+import random
+import sys
+from datetime import datetime
+from time import perf_counter
+
+from app import PERSON_SCHEMA
+
+COUNT = 100_000
+REPEAT = 5
+
+
+def legacy(body: bytes):
+  data = json.loads(body)
+  name = data.get('name')
+  birthdate = datetime.strptime(data.get('birthdate'), '%Y-%m-%d')
+
+  if not name or not birthdate:
+    raise ValueError('Missing required fields')
+
+  return name, birthdate
+
+
+def schema(body: bytes):
+  return PERSON_SCHEMA.validate(json.loads(body))
+
+
+def bodies(count: int) -> list[bytes]:
+  generator = random.Random(0)
+
+  return [
+    json.dumps({"name": f"Student {i}", "birthdate": f"{generator.randint(1950, 2020)}-{generator.randint(1, 12):02}-{generator.randint(1, 28):02}"}).encode()
+    for i in range(count)
+  ]
+
+
+def fastest(validate, data: list[bytes]) -> float:
+  best = float('inf')
+
+  for _ in range(REPEAT):
+    start = perf_counter()
+
+    for body in data:
+      validate(body)
+
+    best = min(best, perf_counter() - start)
+
+  return best
+
+
+def main(count: int) -> None:
+  data = bodies(count)
+  # same values out of both, the bench compares like for like
+  assert all(legacy(body)[1] == schema(body)['birthdate'] for body in data[:1000])
+
+  before = fastest(legacy, data)
+  after = fastest(schema, data)
+
+  print(f"{'':<24} {'µs per body':>12}")
+  print(f"{'strptime, ad-hoc':<24} {before / count * 1e6:>12.2f}")
+  print(f"{'PERSON_SCHEMA':<24} {after / count * 1e6:>12.2f}")
+  print(f"{before / after:.1f}x faster ({count:,} bodies)")
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else COUNT)
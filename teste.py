@@ -1,6 +1,15 @@
+from datetime import date, timedelta
+import json
 import requests
 import unittest
 
+# Mesmo dia, anos antes; 28 de fevereiro quando o ano não tem 29
+def years_before(day, years):
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
 class TestSchoolMethods(unittest.TestCase):
 
     BASE_URL = 'http://localhost:5000'
@@ -265,5 +274,372 @@ class TestSchoolMethods(unittest.TestCase):
 
         print(f"Turma \033[32m{self.course_class_id}\033[0m atualizada com o novo teacher_id \033[32m{updated_data['teacher_id']}\033[0m com sucesso!")
 
+    # Teste GET paginado por cursor
+    def test_017_get_students_paginated(self):
+        response = requests.get(f'{self.BASE_URL}/students', params={'limit': 1})
+        self.assertEqual(response.status_code, 200)
+
+        response_json = response.json()
+        self.assertEqual(len(response_json['students']), 1)
+        self.assertIsNotNone(response_json['next_cursor'])
+
+        response_next = requests.get(
+            f'{self.BASE_URL}/students',
+            params={'limit': 1, 'after': response_json['next_cursor']}
+        )
+        self.assertEqual(response_next.status_code, 200)
+
+        next_students = response_next.json()['students']
+        if next_students:
+            self.assertGreater(next_students[0]['id'], response_json['students'][0]['id'])
+        print(f"Paginação de alunos funcionando! \033[32m{response.status_code}\033[0m")
+
+    # Teste GET em modo streaming (NDJSON)
+    def test_018_stream_students(self):
+        response = requests.get(f'{self.BASE_URL}/students', params={'stream': 1}, stream=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'application/x-ndjson')
+
+        ids = [json.loads(line)['id'] for line in response.iter_lines() if line]
+        self.assertIn(self.student_id, ids)
+        print(f"Streaming de alunos funcionando! \033[32m{len(ids)} linhas\033[0m")
+
+    # Teste GET das turmas de um aluno
+    def test_019_get_student_course_classes(self):
+        requests.post(f'{self.BASE_URL}/course-classes/{self.course_class_id}/students/{self.student_id}')
+
+        response = requests.get(f'{self.BASE_URL}/students/{self.student_id}/course-classes')
+        self.assertEqual(response.status_code, 200)
+
+        response_json = response.json()
+        self.assertEqual(response_json['student']['name'], 'Jane Smith')
+        self.assertIn(self.course_class_id, [course_class['id'] for course_class in response_json['course_classes']])
+        print(f"Turmas do aluno encontradas com sucesso! \033[32m{response.status_code}\033[0m")
+
+    # Teste GET das estatísticas
+    def test_020_get_stats(self):
+        response = requests.get(f'{self.BASE_URL}/stats')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.json()['students'], 0)
+
+        response_ages = requests.get(f'{self.BASE_URL}/stats/students/older-than/18')
+        self.assertEqual(response_ages.status_code, 200)
+        self.assertIn(self.student_id, response_ages.json()['ids'])
+
+        # bucket inválido retorna 400
+        for bucket in ('abc', '0', '1.5'):
+            response_bucket = requests.get(f'{self.BASE_URL}/stats/students/ages', params={'bucket': bucket})
+            self.assertEqual(response_bucket.status_code, 400)
+        print(f"Estatísticas calculadas com sucesso! \033[32m{response.status_code}\033[0m")
+
+    # Teste GET dos alunos de um professor
+    def test_021_get_teacher_students(self):
+        requests.post(f'{self.BASE_URL}/course-classes/{self.course_class_id}/students/{self.student_id}')
+
+        response = requests.get(f'{self.BASE_URL}/teachers/{self.teacher_id}/students')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([student['id'] for student in response.json()['students']], [self.student_id])
+
+        response_count = requests.get(f'{self.BASE_URL}/teachers/{self.teacher_id}/students/count')
+        self.assertEqual(response_count.status_code, 200)
+        self.assertEqual(response_count.json()['count'], 1)
+        print(f"Alunos do professor encontrados com sucesso! \033[32m{response.status_code}\033[0m")
+
+    # Teste POST de importação em lote
+    def test_022_bulk_import(self):
+        rows = [
+            {'type': 'student', 'ref': 'aluno', 'name': 'Bulk Student', 'birthdate': '2001-01-01'},
+            {'type': 'enrollment', 'student_ref': 'aluno', 'course_class_id': self.course_class_id},
+            {'type': 'student', 'name': 'Sem data'},
+        ]
+        response = requests.post(
+            f'{self.BASE_URL}/bulk',
+            data='\n'.join(json.dumps(row) for row in rows),
+            headers={'Content-Type': 'application/x-ndjson'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response_json = response.json()
+        self.assertEqual(response_json['created']['students'], 1)
+        self.assertEqual(response_json['created']['enrollments'], 1)
+        self.assertEqual([error['line'] for error in response_json['errors']], [3])
+
+        response_check = requests.get(f'{self.BASE_URL}/course-classes/{self.course_class_id}/students')
+        self.assertIn(response_json['refs']['aluno'], [student['id'] for student in response_check.json()['students']])
+
+        # Matrícula que já existe não conta como criada
+        response_again = requests.post(
+            f'{self.BASE_URL}/bulk',
+            data=json.dumps({'type': 'enrollment', 'student_id': response_json['refs']['aluno'], 'course_class_id': self.course_class_id}),
+            headers={'Content-Type': 'application/x-ndjson'}
+        )
+        self.assertEqual(response_again.json()['created']['enrollments'], 0)
+        print(f"Importação em lote concluída! \033[32m{response_json['created']}\033[0m")
+
+    # Teste GET de vários alunos por id
+    def test_023_batch_get_students(self):
+        response = requests.get(f'{self.BASE_URL}/students', params={'ids': f'{self.student_id},999999'})
+        self.assertEqual(response.status_code, 200)
+
+        response_json = response.json()
+        self.assertEqual([student['id'] for student in response_json['students']], [self.student_id])
+        self.assertEqual(response_json['missing'], [999999])
+
+        response_post = requests.post(f'{self.BASE_URL}/students:batchGet', json={'ids': [self.student_id]})
+        self.assertEqual(response_post.status_code, 200)
+        self.assertEqual(response_post.json()['students'][0]['id'], self.student_id)
+
+        # No corpo, só lista de inteiros; texto separado por vírgula é só para a query
+        for ids in (f'{self.student_id}', [True], [1.5], [str(self.student_id)]):
+            response_invalid = requests.post(f'{self.BASE_URL}/students:batchGet', json={'ids': ids})
+            self.assertEqual(response_invalid.status_code, 400)
+
+        response_roster = requests.post(f'{self.BASE_URL}/course-classes/{self.course_class_id}/students', json={'student_ids': f'{self.student_id}'})
+        self.assertEqual(response_roster.status_code, 400)
+        self.assertEqual(requests.get(f'{self.BASE_URL}/students', params={'ids': 'abc'}).status_code, 400)
+        print(f"Busca em lote de alunos funcionando! \033[32m{response.status_code}\033[0m")
+
+    # Teste GET condicional com ETag
+    def test_024_conditional_get(self):
+        url = f'{self.BASE_URL}/course-classes/{self.course_class_id}/students'
+        response = requests.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response.headers)
+        self.assertIn('Last-Modified', response.headers)
+
+        response_cached = requests.get(url, headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response_cached.status_code, 304)
+
+        requests.post(f'{self.BASE_URL}/course-classes/{self.course_class_id}/students/{self.student_id}')
+        requests.delete(f'{self.BASE_URL}/course-classes/{self.course_class_id}/students/{self.student_id}')
+
+        response_changed = requests.get(url, headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response_changed.status_code, 200)
+        print(f"GET condicional funcionando! \033[32m{response_cached.status_code}\033[0m")
+
+    # Teste do cache de respostas
+    def test_025_response_cache(self):
+        url = f'{self.BASE_URL}/teachers/{self.teacher_id}/course-classes'
+        requests.get(url)
+        hits = requests.get(f'{self.BASE_URL}/cache/stats').json()['hits']
+
+        response = requests.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        response_stats = requests.get(f'{self.BASE_URL}/cache/stats')
+        self.assertEqual(response_stats.status_code, 200)
+        self.assertEqual(response_stats.json()['hits'], hits + 1)
+        print(f"Cache de respostas funcionando! \033[32m{response_stats.json()}\033[0m")
+
+    # Teste GET de alunos com filtros
+    def test_026_search_students(self):
+        response = requests.get(f'{self.BASE_URL}/students', params={'name': 'jane', 'min_age': 18})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.student_id, [student['id'] for student in response.json()['students']])
+
+        response_young = requests.get(f'{self.BASE_URL}/students', params={'name': 'jane', 'max_age': 10})
+        self.assertNotIn(self.student_id, [student['id'] for student in response_young.json()['students']])
+
+        response_invalid = requests.get(f'{self.BASE_URL}/students', params={'min_age': 'abc'})
+        self.assertEqual(response_invalid.status_code, 400)
+
+        # Nomes acentuados são encontrados sem diferenciar maiúsculas, nos dois armazenamentos
+        accented_id = requests.post(f'{self.BASE_URL}/students', json={'name': 'ÉLIO Zéca', 'birthdate': '2001-04-10'}).json()['id']
+        response_accented = requests.get(f'{self.BASE_URL}/students', params={'name': 'élio zé'})
+        self.assertIn(accented_id, [student['id'] for student in response_accented.json()['students']])
+        print(f"Busca de alunos com filtros funcionando! \033[32m{response.status_code}\033[0m")
+
+    # Teste das métricas
+    def test_027_metrics(self):
+        requests.get(f'{self.BASE_URL}/students/999999')
+
+        response = requests.get(f'{self.BASE_URL}/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['Content-Type'].startswith('text/plain'))
+        self.assertIn('school_requests_total{method="GET",route="/students/<int:id>",status="404"}', response.text)
+        self.assertIn('school_request_duration_seconds_bucket', response.text)
+        self.assertIn('school_span_duration_seconds_count{kind="controller"', response.text)
+
+        response_profiles = requests.get(f'{self.BASE_URL}/metrics/profiles')
+        self.assertEqual(response_profiles.status_code, 200)
+        self.assertIn('profiles', response_profiles.json())
+        print(f"Métricas funcionando! \033[32m{response.status_code}\033[0m")
+
+    # Teste de matrícula em lote e substituição da lista de alunos
+    def test_028_enroll_students(self):
+        other_student_id = requests.post(
+            f'{self.BASE_URL}/students',
+            json={'name': 'Joe Smith', 'birthdate': '2001-04-21'}
+        ).json()['id']
+        url = f'{self.BASE_URL}/course-classes/{self.course_class_id}/students'
+
+        response = requests.post(url, json={'student_ids': [self.student_id, 999999]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'added': [self.student_id], 'present': [], 'missing': [999999]})
+
+        response_replace = requests.put(url, json={'student_ids': [other_student_id, self.student_id]})
+        self.assertEqual(response_replace.status_code, 200)
+        self.assertEqual(response_replace.json(), {'added': [other_student_id], 'present': [self.student_id], 'missing': [], 'removed': []})
+
+        response_empty = requests.put(url, json={'student_ids': []})
+        self.assertEqual(sorted(response_empty.json()['removed']), sorted([self.student_id, other_student_id]))
+        self.assertEqual(requests.get(url).json()['students'], [])
+
+        response_missing = requests.post(f'{self.BASE_URL}/course-classes/999999/students', json={'student_ids': [self.student_id]})
+        self.assertEqual(response_missing.status_code, 404)
+        print(f"Matrícula em lote funcionando! \033[32m{response_replace.json()}\033[0m")
+
+    def test_029_cascading_deletes(self):
+        # Turma apagada sai da lista de turmas do aluno
+        other_course_class_id = requests.post(
+            f'{self.BASE_URL}/course-classes',
+            json={'teacher_id': self.teacher_id}
+        ).json()['id']
+        requests.post(f'{self.BASE_URL}/course-classes/{self.course_class_id}/students', json={'student_ids': [self.student_id]})
+        requests.post(f'{self.BASE_URL}/course-classes/{other_course_class_id}/students', json={'student_ids': [self.student_id]})
+
+        requests.delete(f'{self.BASE_URL}/course-classes/{other_course_class_id}')
+        response = requests.get(f'{self.BASE_URL}/students/{self.student_id}/course-classes')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([course_class['id'] for course_class in response.json()['course_classes']], [self.course_class_id])
+
+        # Professor apagado leva as suas turmas junto
+        response_delete = requests.delete(f'{self.BASE_URL}/teachers/{self.teacher_id}')
+        self.assertEqual(response_delete.status_code, 200)
+        self.assertEqual(requests.get(f'{self.BASE_URL}/course-classes/{self.course_class_id}').status_code, 404)
+        self.assertEqual(requests.get(f'{self.BASE_URL}/students/{self.student_id}/course-classes').json()['course_classes'], [])
+        print(f"Exclusões em cascata funcionando! Turmas do aluno: \033[32m{response.json()['course_classes']}\033[0m")
+
+    def test_030_listing_formats(self):
+        url = f'{self.BASE_URL}/students'
+        response_plain = requests.get(url, headers={'Accept-Encoding': 'identity'})
+        students = response_plain.json()['students']
+
+        # Layout em colunas: uma lista por campo
+        response_columns = requests.get(url, params={'layout': 'columns'})
+        self.assertEqual(response_columns.status_code, 200)
+        columns = response_columns.json()['students']
+        self.assertEqual(columns['ids'], [student['id'] for student in students])
+        self.assertEqual(columns['names'], [student['name'] for student in students])
+        self.assertEqual(requests.get(url, params={'layout': 'diagonal'}).status_code, 400)
+
+        # Listagem grande vem comprimida com gzip, com o mesmo conteúdo
+        response_gzip = requests.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertIn('Accept-Encoding', response_gzip.headers['Vary'])
+
+        if len(response_plain.content) >= 1024:
+            self.assertEqual(response_gzip.headers['Content-Encoding'], 'gzip')
+
+        self.assertEqual(response_gzip.json()['students'], students)
+        self.assertNotEqual(response_gzip.headers['ETag'], response_plain.headers['ETag'])
+        print(f"Formatos de listagem funcionando! \033[32m{response_gzip.headers.get('Content-Encoding')}\033[0m")
+
+    def test_031_changes(self):
+        # Sem since, o feed começa agora
+        response_start = requests.get(f'{self.BASE_URL}/changes')
+        self.assertEqual(response_start.status_code, 200)
+        since = response_start.json()['last_seq']
+
+        requests.put(
+            f'{self.BASE_URL}/students/{self.student_id}',
+            json={'name': 'Jane Doe', 'birthdate': '2000-03-20'}
+        )
+        requests.delete(f'{self.BASE_URL}/course-classes/{self.course_class_id}')
+
+        response = requests.get(f'{self.BASE_URL}/changes', params={'since': since})
+        self.assertEqual(response.status_code, 200)
+        changes = [(change['op'], change['type'], change['id']) for change in response.json()['changes']]
+        self.assertEqual(changes, [('update', 'student', self.student_id), ('delete', 'course_class', self.course_class_id)])
+        self.assertEqual(response.json()['changes'][0]['name'], 'Jane Doe')
+
+        # Long poll sem alterações volta vazio depois do tempo de espera
+        last_seq = response.json()['last_seq']
+        response_wait = requests.get(f'{self.BASE_URL}/changes', params={'since': last_seq, 'wait': 0.2})
+        self.assertEqual(response_wait.json()['changes'], [])
+
+        response_stale = requests.get(f'{self.BASE_URL}/changes', params={'since': 0, 'epoch': 'outra'})
+        self.assertEqual(response_stale.status_code, 410)
+        print(f"Feed de alterações funcionando! \033[32m{changes}\033[0m")
+
+    def test_032_validation(self):
+        # Corpo inválido sempre retorna 400, antes de procurar o registro
+        response_missing = requests.put(f'{self.BASE_URL}/teachers/{self.teacher_id}', json={'name': 'John Doe'})
+        self.assertEqual(response_missing.status_code, 400)
+        self.assertIn('birthdate', response_missing.text)
+
+        response_date = requests.post(f'{self.BASE_URL}/students', json={'name': 'Jane Smith', 'birthdate': '2000-02-30'})
+        self.assertEqual(response_date.status_code, 400)
+
+        response_not_json = requests.post(f'{self.BASE_URL}/teachers', data='name=John')
+        self.assertEqual(response_not_json.status_code, 400)
+
+        response_teacher_id = requests.post(f'{self.BASE_URL}/course-classes', json={'teacher_id': str(self.teacher_id)})
+        self.assertEqual(response_teacher_id.status_code, 400)
+
+        # O registro não foi alterado
+        self.assertEqual(requests.get(f'{self.BASE_URL}/teachers/{self.teacher_id}').json()['name'], 'John Doe')
+        print(f"Validação das requisições funcionando! \033[32m{response_missing.status_code}\033[0m")
+
+    def test_033_calendar_age(self):
+        # A idade só aumenta no aniversário, não a cada 365 dias
+        birthday_today = years_before(date.today(), 20)
+        birthday_tomorrow = birthday_today + timedelta(days=1)
+        student_ids = [
+            requests.post(f'{self.BASE_URL}/students', json={'name': 'Jane Smith', 'birthdate': birthdate.isoformat()}).json()['id']
+            for birthdate in (birthday_today, birthday_tomorrow)
+        ]
+        requests.post(f'{self.BASE_URL}/course-classes/{self.course_class_id}/students', json={'student_ids': student_ids})
+
+        response = requests.get(f'{self.BASE_URL}/teachers/{self.teacher_id}/students')
+        self.assertEqual(response.status_code, 200)
+        ages = {student['id']: student['age'] for student in response.json()['students']}
+        self.assertEqual([ages[id] for id in student_ids], [20, 19])
+
+        response_student = requests.get(f'{self.BASE_URL}/students/{student_ids[1]}/course-classes')
+        self.assertEqual(response_student.json()['student']['age'], 19)
+        print(f"Idade pelo calendário funcionando! Idades: \033[32m{[ages[id] for id in student_ids]}\033[0m")
+
+    def test_034_future_birthdate(self):
+        # Aluno com data de nascimento no futuro não entra nas estatísticas de idade
+        birthdate = date.today() + timedelta(days=400)
+        student_id = requests.post(f'{self.BASE_URL}/students', json={'name': 'Jane Smith', 'birthdate': birthdate.isoformat()}).json()['id']
+
+        response = requests.get(f'{self.BASE_URL}/stats/students/ages')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(bucket['from'] >= 0 for bucket in response.json()['ages']))
+
+        response_younger = requests.get(f'{self.BASE_URL}/stats/students/younger-than/200')
+        self.assertEqual(response_younger.status_code, 200)
+        self.assertNotIn(student_id, response_younger.json()['ids'])
+        self.assertEqual(requests.get(f'{self.BASE_URL}/stats').status_code, 200)
+        print(f"Data de nascimento no futuro ignorada! \033[32m{response.status_code}\033[0m")
+
+    def test_035_cascade_changes(self):
+        # Exclusão em cascata lista as matrículas removidas no feed, nos dois armazenamentos
+        other_course_class_id = requests.post(f'{self.BASE_URL}/course-classes', json={'teacher_id': self.teacher_id}).json()['id']
+        other_student_id = requests.post(f'{self.BASE_URL}/students', json={'name': 'Ana Souza', 'birthdate': '2001-04-10'}).json()['id']
+        course_class_ids = [self.course_class_id, other_course_class_id]
+
+        for course_class_id in course_class_ids:
+            requests.post(f'{self.BASE_URL}/course-classes/{course_class_id}/students', json={'student_ids': [self.student_id, other_student_id]})
+
+        def changes_of(delete):
+            since = requests.get(f'{self.BASE_URL}/changes').json()['last_seq']
+            requests.delete(f'{self.BASE_URL}/{delete}')
+            changes = requests.get(f'{self.BASE_URL}/changes', params={'since': since}).json()['changes']
+            return [(change['op'], change['type'], change.get('id'), change.get('student_id'), change.get('course_class_id')) for change in changes]
+
+        changes = changes_of(f'students/{self.student_id}')
+        self.assertEqual(changes[-1], ('delete', 'student', self.student_id, None, None))
+        self.assertEqual(sorted(changes[:-1]), [('delete', 'enrollment', None, self.student_id, id) for id in course_class_ids])
+
+        changes = changes_of(f'teachers/{self.teacher_id}')
+        self.assertEqual(changes[-1], ('delete', 'teacher', self.teacher_id, None, None))
+        self.assertEqual(sorted(changes[:-1]), sorted(
+            [('delete', 'course_class', id, None, None) for id in course_class_ids] +
+            [('delete', 'enrollment', None, other_student_id, id) for id in course_class_ids]
+        ))
+        print(f"Feed das exclusões em cascata funcionando! \033[32m{len(changes)} alterações\033[0m")
+
 if __name__ == '__main__':
     unittest.main()